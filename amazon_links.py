@@ -0,0 +1,225 @@
+import re
+import time
+import logging
+import threading
+import urllib.parse
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from config import Config
+from log_setup import log_event
+from metrics import STAGE_SECONDS, record_result
+from persistent_memo import PersistentMemo
+from singleflight import AsyncSingleFlight, SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Every Amazon link form we accept, compiled once: product pages on any Amazon
+# storefront (with or without a slug, www./m./smile. hosts) and the amzn.to,
+# amzn.in, amzn.eu, amzn.asia and a.co short links. Closing brackets, quotes
+# and sentence punctuation right after a link are not part of the match
+AMAZON_LINK_PATTERN = re.compile(
+    r'https?://(?:'
+    r'(?P<short_host>(?i:amzn\.(?:to|in|eu|asia)|a\.co))/(?P<short_path>[A-Za-z0-9/_-]+)'
+    r'|'
+    r'(?P<host>(?i:(?:[a-z0-9-]+\.)?amazon\.[a-z]{2,3}(?:\.[a-z]{2})?))'
+    r'/(?:[^/\s?#]+/){0,3}?(?:dp|gp/product|gp/aw/d|exec/obidos/ASIN|o/ASIN)/(?P<asin>[A-Z0-9]{10})'
+    # The rest of the URL, without the punctuation a link is usually followed by in a sentence
+    r')(?:[^\s]*[^\s.,;:!?)\]\'"])?'
+)
+
+# Cheap test for "this text probably has an Amazon link", used by intake to prioritise
+AMAZON_HINT = re.compile(r'amazon\.|amzn\.|a\.co/', re.IGNORECASE)
+
+_AMAZON_HOST = re.compile(r'^(?:[a-z0-9-]+\.)?amazon\.[a-z]{2,3}(?:\.[a-z]{2})?$')
+_SHORT_HOST = re.compile(r'^(?:amzn\.(?:to|in|eu|asia)|a\.co)$')
+
+
+class AmazonLink(NamedTuple):
+    url: str
+    asin: Optional[str]
+    short: bool
+
+
+def find_links(text: str) -> List[AmazonLink]:
+    """Every Amazon product or short link in the text, in order"""
+    return [
+        AmazonLink(match.group(0), match.group('asin'), match.group('short_host') is not None)
+        for match in AMAZON_LINK_PATTERN.finditer(text)
+    ]
+
+
+def is_short_link(url: str) -> bool:
+    match = AMAZON_LINK_PATTERN.match(url)
+    return bool(match and match.group('short_host'))
+
+
+def clean_product_url(url: str) -> Optional[str]:
+    """``https://<host>/dp/<ASIN>`` for a product link, None for anything else (short links included)"""
+    match = AMAZON_LINK_PATTERN.match(url)
+    if not match or not match.group('asin'):
+        return None
+    return f"https://{match.group('host')}/dp/{match.group('asin')}"
+
+
+def _allowed_hop(url: str) -> bool:
+    # Redirects are only followed within Amazon, a short link never sends us elsewhere
+    host = (urllib.parse.urlparse(url).hostname or '').lower()
+    return bool(_AMAZON_HOST.match(host) or _SHORT_HOST.match(host))
+
+
+class ShortLinkResolver:
+    """Resolve amzn.to / a.co short links to clean product URLs.
+
+    Redirects are followed one hop at a time with HEAD requests, falling back
+    to a GET whose body is never read, and stop at the first Location that is
+    a product link, so the product page itself is not downloaded here.
+    Resolutions never change, so they are kept in a persistent memo, and
+    concurrent requests for the same short link share one lookup.
+    """
+
+    def __init__(self, memo: Optional[PersistentMemo] = None, timeout: Optional[float] = None,
+                 max_redirects: Optional[int] = None):
+        self.memo = memo if memo is not None else PersistentMemo(
+            Config.SHORT_LINK_DB_PATH,
+            table="short_link_targets",
+            front_cache_size=Config.SHORT_LINK_CACHE_SIZE,
+            max_rows=Config.SHORT_LINK_MAX_ROWS
+        )
+        self.timeout = Config.SHORT_LINK_TIMEOUT if timeout is None else timeout
+        self.max_redirects = Config.SHORT_LINK_MAX_REDIRECTS if max_redirects is None else max_redirects
+        self._inflight = SingleFlight()
+        self._inflight_async = AsyncSingleFlight()
+
+        self.hits = 0
+        self.resolved = 0
+        self.failed = 0
+
+    def resolve(self, url: str) -> Optional[str]:
+        key = self._key(url)
+        cached = self._cached(key)
+        if cached:
+            return cached
+        return self._inflight.do(key, self._resolve_and_remember, key, url)
+
+    async def resolve_async(self, url: str) -> Optional[str]:
+        key = self._key(url)
+        cached = self._count_hit(await self.memo.get_async(key))
+        if cached:
+            return cached
+        return await self._inflight_async.do(key, self._resolve_and_remember_async, key, url)
+
+    def cached(self, url: str) -> Optional[str]:
+        """The remembered target of a short link if it is in memory, without any network or disk access"""
+        return self._count_hit(self.memo.peek(self._key(url)))
+
+    def stats(self) -> Dict[str, Any]:
+        return {"hits": self.hits, "resolved": self.resolved, "failed": self.failed, **self.memo.stats()}
+
+    def _key(self, url: str) -> str:
+        # Query strings on short links are tracking noise, the path identifies the target
+        parsed = urllib.parse.urlparse(url)
+        return f"{(parsed.hostname or '').lower()}{parsed.path.rstrip('/')}"
+
+    def _cached(self, key: str) -> Optional[str]:
+        return self._count_hit(self.memo.get(key))
+
+    def _count_hit(self, target: Optional[str]) -> Optional[str]:
+        if target:
+            self.hits += 1
+        return target
+
+    def _resolve_and_remember(self, key: str, url: str) -> Optional[str]:
+        start = time.perf_counter()
+        target = None
+        try:
+            target = self._follow(url)
+        except Exception as e:
+            logger.error(f"Error resolving short link {url}: {e}")
+        return self._remember(key, url, target, start)
+
+    async def _resolve_and_remember_async(self, key: str, url: str) -> Optional[str]:
+        start = time.perf_counter()
+        target = None
+        try:
+            target = await self._follow_async(url)
+        except Exception as e:
+            logger.error(f"Error resolving short link {url}: {e}")
+        return self._remember(key, url, target, start)
+
+    def _remember(self, key: str, url: str, target: Optional[str], start: float) -> Optional[str]:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage='short_link')
+        record_result('short_link', 'success' if target else 'failure')
+        if target:
+            self.resolved += 1
+            self.memo.put(key, target)
+            logger.info("Short link resolved: %s -> %s", url, target, extra=log_event('short_link_resolved'))
+        else:
+            self.failed += 1
+            logger.warning("Could not resolve short link: %s", url, extra=log_event('short_link_failed'))
+        return target
+
+    def _follow(self, url: str) -> Optional[str]:
+        from http_client import get_session, request_timeout
+
+        session = get_session()
+        for _ in range(self.max_redirects + 1):
+            if not _allowed_hop(url):
+                return None
+            response = session.head(url, allow_redirects=False, timeout=request_timeout(self.timeout))
+            if response.status_code in (403, 405, 501):
+                # Some redirectors refuse HEAD, a streamed GET stops before the body
+                response = session.get(url, allow_redirects=False, stream=True, timeout=request_timeout(self.timeout))
+            response.close()
+
+            next_url = self._next_hop(url, response.status_code, response.headers.get('Location'))
+            if next_url is None:
+                return None
+            clean_url = clean_product_url(next_url)
+            if clean_url:
+                return clean_url
+            url = next_url
+        return None
+
+    async def _follow_async(self, url: str) -> Optional[str]:
+        from http_client import get_async_client, async_request_timeout
+
+        client = get_async_client()
+        for _ in range(self.max_redirects + 1):
+            if not _allowed_hop(url):
+                return None
+            response = await client.head(url, follow_redirects=False, timeout=async_request_timeout(self.timeout))
+            if response.status_code in (403, 405, 501):
+                async with client.stream('GET', url, follow_redirects=False,
+                                         timeout=async_request_timeout(self.timeout)) as response:
+                    pass
+
+            next_url = self._next_hop(url, response.status_code, response.headers.get('Location'))
+            if next_url is None:
+                return None
+            clean_url = clean_product_url(next_url)
+            if clean_url:
+                return clean_url
+            url = next_url
+        return None
+
+    def _next_hop(self, url: str, status_code: int, location: Optional[str]) -> Optional[str]:
+        if 300 <= status_code < 400 and location:
+            return urllib.parse.urljoin(url, location)
+        # A short link that answers without redirecting is dead or blocked
+        return None
+
+
+_resolver: Optional[ShortLinkResolver] = None
+_resolver_lock = threading.Lock()
+
+
+def get_short_link_resolver() -> ShortLinkResolver:
+    """The process-wide short link resolver"""
+    global _resolver
+
+    if _resolver is None:
+        with _resolver_lock:
+            if _resolver is None:
+                _resolver = ShortLinkResolver()
+
+    return _resolver
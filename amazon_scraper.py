@@ -1,15 +1,69 @@
-import re
+import time
+import asyncio
+import httpx
 import requests
-from bs4 import BeautifulSoup
 import urllib.parse
 import logging
-from typing import Dict, Optional
+from typing import TYPE_CHECKING, Dict, Iterable, Optional, Tuple
+from amazon_links import clean_product_url
+from config import Config
+from dispatcher import update_deadline
+from extraction import (
+    DEFAULT_TITLE, IMAGE_SELECTORS, PRICE_SELECTORS, TITLE_SELECTORS,
+    LxmlExtractor, has_digit, is_robot_check, normalize_image_url
+)
+from http_client import get_session, get_async_client, request_timeout, async_request_timeout
+from log_setup import log_event
+from metrics import record_result, track_stage
+from product_cache import ProductCache
+from product_store import ProductStore
+from rate_limiter import AdaptiveRateLimiter, DomainRateLimiters, backoff_delay
+from singleflight import AsyncSingleFlight, SingleFlight
+
+# bs4 and lxml are imported on the first scrape, not at startup
+if TYPE_CHECKING:
+    from bs4 import BeautifulSoup
+    from page_stream import ProductFieldDetector
 
 logger = logging.getLogger(__name__)
 
+EXTRACTION_ENGINES = ('lxml', 'bs4')
+
+# Amazon's answers to "too many requests", alongside its captcha page
+THROTTLE_STATUS_CODES = (429, 503)
+
+
+class AmazonThrottled(Exception):
+    """Amazon refused to serve the page, slow down and retry"""
+
+    def __init__(self, reason: str, retry_after: Optional[float] = None):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
 class AmazonScraper:
-    def __init__(self):
+    def __init__(self, cache: Optional[ProductCache] = None, streaming: Optional[bool] = None,
+                 engine: Optional[str] = None, rate_limiters: Optional[DomainRateLimiters] = None):
         self.affiliate_tag = "budgetlooks08-21"
+        self.streaming = Config.STREAMING_FETCH if streaming is None else streaming
+        self.engine = (engine or Config.EXTRACTION_ENGINE).lower()
+        if self.engine not in EXTRACTION_ENGINES:
+            raise ValueError(f"Unknown extraction engine: {self.engine}")
+        self._lxml: Optional[LxmlExtractor] = None
+        self._inflight = SingleFlight()
+        self._inflight_async = AsyncSingleFlight()
+        self.rate_limiters = rate_limiters if rate_limiters is not None else DomainRateLimiters()
+        self.cache = cache if cache is not None else ProductCache(
+            max_size=Config.PRODUCT_CACHE_SIZE,
+            ttl=Config.PRODUCT_CACHE_TTL,
+            price_ttl=Config.PRICE_CACHE_TTL,
+            store=ProductStore(
+                Config.PRODUCT_STORE_PATH,
+                max_records=Config.PRODUCT_STORE_MAX_RECORDS,
+                mmap_size=Config.PRODUCT_STORE_MMAP_BYTES
+            ) if Config.PRODUCT_STORE_PATH else None
+        )
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
             'Accept-Language': 'en-US,en;q=0.9,hi;q=0.8',
@@ -21,96 +75,355 @@ class AmazonScraper:
     
     def extract_product_info(self, url: str) -> Optional[Dict[str, str]]:
         """Extract product information from Amazon URL"""
-        try:
-            clean_url = self._clean_amazon_url(url)
-            
-            if not clean_url:
-                logger.error(f"Invalid Amazon URL: {url}")
+        clean_url = self._clean_amazon_url(url)
+        
+        if not clean_url:
+            logger.error(f"Invalid Amazon URL: {url}")
+            return None
+        
+        cache_key = self._cache_key(clean_url)
+        product_info = self._get_cached(cache_key)
+        if product_info:
+            return product_info
+        
+        # Concurrent requests for the same product share one download
+        product_info = self._inflight.do(cache_key, self._load_product_info, cache_key, clean_url)
+        return dict(product_info) if product_info else None
+    
+    async def extract_product_info_async(self, url: str) -> Optional[Dict[str, str]]:
+        """Extract product information without tying up an executor thread on the download"""
+        clean_url = self._clean_amazon_url(url)
+        
+        if not clean_url:
+            logger.error(f"Invalid Amazon URL: {url}")
+            return None
+        
+        cache_key = self._cache_key(clean_url)
+        # A local miss is looked up in the shared store on the cache's reader thread
+        product_info = self._log_cache_hit(cache_key, await self.cache.get_async(cache_key))
+        if product_info:
+            return product_info
+        
+        # Concurrent requests for the same product share one download
+        product_info = await self._inflight_async.do(cache_key, self._load_product_info_async, cache_key, clean_url)
+        return dict(product_info) if product_info else None
+    
+    def cached_product_info(self, url: str) -> Optional[Dict[str, str]]:
+        """Details this process has cached for a product URL, without fetching or reading the shared store.
+        
+        The price is None if only it has expired.
+        """
+        clean_url = self._clean_amazon_url(url)
+        if not clean_url:
+            return None
+        
+        return self.cache.get_local(self._cache_key(clean_url))
+    
+    async def refresh_product_info_async(self, url: str) -> Optional[Dict[str, str]]:
+        """Scrape a product again even if it is cached, the fresh result replaces the cached one"""
+        clean_url = self._clean_amazon_url(url)
+        if not clean_url:
+            return None
+        
+        # A user request for the same product arriving meanwhile waits for this download
+        cache_key = self._cache_key(clean_url)
+        product_info = await self._inflight_async.do(cache_key, self._load_product_info_async, cache_key, clean_url)
+        return dict(product_info) if product_info else None
+    
+    def _load_product_info(self, cache_key: Tuple[str, str], clean_url: str) -> Optional[Dict[str, str]]:
+        return self._store_result(cache_key, self._fetch_product_info(clean_url))
+    
+    async def _load_product_info_async(self, cache_key: Tuple[str, str], clean_url: str) -> Optional[Dict[str, str]]:
+        product_info = await self._fetch_product_info_async(clean_url)
+        if product_info:
+            return self._store_result(cache_key, product_info)
+        return self._log_stale_served(cache_key, await self.cache.get_stale_async(cache_key))
+    
+    def inflight_stats(self) -> Dict[str, Dict[str, int]]:
+        """Counters for requests that shared an in-flight download"""
+        return {"sync": self._inflight.stats(), "async": self._inflight_async.stats()}
+    
+    def _get_cached(self, cache_key: Tuple[str, str]) -> Optional[Dict[str, str]]:
+        return self._log_cache_hit(cache_key, self.cache.get(cache_key))
+    
+    def _log_cache_hit(self, cache_key: Tuple[str, str], product_info: Optional[Dict[str, str]]) -> Optional[Dict[str, str]]:
+        if product_info:
+            logger.info("Cache hit for %s/%s", cache_key[0], cache_key[1], extra=log_event('product_cache_hit'))
+        return product_info
+    
+    def _store_result(self, cache_key: Tuple[str, str], product_info: Optional[Dict[str, str]]) -> Optional[Dict[str, str]]:
+        """Cache a fresh result, or fall back to stale cached details if the fetch failed"""
+        if product_info:
+            self.cache.put(cache_key, product_info)
+            return product_info
+        
+        # Title and image outlive the price, better than failing outright
+        return self._log_stale_served(cache_key, self.cache.get_stale(cache_key))
+    
+    def _log_stale_served(self, cache_key: Tuple[str, str], stale_info: Optional[Dict[str, str]]) -> Optional[Dict[str, str]]:
+        if stale_info:
+            logger.warning("Serving cached details without price for %s/%s", cache_key[0], cache_key[1],
+                           extra=log_event('product_stale_served'))
+        return stale_info
+    
+    def _fetch_product_info(self, clean_url: str) -> Optional[Dict[str, str]]:
+        """Download and parse a product page, retrying throttled and transient failures until the deadline"""
+        deadline = self._fetch_deadline()
+        limiter = self.rate_limiters.get(urllib.parse.urlparse(clean_url).netloc)
+        
+        for attempt in range(Config.AMAZON_MAX_ATTEMPTS):
+            if not limiter.acquire(deadline):
+                logger.warning("No %s request slot before the deadline for %s", limiter.name, clean_url,
+                               extra=log_event('amazon_slot_refused'))
                 return None
             
-            response = requests.get(clean_url, headers=self.headers, timeout=15)
-            response.raise_for_status()
+            try:
+                content = self._download(clean_url, self._attempt_timeout(deadline))
+                limiter.record_success()
+                return self._parse_product_page(content, clean_url)
+            except Exception as e:
+                delay = self._retry_delay(limiter, e, attempt, deadline)
+            
+            if delay is None:
+                return None
+            time.sleep(delay)
+        
+        return None
+    
+    async def _fetch_product_info_async(self, clean_url: str) -> Optional[Dict[str, str]]:
+        """Download a product page on the event loop and parse it in the executor, with the same retries"""
+        deadline = self._fetch_deadline()
+        limiter = self.rate_limiters.get(urllib.parse.urlparse(clean_url).netloc)
+        
+        for attempt in range(Config.AMAZON_MAX_ATTEMPTS):
+            if not await limiter.acquire_async(deadline):
+                logger.warning("No %s request slot before the deadline for %s", limiter.name, clean_url,
+                               extra=log_event('amazon_slot_refused'))
+                return None
             
-            soup = BeautifulSoup(response.content, 'html.parser')
+            try:
+                content = await self._download_async(clean_url, self._attempt_timeout(deadline))
+                limiter.record_success()
+                
+                # Parsing is CPU bound, keep it off the event loop
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(None, self._parse_product_page, content, clean_url)
+            except Exception as e:
+                delay = self._retry_delay(limiter, e, attempt, deadline)
             
-            product_info = {
-                'title': self._extract_title(soup),
-                'price': self._extract_price(soup),
-                'image_url': self._extract_image_url(soup),
-                'url': clean_url
-            }
+            if delay is None:
+                return None
+            await asyncio.sleep(delay)
+        
+        return None
+    
+    def _download(self, clean_url: str, timeout: float) -> bytes:
+        with track_stage('amazon_fetch', timeout_types=(requests.Timeout,)):
+            with get_session().get(
+                clean_url,
+                headers=self.headers,
+                timeout=request_timeout(timeout),
+                stream=self.streaming
+            ) as response:
+                self._check_throttled(response.status_code, response.headers)
+                response.raise_for_status()
+                
+                if self.streaming:
+                    content = self._read_until_complete(response.iter_content(Config.STREAM_CHUNK_SIZE))
+                else:
+                    content = response.content
             
-            logger.info(f"Successfully extracted: {product_info['title']}")
-            return product_info
+            self._check_robot_page(content)
+            return content
+    
+    async def _download_async(self, clean_url: str, timeout: float) -> bytes:
+        with track_stage('amazon_fetch', timeout_types=(httpx.TimeoutException,)):
+            async with get_async_client().stream(
+                'GET',
+                clean_url,
+                headers=self.headers,
+                timeout=async_request_timeout(timeout)
+            ) as response:
+                self._check_throttled(response.status_code, response.headers)
+                response.raise_for_status()
+                
+                if self.streaming:
+                    detector = self._new_detector()
+                    chunks = []
+                    async for chunk in response.aiter_bytes(Config.STREAM_CHUNK_SIZE):
+                        chunks.append(chunk)
+                        if detector.feed(chunk):
+                            break
+                    content = b''.join(chunks)
+                    self._log_stream_result(detector)
+                else:
+                    content = await response.aread()
             
-        except requests.RequestException as e:
-            logger.error(f"Request error: {e}")
+            self._check_robot_page(content)
+            return content
+    
+    def _check_throttled(self, status_code: int, headers) -> None:
+        if status_code in THROTTLE_STATUS_CODES:
+            retry_after = headers.get('Retry-After', '')
+            raise AmazonThrottled(f"HTTP {status_code}", float(retry_after) if retry_after.isdigit() else None)
+    
+    def _check_robot_page(self, content: bytes) -> None:
+        # A captcha page is a 200 with no product on it, parsing it would give an empty product
+        if is_robot_check(content):
+            raise AmazonThrottled("robot check")
+    
+    def _fetch_deadline(self) -> float:
+        """When to stop retrying: AMAZON_FETCH_DEADLINE from now, or earlier if the update is due sooner.
+
+        A fetch that starts late in an update (a second LINK_CONCURRENCY wave,
+        after a short link was resolved) must give up while there is still
+        time to reply, otherwise the dispatcher cancels the whole update.
+        """
+        deadline = time.monotonic() + Config.AMAZON_FETCH_DEADLINE
+        due = update_deadline.get()
+        if due is not None:
+            deadline = min(deadline, due - Config.AMAZON_REPLY_RESERVE)
+        return deadline
+    
+    def _attempt_timeout(self, deadline: float) -> float:
+        return max(0.1, min(Config.AMAZON_TIMEOUT, deadline - time.monotonic()))
+    
+    def _retry_delay(self, limiter: AdaptiveRateLimiter, error: Exception, attempt: int, deadline: float) -> Optional[float]:
+        """How long to back off before the next attempt, None if the error is final or time is up"""
+        retry_after = None
+        if isinstance(error, AmazonThrottled):
+            limiter.record_throttle()
+            record_result('amazon_throttle', error.reason.replace(' ', '_').lower())
+            retry_after = error.retry_after
+        elif isinstance(error, (requests.HTTPError, httpx.HTTPStatusError)):
+            status_code = error.response.status_code if error.response is not None else None
+            if status_code is None or status_code < 500:
+                logger.error(f"Request error: {error}")
+                return None
+        elif not isinstance(error, (requests.RequestException, httpx.TransportError)):
+            logger.error(f"Error extracting product info: {error}")
             return None
-        except Exception as e:
-            logger.error(f"Error extracting product info: {e}")
+        
+        delay = backoff_delay(attempt, Config.AMAZON_RETRY_BASE, Config.AMAZON_RETRY_CAP)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        
+        if attempt + 1 >= Config.AMAZON_MAX_ATTEMPTS or time.monotonic() + delay >= deadline:
+            logger.error(f"Giving up on {limiter.name} after {attempt + 1} attempt(s): {error}")
             return None
+        
+        logger.warning("Retrying %s in %.2fs (attempt %d): %s", limiter.name, delay, attempt + 1, error,
+                       extra=log_event('amazon_retry'))
+        return delay
+    
+    def _read_until_complete(self, chunks: Iterable[bytes]) -> bytes:
+        """Read a streamed body until title, price and image are available"""
+        detector = self._new_detector()
+        received = []
+        
+        for chunk in chunks:
+            received.append(chunk)
+            if detector.feed(chunk):
+                # Closing the response early drops the rest of the page
+                break
+        
+        self._log_stream_result(detector)
+        return b''.join(received)
+    
+    def _new_detector(self) -> "ProductFieldDetector":
+        from page_stream import ProductFieldDetector
+        return ProductFieldDetector()
+    
+    def _log_stream_result(self, detector: "ProductFieldDetector") -> None:
+        if detector.complete:
+            logger.debug("Stopped page download early after %d bytes", detector.bytes_fed, extra=log_event('page_stream'))
+        else:
+            logger.debug("Read full page (%d bytes), fields not found early", detector.bytes_fed,
+                         extra=log_event('page_stream'))
+    
+    def _parse_product_page(self, content: bytes, clean_url: str) -> Dict[str, str]:
+        """Parse product details out of a downloaded page"""
+        with track_stage('html_parse'):
+            product_info = self.extract_fields(content)
+        product_info['url'] = clean_url
+        
+        logger.info("Successfully extracted: %s", product_info['title'], extra=log_event('product_extracted'))
+        return product_info
+    
+    def extract_fields(self, content: bytes, engine: Optional[str] = None) -> Dict[str, Optional[str]]:
+        """Extract title, price and image from page content with the given engine"""
+        engine = engine or self.engine
+        
+        if engine == 'lxml':
+            return self._lxml_extractor().extract(content)
+        
+        from bs4 import BeautifulSoup
+        soup = BeautifulSoup(content, 'html.parser')
+        return {
+            'title': self._extract_title(soup),
+            'price': self._extract_price(soup),
+            'image_url': self._extract_image_url(soup)
+        }
+    
+    def compare_engines(self, content: bytes) -> Dict[str, Tuple[Optional[str], Optional[str]]]:
+        """Run both engines on the same page and return fields where they disagree as (bs4, lxml)"""
+        bs4_fields = self.extract_fields(content, engine='bs4')
+        lxml_fields = self.extract_fields(content, engine='lxml')
+        
+        return {
+            field: (bs4_fields[field], lxml_fields[field])
+            for field in bs4_fields
+            if bs4_fields[field] != lxml_fields[field]
+        }
+    
+    def _lxml_extractor(self) -> LxmlExtractor:
+        if self._lxml is None:
+            self._lxml = LxmlExtractor()
+        return self._lxml
     
     def _clean_amazon_url(self, url: str) -> Optional[str]:
         """Clean Amazon URL to get the base product URL"""
         try:
-            asin_pattern = r'/(?:dp|gp/product)/([A-Z0-9]{10})'
-            match = re.search(asin_pattern, url)
-            
-            if not match:
-                return None
-            
-            asin = match.group(1)
-            parsed_url = urllib.parse.urlparse(url)
-            domain = parsed_url.netloc
-            
-            clean_url = f"https://{domain}/dp/{asin}"
-            return clean_url
+            # Short links have no ASIN yet, they are resolved before they get here
+            return clean_product_url(url)
             
         except Exception as e:
             logger.error(f"Error cleaning URL: {e}")
             return None
     
-    def _extract_title(self, soup: BeautifulSoup) -> str:
+    def _cache_key(self, clean_url: str) -> Tuple[str, str]:
+        """Build the (domain, ASIN) cache key from a cleaned product URL"""
+        parsed_url = urllib.parse.urlparse(clean_url)
+        domain = parsed_url.netloc.lower()
+        if domain.startswith('www.'):
+            domain = domain[4:]
+        asin = parsed_url.path.rsplit('/', 1)[-1]
+        return domain, asin
+    
+    def _extract_title(self, soup: "BeautifulSoup") -> str:
         """Extract product title"""
         try:
-            title_selectors = [
-                '#productTitle',
-                '.product-title',
-                'h1.a-size-large',
-                'h1 span',
-                '[data-automation-id="product-title"]'
-            ]
-            
-            for selector in title_selectors:
+            for selector in TITLE_SELECTORS:
                 title_element = soup.select_one(selector)
                 if title_element:
                     title = title_element.get_text(strip=True)
                     if title:
                         return title[:200]
             
-            return "Amazon Product"
+            return DEFAULT_TITLE
             
         except Exception as e:
             logger.error(f"Error extracting title: {e}")
-            return "Amazon Product"
+            return DEFAULT_TITLE
     
-    def _extract_price(self, soup: BeautifulSoup) -> Optional[str]:
+    def _extract_price(self, soup: "BeautifulSoup") -> Optional[str]:
         """Extract product price"""
         try:
-            price_selectors = [
-                '.a-price .a-offscreen',
-                '.a-price-whole',
-                '#price_inside_buybox',
-                '.a-price.a-text-price.a-size-medium.apexPriceToPay',
-                '[data-automation-id="product-price"]',
-                '.a-price-range'
-            ]
-            
-            for selector in price_selectors:
+            for selector in PRICE_SELECTORS:
                 price_element = soup.select_one(selector)
                 if price_element:
                     price = price_element.get_text(strip=True)
-                    if price and any(char.isdigit() for char in price):
+                    if price and has_digit(price):
                         return price
             
             return None
@@ -119,33 +432,15 @@ class AmazonScraper:
             logger.error(f"Error extracting price: {e}")
             return None
     
-    def _extract_image_url(self, soup: BeautifulSoup) -> Optional[str]:
+    def _extract_image_url(self, soup: "BeautifulSoup") -> Optional[str]:
         """Extract product image URL"""
         try:
-            image_selectors = [
-                '#landingImage',
-                '#imgBlkFront',
-                '#main-image',
-                '.a-dynamic-image',
-                '[data-automation-id="product-image"]'
-            ]
-            
-            for selector in image_selectors:
+            for selector in IMAGE_SELECTORS:
                 img_element = soup.select_one(selector)
                 if img_element:
-                    img_url = img_element.get('src') or img_element.get('data-src')
-                    
-                    if img_url and isinstance(img_url, str):
-                        # Clean up image URL
-                        img_url = re.sub(r'\._[A-Z0-9_,]+_\.', '.', img_url)
-                        
-                        if img_url.startswith('//'):
-                            img_url = 'https:' + img_url
-                        elif img_url.startswith('/'):
-                            continue
-                        
-                        if img_url.startswith('http'):
-                            return img_url
+                    img_url = normalize_image_url(img_element.get('src') or img_element.get('data-src'))
+                    if img_url:
+                        return img_url
             
             return None
             
@@ -1,25 +1,44 @@
+import time
+
+# Taken before anything else is imported, the startup report counts from here
+STARTUP_STARTED_AT = time.perf_counter()
+
 import os
 import logging
-from flask import Flask, request, jsonify
+from flask import Flask, Response, redirect, request, jsonify
 import json
-from telegram import Update
-from telegram.ext import Application, CommandHandler, MessageHandler, filters
 import asyncio
 from concurrent.futures import ThreadPoolExecutor
 import traceback
 import threading
 import queue
-import time
-import requests
+from config import Config
+from dispatcher import UpdateDispatcher
+from durable_queue import DurableUpdateQueue, acquire_leadership
+from dedup import UpdateDeduplicator
+from intake import LoadShedder, PriorityUpdateQueue, busy_reply, classify_update
+from metrics import InstrumentedThreadPoolExecutor, StartupTimer, registry
+from log_setup import configure_logging, log_event, parse_sample_rates
 
-# Configure logging with more details
-logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.DEBUG)
+# telegram, requests/httpx, bs4 and lxml are imported where they are first needed,
+# mostly on the bot worker thread, so the webhook can accept updates sooner
+
+# Records are written by a background thread and high-volume events are sampled, see log_setup
+log_sampler = configure_logging(
+    level=Config.LOG_LEVEL,
+    mode=Config.LOG_MODE,
+    fmt=Config.LOG_FORMAT,
+    sample_rates=parse_sample_rates(Config.LOG_SAMPLE_EVERY)
+)
 
 logger = logging.getLogger(__name__)
 
 # Initialize Flask app
 app = Flask(__name__)
 
+startup_timer = StartupTimer(STARTUP_STARTED_AT)
+startup_timer.mark('imports')
+
 # Get configuration from environment variables
 BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN', 'YOUR_ACTUAL_BOT_TOKEN_HERE')
 WEBHOOK_URL = os.getenv('WEBHOOK_URL')
@@ -31,10 +50,102 @@ if not BOT_TOKEN or BOT_TOKEN == 'YOUR_ACTUAL_BOT_TOKEN_HERE':
 
 # Global variables
 bot_application = None
-update_queue = queue.Queue()
+intake_shedder = LoadShedder(
+    max_size=Config.UPDATE_QUEUE_MAX_SIZE,
+    high_watermark=Config.UPDATE_QUEUE_HIGH_WATERMARK,
+    low_watermark=Config.UPDATE_QUEUE_LOW_WATERMARK
+)
+update_queue = PriorityUpdateQueue(intake_shedder)
 bot_thread = None
 bot_initialized = False
 webhook_set = False
+update_dispatcher = None
+update_poller = None
+is_leader = False
+
+# Set by the worker once updates can be processed, and once startup has finished either way
+bot_ready = threading.Event()
+bot_startup_done = threading.Event()
+
+# With the sqlite backend every worker process shares one queue file, so updates
+# survive worker restarts and any worker can pick them up.
+# Polling confirms updates to Telegram as soon as they are queued, so it always uses it,
+# an in-memory queue would lose accepted but unhandled updates on restart
+durable_queue = None
+durable_queue_executor = None
+if Config.UPDATE_QUEUE_BACKEND == 'sqlite' or Config.INGEST_MODE == 'polling':
+    if Config.UPDATE_QUEUE_BACKEND != 'sqlite':
+        logger.info("ℹ️ Polling mode, using the sqlite update queue instead of the in-memory one")
+    durable_queue = DurableUpdateQueue(
+        Config.UPDATE_QUEUE_DB_PATH,
+        lease_seconds=Config.UPDATE_LEASE_SECONDS,
+        max_attempts=Config.UPDATE_MAX_ATTEMPTS
+    )
+    # Claims, idle waits and acks keep SQLite off the event loop. The feeder uses one thread at a time,
+    # the second one takes the acks so they never queue behind an idle wait
+    durable_queue_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="update-intake")
+
+update_deduplicator = UpdateDeduplicator(
+    window=Config.UPDATE_DEDUP_WINDOW,
+    max_entries=Config.UPDATE_DEDUP_MAX_ENTRIES,
+    db_path=Config.UPDATE_QUEUE_DB_PATH if Config.UPDATE_DEDUP_SHARED else None
+)
+
+def queue_size():
+    """Updates waiting to be handled"""
+    if durable_queue:
+        return durable_queue.qsize()
+    return update_queue.qsize()
+
+def intake_stats():
+    """Backlog age and load shedding state of the intake"""
+    if durable_queue:
+        oldest = durable_queue.oldest_age()
+        return {"oldest_age_seconds": round(oldest, 3) if oldest is not None else None, **intake_shedder.stats()}
+    return update_queue.stats()
+
+def shed_response(update_data):
+    """Webhook answer for an update we have no capacity for"""
+    update_id = update_data.get('update_id', 'unknown')
+    logger.warning("🚦 Over capacity, shedding update %s", update_id, extra=log_event('update_shed', update_id))
+    return jsonify(busy_reply(update_data) or {"status": "shed"})
+
+def ingest_updates(updates):
+    """Queue a batch of polled updates on the shared queue.
+    
+    Returns how many were queued and the busy replies for the shed ones. Polling always
+    runs with the shared queue, updates are committed there before their offset is saved.
+    """
+    fresh = [update_data for update_data in updates if not update_deduplicator.is_duplicate(update_data.get('update_id'))]
+    shed = []
+    
+    try:
+        # One admission decision per update, one transaction for the whole batch
+        depth = durable_queue.qsize()
+        admitted = []
+        for update_data in fresh:
+            if intake_shedder.admit(classify_update(update_data), depth + len(admitted)):
+                admitted.append(update_data)
+            else:
+                shed.append(update_data)
+        queued = durable_queue.put_many(admitted)
+    except Exception:
+        # Nothing is confirmed to Telegram, so the batch comes back and has to get through
+        for update_data in fresh:
+            update_deduplicator.forget(update_data.get('update_id'))
+        raise
+    
+    busy_replies = []
+    for update_data in shed:
+        update_id = update_data.get('update_id', 'unknown')
+        logger.warning("🚦 Over capacity, shedding update %s", update_id, extra=log_event('update_shed', update_id))
+        reply = busy_reply(update_data)
+        if reply:
+            busy_replies.append(reply)
+    
+    logger.debug("📋 %d of %d polled update(s) queued. Queue size: %d", queued, len(updates), queue_size(),
+                 extra=log_event('update_queued'))
+    return queued, busy_replies
 
 def set_telegram_webhook():
     """Set Telegram webhook"""
@@ -50,6 +161,7 @@ def set_telegram_webhook():
         
         logger.info(f"Setting webhook to: {webhook_url}")
         
+        import requests
         response = requests.post(
             telegram_api_url, 
             json={"url": webhook_url},
@@ -76,9 +188,9 @@ def set_telegram_webhook():
 def get_bot_handlers():
     """Import and return bot handlers"""
     try:
-        from bot_handlers import start_handler, message_handler, help_handler
+        from bot_handlers import start_handler, message_handler, help_handler, inline_query_handler
         logger.info("✅ Bot handlers imported successfully")
-        return start_handler, message_handler, help_handler
+        return start_handler, message_handler, help_handler, inline_query_handler
     except ImportError as e:
         logger.error(f"Failed to import bot handlers: {e}")
         # Fallback handlers
@@ -93,8 +205,12 @@ def get_bot_handlers():
         async def fallback_help(update, context):
             await update.message.reply_text("Send me Amazon product URLs and I'll create affiliate links for you!")
             logger.info("Fallback help handler executed")
+        
+        async def fallback_inline(update, context):
+            await update.inline_query.answer([], cache_time=0)
+            logger.info("Fallback inline handler executed")
             
-        return fallback_start, fallback_message, fallback_help
+        return fallback_start, fallback_message, fallback_help, fallback_inline
 
 def initialize_bot():
     """Initialize bot application"""
@@ -103,8 +219,10 @@ def initialize_bot():
     try:
         logger.info("🚀 Starting bot initialization...")
         
+        from telegram.ext import Application, CommandHandler, InlineQueryHandler, MessageHandler, filters
+        
         # Get handlers
-        start_handler, message_handler, help_handler = get_bot_handlers()
+        start_handler, message_handler, help_handler, inline_query_handler = get_bot_handlers()
         
         # Initialize bot application
         bot_application = Application.builder().token(BOT_TOKEN).build()
@@ -113,6 +231,8 @@ def initialize_bot():
         bot_application.add_handler(CommandHandler("start", start_handler))
         bot_application.add_handler(CommandHandler("help", help_handler))
         bot_application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, message_handler))
+        # Inline mode has to be switched on for the bot with BotFather's /setinline
+        bot_application.add_handler(InlineQueryHandler(inline_query_handler))
         
         bot_initialized = True
         logger.info("✅ Bot application initialized successfully")
@@ -134,26 +254,131 @@ async def process_single_update(update_data):
             return False
             
         update_id = update_data.get('update_id', 'unknown')
-        logger.info(f"🔄 Starting to process update: {update_id}")
+        logger.debug("🔄 Starting to process update: %s", update_id, extra=log_event('update_started', update_id))
         
         # Create update object
+        from telegram import Update
         update = Update.de_json(update_data, bot_application.bot)
-        logger.info(f"✅ Update object created for: {update_id}")
         
         # Process update
         await bot_application.process_update(update)
-        logger.info(f"✅ Update {update_id} processed successfully")
+        logger.debug("✅ Update %s processed successfully", update_id, extra=log_event('update_processed', update_id))
         return True
         
     except Exception as e:
-        logger.error(f"❌ Error processing update: {e}")
-        logger.error(f"Update data: {update_data}")
-        logger.error(f"Traceback: {traceback.format_exc()}")
+        # The traceback is rendered by the log writer, the payload only at debug level
+        update_id = update_data.get('update_id') if isinstance(update_data, dict) else None
+        logger.error("❌ Error processing update %s: %s", update_id, e, exc_info=True,
+                     extra=log_event('update_failed', update_id))
+        logger.debug("Update data: %s", update_data, extra=log_event('update_payload', update_id))
         return False
 
+def mark_update_done(update_data, success):
+    """Called by the dispatcher once an update has been handled"""
+    if durable_queue:
+        # Failed updates are acked too, only a crashed worker's lease is retried
+        update_id = update_data.get('update_id')
+        ack = asyncio.get_running_loop().run_in_executor(durable_queue_executor, durable_queue.ack, update_id)
+        ack.add_done_callback(lambda done: log_ack_failure(done, update_id))
+    else:
+        update_queue.task_done()
+
+def log_ack_failure(ack, update_id):
+    """An unacked update is handled again once its lease expires"""
+    if not ack.cancelled() and ack.exception() is not None:
+        logger.error("❌ Could not ack update %s: %s", update_id, ack.exception(),
+                     extra=log_event('update_ack_failed', update_id))
+
+async def dispatch_updates(dispatcher):
+    """Feed updates from the queue into the dispatcher"""
+    loop = asyncio.get_running_loop()
+    
+    # Blocking queue reads get their own thread so they never take an executor slot from scraping
+    intake_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="update-intake")
+    
+    try:
+        while True:
+            try:
+                # Get update from queue with timeout
+                enqueued_at, update_data = await loop.run_in_executor(intake_executor, update_queue.get, True, 3)
+            except queue.Empty:
+                # No updates in queue, continue waiting
+                logger.debug("📭 No updates in queue, waiting...", extra=log_event('queue_idle'))
+                continue
+            
+            update_id = update_data.get('update_id', 'unknown')
+            logger.debug("📥 Got update from queue: %s (Total processed: %d)", update_id, dispatcher.processed_count,
+                         extra=log_event('update_dequeued', update_id))
+            
+            # Waits only when MAX_CONCURRENT_UPDATES updates are running or the chat has MAX_CHAT_BACKLOG queued
+            await dispatcher.submit(update_data, enqueued_at)
+    finally:
+        intake_executor.shutdown(wait=False)
+
+async def dispatch_durable_updates(dispatcher, shared_queue):
+    """Claim updates from the shared queue whenever the dispatcher has free slots"""
+    loop = asyncio.get_running_loop()
+    
+    # SQLite calls and idle waits get their own threads, like the in-memory intake, shared with the acks
+    while True:
+        claimed = await loop.run_in_executor(durable_queue_executor, shared_queue.claim, dispatcher.free_slots())
+        
+        if not claimed:
+            # Woken early when this process queues or acks an update
+            await loop.run_in_executor(durable_queue_executor, shared_queue.wait, Config.UPDATE_QUEUE_POLL_INTERVAL)
+            continue
+        
+        logger.debug("📥 Claimed %d update(s) from the shared queue (Total processed: %d)", len(claimed),
+                     dispatcher.processed_count, extra=log_event('update_dequeued'))
+        
+        for enqueued_at, update_data in claimed:
+            await dispatcher.submit(update_data, enqueued_at)
+
+def start_refresh_scheduler(loop=None):
+    """Keep popular products warm from the bot's event loop"""
+    if not Config.REFRESH_ENABLED:
+        return
+    try:
+        from bot_handlers import refresh_scheduler
+        refresh_scheduler.start(loop)
+    except ImportError as e:
+        logger.warning(f"⚠️ Refresh scheduler not started: {e}")
+
+async def stop_refresh_scheduler():
+    try:
+        from bot_handlers import refresh_scheduler
+        await refresh_scheduler.stop()
+    except ImportError:
+        pass
+
+def is_leader_process():
+    """Whether this process does the one-off work: setWebhook, or polling getUpdates.
+
+    Only one process on the host may poll, Telegram answers concurrent getUpdates calls
+    with 409 Conflict, so polling always takes the leader lock.
+    """
+    if durable_queue is None and Config.INGEST_MODE != 'polling':
+        return True
+    return acquire_leadership(Config.LEADER_LOCK_PATH)
+
+def start_update_poller(loop=None):
+    """In polling mode, fetch updates with getUpdates on the bot's event loop (leader process only)"""
+    global update_poller
+    
+    if Config.INGEST_MODE != 'polling' or not is_leader:
+        return
+    
+    from poller import UpdatePoller
+    update_poller = UpdatePoller(BOT_TOKEN, ingest_updates, Config.POLL_OFFSET_PATH)
+    update_poller.start(loop)
+
+async def stop_update_poller():
+    if update_poller:
+        await update_poller.stop()
+
 def bot_worker():
     """Background worker for processing updates"""
-    global bot_application, bot_initialized
+    global bot_application, bot_initialized, update_dispatcher
     
     logger.info("🚀 Bot worker thread started")
     
@@ -161,70 +386,60 @@ def bot_worker():
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
     
+    # Scrapes and shortener calls run in the default executor, size it to the concurrency limit
+    loop.set_default_executor(InstrumentedThreadPoolExecutor(
+        max_workers=Config.MAX_CONCURRENT_UPDATES,
+        thread_name_prefix="bot-io"
+    ))
+    
     try:
-        # Initialize the bot application if needed
-        if bot_application and not bot_initialized:
+        # Handlers, telegram and the scraping stack are loaded here, off the import path
+        if not bot_initialized:
             logger.info("🔄 Initializing bot in worker thread...")
-            if not initialize_bot():
+            with startup_timer.phase('bot_init'):
+                initialized = initialize_bot()
+            if not initialized:
                 logger.error("❌ Failed to initialize bot in worker thread")
                 return
         
         # Initialize the bot application
-        if bot_application:
-            logger.info("🔄 Initializing bot application in worker thread...")
+        logger.info("🔄 Initializing bot application in worker thread...")
+        with startup_timer.phase('bot_connect'):
             loop.run_until_complete(bot_application.initialize())
-            logger.info("✅ Bot initialized successfully in worker thread")
-        else:
-            logger.error("❌ Bot application is None in worker thread")
-            return
+        logger.info("✅ Bot initialized successfully in worker thread")
         
-        # Main processing loop
-        logger.info("🔄 Starting update processing loop...")
-        processed_count = 0
+        update_dispatcher = UpdateDispatcher(
+            process_single_update,
+            max_concurrency=Config.MAX_CONCURRENT_UPDATES,
+            timeout=Config.UPDATE_TIMEOUT,
+            on_done=mark_update_done,
+            max_chat_backlog=Config.MAX_CHAT_BACKLOG
+        )
         
-        while True:
-            try:
-                # Get update from queue with timeout
-                logger.debug("🔍 Waiting for updates in queue...")
-                update_data = update_queue.get(timeout=3)
-                
-                update_id = update_data.get('update_id', 'unknown')
-                logger.info(f"📥 Got update from queue: {update_id} (Total processed: {processed_count})")
-                
-                # Process the update with timeout
-                try:
-                    success = asyncio.wait_for(
-                        process_single_update(update_data), 
-                        timeout=30.0
-                    )
-                    success = loop.run_until_complete(success)
-                except asyncio.TimeoutError:
-                    logger.error(f"⏰ Timeout processing update {update_id}")
-                    success = False
-                
-                if success:
-                    processed_count += 1
-                    logger.info(f"✅ Successfully processed update {update_id} (Total: {processed_count})")
-                else:
-                    logger.error(f"❌ Failed to process update {update_id}")
-                
-                # Mark task as done
-                update_queue.task_done()
-                
-            except queue.Empty:
-                # No updates in queue, continue waiting
-                logger.debug("📭 No updates in queue, waiting...")
-                continue
-            except Exception as e:
-                logger.error(f"❌ Error in bot worker loop: {e}")
-                logger.error(f"Traceback: {traceback.format_exc()}")
-                # Don't break the loop, continue processing
+        start_refresh_scheduler(loop)
+        start_update_poller(loop)
+        
+        startup_timer.mark('bot_ready')
+        bot_ready.set()
+        bot_startup_done.set()
+        logger.info(f"⏱️ Startup timing: {startup_timer.report()}")
+        
+        # Main processing loop
+        logger.info(f"🔄 Starting update dispatcher (max {Config.MAX_CONCURRENT_UPDATES} concurrent updates)...")
+        if durable_queue:
+            loop.run_until_complete(dispatch_durable_updates(update_dispatcher, durable_queue))
+        else:
+            loop.run_until_complete(dispatch_updates(update_dispatcher))
                 
     except Exception as e:
-        logger.error(f"💥 Fatal error in bot worker: {e}")
-        logger.error(f"Traceback: {traceback.format_exc()}")
+        logger.error(f"💥 Fatal error in bot worker: {e}", exc_info=True)
     finally:
+        bot_startup_done.set()
         try:
+            from http_client import close_async_client
+            loop.run_until_complete(stop_update_poller())
+            loop.run_until_complete(stop_refresh_scheduler())
+            loop.run_until_complete(close_async_client())
             loop.close()
             logger.info("🔚 Bot worker loop closed")
         except:
@@ -233,6 +448,7 @@ def bot_worker():
 @app.route('/webhook', methods=['POST'])
 def webhook():
     """Handle incoming webhook from Telegram"""
+    update_id = None
     try:
         update_data = request.get_json()
         
@@ -241,23 +457,55 @@ def webhook():
             return jsonify({"status": "error", "message": "No data received"}), 400
             
         update_id = update_data.get('update_id', 'unknown')
-        message_text = ""
-        if 'message' in update_data and 'text' in update_data['message']:
-            message_text = update_data['message']['text'][:50]
+        
+        # Telegram retries deliveries it thinks failed, answer those without doing the work again
+        if update_deduplicator.is_duplicate(update_id):
+            logger.info("♻️ Duplicate update %s dropped", update_id, extra=log_event('update_duplicate', update_id))
+            return jsonify({"status": "ok", "duplicate": True})
+        
+        if logger.isEnabledFor(logging.DEBUG):
+            message_text = update_data.get('message', {}).get('text', '')[:50]
+            logger.debug("📨 Received update: %s - Message: '%s'", update_id, message_text,
+                         extra=log_event('update_received', update_id))
+        
+        if durable_queue:
+            if not intake_shedder.admit(classify_update(update_data), durable_queue.qsize()):
+                return shed_response(update_data)
             
-        logger.info(f"📨 Received update: {update_id} - Message: '{message_text}'")
+            # Committed to disk before Telegram gets its 200, a redelivery of a queued update is ignored
+            if durable_queue.put(update_data):
+                logger.debug("📋 Update %s added to shared queue", update_id, extra=log_event('update_queued', update_id))
+            else:
+                logger.info("♻️ Update %s already queued, ignoring", update_id, extra=log_event('update_duplicate', update_id))
+            return jsonify({"status": "ok"})
         
-        # Add update to queue for processing
-        update_queue.put(update_data)
-        logger.info(f"📋 Update {update_id} added to queue. Queue size: {update_queue.qsize()}")
+        # Add update to queue for processing, with its arrival time for queue latency.
+        # Amazon links are refused first when the backlog is too deep to answer in time
+        if not update_queue.offer(update_data, time.monotonic()):
+            return shed_response(update_data)
+        logger.debug("📋 Update %s added to queue. Queue size: %d", update_id, update_queue.qsize(),
+                     extra=log_event('update_queued', update_id))
         
         return jsonify({"status": "ok"})
         
     except Exception as e:
-        logger.error(f"❌ Error in webhook endpoint: {e}")
-        logger.error(f"Traceback: {traceback.format_exc()}")
+        logger.error("❌ Error in webhook endpoint: %s", e, exc_info=True, extra=log_event('webhook_error', update_id))
+        # Not queued, so Telegram's retry has to get through
+        update_deduplicator.forget(update_id)
         return jsonify({"status": "error", "message": str(e)}), 500
 
+@app.route('/r/<code>', methods=['GET'])
+def short_link_redirect(code):
+    """Redirect a link made by the local shortener"""
+    if 'local' not in Config.SHORTENER_PROVIDERS:
+        return jsonify({"status": "error", "message": "Local shortener is disabled"}), 404
+    
+    from local_shortener import get_local_shortener
+    url = get_local_shortener().resolve(code)
+    if url is None:
+        return jsonify({"status": "error", "message": "Unknown short link"}), 404
+    return redirect(url, code=302)
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint for monitoring"""
@@ -265,11 +513,14 @@ def health_check():
         "status": "healthy",
         "message": "Amazon Affiliate Telegram Bot is running",
         "bot_token_set": bool(BOT_TOKEN and BOT_TOKEN != 'YOUR_ACTUAL_BOT_TOKEN_HERE'),
+        "ingest_mode": Config.INGEST_MODE,
         "webhook_url_set": bool(WEBHOOK_URL),
         "webhook_configured": webhook_set,
         "bot_initialized": bot_initialized,
-        "queue_size": update_queue.qsize(),
-        "worker_thread_alive": bot_thread.is_alive() if bot_thread else False
+        "bot_ready": bot_ready.is_set(),
+        "queue_size": queue_size(),
+        "worker_thread_alive": bot_thread.is_alive() if bot_thread else False,
+        "updates": update_dispatcher.stats() if update_dispatcher else None
     })
 
 @app.route('/', methods=['GET'])
@@ -281,31 +532,165 @@ def home():
             "webhook": "/webhook (POST only)",
             "health": "/health",
             "debug": "/debug",
-            "set_webhook": "/set_webhook"
+            "metrics": "/metrics",
+            "set_webhook": "/set_webhook",
+            "short_links": "/r/<code>"
         },
         "status": "active",
         "bot_status": "initialized" if bot_initialized else "not_initialized",
         "webhook_status": "configured" if webhook_set else "not_configured"
     })
 
+def get_service_stats():
+    """Collect cache statistics from the bot services"""
+    try:
+        from bot_handlers import amazon_scraper, url_shortener, photo_file_ids
+        from amazon_links import get_short_link_resolver
+        from bot_handlers import refresh_scheduler
+        return {
+            "product_cache": amazon_scraper.cache.stats(),
+            "product_store": amazon_scraper.cache.store.stats() if amazon_scraper.cache.store is not None else None,
+            "short_url_memo": url_shortener.memo.stats(),
+            "photo_file_ids": photo_file_ids.stats(),
+            "short_links": get_short_link_resolver().stats(),
+            "refresh": refresh_scheduler.stats(),
+            "coalesced_scrapes": amazon_scraper.inflight_stats(),
+            "coalesced_shortens": url_shortener.inflight_stats(),
+            "shortener_providers": url_shortener.provider_stats(),
+            "amazon_rate_limits": amazon_scraper.rate_limiters.stats()
+        }
+    except ImportError:
+        return {}
+
 @app.route('/debug', methods=['GET'])
 def debug_info():
     """Debug endpoint"""
     return jsonify({
         "bot_initialized": bot_initialized,
         "bot_application_exists": bot_application is not None,
-        "queue_size": update_queue.qsize(),
+        "queue_size": queue_size(),
         "worker_thread_alive": bot_thread.is_alive() if bot_thread else False,
+        "updates": update_dispatcher.stats() if update_dispatcher else None,
+        "update_queue": durable_queue.stats() if durable_queue else {"backend": "memory"},
+        "leader": is_leader,
+        "ingest_mode": Config.INGEST_MODE,
+        "poller": update_poller.stats() if update_poller else None,
+        "dedup": update_deduplicator.stats(),
+        "intake": intake_stats(),
+        "logging": {"mode": Config.LOG_MODE, "format": Config.LOG_FORMAT, **log_sampler.stats()},
         "bot_token_length": len(BOT_TOKEN) if BOT_TOKEN else 0,
         "webhook_url": WEBHOOK_URL,
         "webhook_configured": webhook_set,
         "port": PORT,
-        "bot_token_valid": BOT_TOKEN != 'YOUR_ACTUAL_BOT_TOKEN_HERE'
+        "bot_token_valid": BOT_TOKEN != 'YOUR_ACTUAL_BOT_TOKEN_HERE',
+        "startup_seconds": {name: round(seconds, 3) for name, seconds in startup_timer.phases.items()},
+        "services": get_service_stats()
     })
 
+def collect_service_metrics():
+    """Expose queue, dispatcher, cache and coalescing state at scrape time"""
+    families = [
+        ("bot_update_queue_depth", "gauge", "Updates waiting in the intake queue",
+         [("bot_update_queue_depth", {}, queue_size())]),
+    ]
+    
+    intake = intake_stats()
+    families.append(("bot_updates_shed", "counter", "Updates refused with a busy reply, by priority", [
+        ("bot_updates_shed_total", {"priority": priority}, count)
+        for priority, count in intake["shed"].items()
+    ]))
+    families.append(("bot_intake_shedding", "gauge", "1 while low-priority updates are being shed",
+                     [("bot_intake_shedding", {}, int(intake["shedding"]))]))
+    families.append(("bot_update_queue_oldest_age_seconds", "gauge", "Age of the oldest queued update",
+                     [("bot_update_queue_oldest_age_seconds", {}, intake["oldest_age_seconds"] or 0)]))
+    
+    if durable_queue:
+        stats = durable_queue.stats()
+        families.append(("bot_update_queue_events", "gauge", "Shared update queue counters since start", [
+            ("bot_update_queue_events", {"event": event}, stats[event])
+            for event in ("enqueued", "duplicates", "claimed", "reclaimed", "acked", "dropped")
+        ]))
+    
+    dedup_stats = update_deduplicator.stats()
+    families.append(("bot_duplicate_updates_dropped", "counter", "Redelivered updates dropped by /webhook",
+                     [("bot_duplicate_updates_dropped_total", {}, dedup_stats["duplicates"])]))
+    families.append(("bot_dedup_index_size", "gauge", "update_ids held in the dedup index",
+                     [("bot_dedup_index_size", {}, dedup_stats["size"])]))
+    
+    if update_poller:
+        stats = update_poller.stats()
+        families.append(("bot_update_poll_events", "gauge", "getUpdates polling counters since start", [
+            ("bot_update_poll_events", {"event": event}, stats[event])
+            for event in ("polls", "empty_polls", "updates", "queued", "shed", "errors")
+        ]))
+    
+    if update_dispatcher:
+        stats = update_dispatcher.stats()
+        families.append(("bot_updates_in_flight", "gauge", "Updates accepted by the dispatcher by state", [
+            ("bot_updates_in_flight", {"state": "active"}, stats["active"]),
+            ("bot_updates_in_flight", {"state": "waiting"}, stats["waiting"]),
+        ]))
+    
+    services = get_service_stats()
+    
+    for cache_name in ("product_cache", "product_store", "short_url_memo", "photo_file_ids", "short_links", "refresh"):
+        stats = services.get(cache_name)
+        if not stats:
+            continue
+        families.append((f"bot_{cache_name}_events", "gauge", f"{cache_name} counters since start", [
+            (f"bot_{cache_name}_events", {"event": event}, value)
+            for event, value in stats.items()
+        ]))
+    
+    for name in ("coalesced_scrapes", "coalesced_shortens"):
+        stats = services.get(name)
+        if not stats:
+            continue
+        families.append((f"bot_{name}", "gauge", "Single-flight calls and coalesced requests", [
+            (f"bot_{name}", {"mode": mode, "event": event}, value)
+            for mode, counters in stats.items()
+            for event, value in counters.items()
+        ]))
+    
+    providers = services.get("shortener_providers") or {}
+    families.append(("bot_shortener_provider_state", "gauge", "1 for the current circuit state of each shortener provider", [
+        ("bot_shortener_provider_state", {"provider": name, "state": state}, int(stats["state"] == state))
+        for name, stats in providers.items()
+        for state in ("closed", "open", "half_open")
+    ]))
+    families.append(("bot_shortener_provider_events", "gauge", "Shortener provider counters since start", [
+        ("bot_shortener_provider_events", {"provider": name, "event": event}, stats[event])
+        for name, stats in providers.items()
+        for event in ("calls", "failures", "rejected", "circuit_opens", "wins", "hedges")
+    ]))
+    
+    rate_limits = services.get("amazon_rate_limits") or {}
+    families.append(("bot_amazon_request_rate", "gauge", "Current adaptive request rate per Amazon domain", [
+        ("bot_amazon_request_rate", {"domain": domain}, stats["rate"])
+        for domain, stats in rate_limits.items()
+    ]))
+    families.append(("bot_amazon_rate_limit_events", "gauge", "Amazon rate limiter counters since start", [
+        ("bot_amazon_rate_limit_events", {"domain": domain, "event": event}, stats[event])
+        for domain, stats in rate_limits.items()
+        for event in ("granted", "refused", "successes", "throttles", "waited_seconds")
+    ]))
+    
+    return families
+
+registry.add_collector(collect_service_metrics)
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics endpoint"""
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/set_webhook', methods=['POST', 'GET'])
 def manual_webhook_setup():
     """Manual webhook setup endpoint"""
+    if Config.INGEST_MODE == 'polling':
+        # A webhook would make every getUpdates call fail with a conflict
+        return jsonify({"status": "error", "message": "Polling mode, webhook not used"}), 409
+    
     try:
         result = set_telegram_webhook()
         
@@ -332,39 +717,52 @@ def start_bot_worker():
     if bot_thread is None or not bot_thread.is_alive():
         bot_thread = threading.Thread(target=bot_worker, daemon=True)
         bot_thread.start()
+        # No waiting here, updates queue up until the worker sets bot_ready
         logger.info("🚀 Bot worker thread started")
-        
-        # Wait a moment for thread to start
-        time.sleep(2)
-        
-        if bot_thread.is_alive():
-            logger.info("✅ Bot worker thread is running")
-        else:
-            logger.error("❌ Bot worker thread failed to start")
     else:
         logger.info("ℹ️ Bot worker thread already running")
 
-# Initialize when module is imported (for Gunicorn)
-logger.info("🔧 Initializing application...")
+def configure_webhook_when_ready():
+    """Set the webhook in the background once the bot worker has started"""
+    def run():
+        if not bot_startup_done.wait(Config.BOT_STARTUP_TIMEOUT):
+            logger.error(f"❌ Bot not ready after {Config.BOT_STARTUP_TIMEOUT}s, skipping webhook configuration")
+            return
+        if not bot_ready.is_set():
+            logger.error("❌ Bot failed to start, skipping webhook configuration")
+            return
+        with startup_timer.phase('webhook'):
+            set_telegram_webhook()
+        logger.info(f"⏱️ Startup timing: {startup_timer.report()}")
+    
+    threading.Thread(target=run, name="webhook-setup", daemon=True).start()
 
-# Initialize bot
-if initialize_bot():
-    logger.info("✅ Bot initialized successfully")
+# Initialize when module is imported (for Gunicorn)
+# In ASGI mode asgi.py starts the bot on uvicorn's event loop instead
+if Config.SERVER_MODE == 'asgi':
+    logger.info("🔧 ASGI mode, bot startup is handled by asgi.py")
+else:
+    logger.info("🔧 Initializing application...")
+    
+    # Only the leader process talks to setWebhook or polls getUpdates.
+    # Decided before the worker starts, it reads this to know whether to poll
+    is_leader = is_leader_process()
     
-    # Start worker thread
+    # The worker thread initializes the bot, the webhook route can queue updates meanwhile
     start_bot_worker()
     
     # Set webhook (important: do this after bot initialization)
-    if WEBHOOK_URL:
-        # Wait a bit for everything to initialize
-        time.sleep(1)
-        set_telegram_webhook()
+    if not is_leader:
+        logger.info("ℹ️ Another worker process is the leader, skipping webhook configuration")
+    elif Config.INGEST_MODE == 'polling':
+        logger.info("📡 Polling mode, the bot worker fetches updates with getUpdates instead of a webhook")
+    elif WEBHOOK_URL:
+        configure_webhook_when_ready()
     else:
         logger.warning("⚠️ WEBHOOK_URL not set, skipping webhook configuration")
-else:
-    logger.error("❌ Failed to initialize bot")
 
-logger.info("🎉 Application ready!")
+startup_timer.mark('accepting_updates')
+logger.info(f"🎉 Application ready! ({startup_timer.report()})")
 
 if __name__ == '__main__':
     logger.info(f"🚀 Flask app ready on port {PORT}")
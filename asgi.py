@@ -0,0 +1,233 @@
+"""ASGI entry point: ``uvicorn asgi:app --host 0.0.0.0 --port $PORT``
+
+The bot runs on uvicorn's event loop. ``POST /webhook`` is answered natively:
+the body is decoded once and the update goes onto the priority intake, which
+feeds the UpdateDispatcher on the same loop with no worker thread and no
+blocking queue polling. Every other route (/health, /debug, /metrics, /set_webhook,
+...) is served by the existing Flask app through a WSGI bridge.
+"""
+import os
+
+# Must be set before app/config are imported so app.py skips its thread-based startup
+os.environ['SERVER_MODE'] = 'asgi'
+
+import json
+import time
+import asyncio
+import logging
+
+from uvicorn.middleware.wsgi import WSGIMiddleware
+
+import app as bot_app
+from config import Config
+from dispatcher import UpdateDispatcher
+from intake import PriorityUpdateQueue, busy_reply, classify_update
+from http_client import close_async_client
+from log_setup import log_event
+from metrics import InstrumentedThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+flask_bridge = WSGIMiddleware(bot_app.app)
+feeder_task = None
+intake_ready = None
+
+
+async def feed_updates(intake, dispatcher, ready):
+    """Move updates from the intake queue into the dispatcher, high priority first"""
+    while True:
+        item = intake.get_nowait()
+        if item is None:
+            # Set by the webhook on this loop whenever it queues an update
+            await ready.wait()
+            ready.clear()
+            continue
+
+        enqueued_at, update_data = item
+        try:
+            await dispatcher.submit(update_data, enqueued_at)
+        finally:
+            intake.task_done()
+
+
+async def startup():
+    global feeder_task, intake_ready
+
+    logger.info("🔧 Initializing application (ASGI mode)...")
+
+    timer = bot_app.startup_timer
+    with timer.phase('bot_init'):
+        initialized = bot_app.initialize_bot()
+    if not initialized:
+        logger.error("❌ Failed to initialize bot")
+        return
+
+    with timer.phase('bot_connect'):
+        await bot_app.bot_application.initialize()
+
+    # Parsing and other blocking work runs in the default executor, size it to the concurrency limit
+    asyncio.get_running_loop().set_default_executor(InstrumentedThreadPoolExecutor(
+        max_workers=Config.MAX_CONCURRENT_UPDATES,
+        thread_name_prefix="bot-io"
+    ))
+
+    shared_queue = bot_app.durable_queue
+    intake = PriorityUpdateQueue(bot_app.intake_shedder)
+    intake_ready = asyncio.Event()
+    dispatcher = UpdateDispatcher(
+        bot_app.process_single_update,
+        max_concurrency=Config.MAX_CONCURRENT_UPDATES,
+        timeout=Config.UPDATE_TIMEOUT,
+        # The in-memory intake is marked done by feed_updates, the shared queue needs acks
+        on_done=bot_app.mark_update_done if shared_queue else None,
+        max_chat_backlog=Config.MAX_CHAT_BACKLOG
+    )
+
+    # /health, /debug and /metrics read these
+    bot_app.update_queue = intake
+    bot_app.update_dispatcher = dispatcher
+
+    if shared_queue:
+        feeder_task = asyncio.create_task(bot_app.dispatch_durable_updates(dispatcher, shared_queue))
+    else:
+        feeder_task = asyncio.create_task(feed_updates(intake, dispatcher, intake_ready))
+    bot_app.start_refresh_scheduler()
+    timer.mark('bot_ready')
+    bot_app.bot_ready.set()
+    bot_app.bot_startup_done.set()
+    logger.info(f"✅ Bot running on the ASGI event loop (max {Config.MAX_CONCURRENT_UPDATES} concurrent updates)")
+
+    bot_app.is_leader = bot_app.is_leader_process()
+    if not bot_app.is_leader:
+        logger.info("ℹ️ Another worker process is the leader, skipping webhook configuration")
+    elif Config.INGEST_MODE == 'polling':
+        # Polled updates go onto the shared queue, drained by dispatch_durable_updates
+        bot_app.start_update_poller()
+    elif bot_app.WEBHOOK_URL:
+        loop = asyncio.get_running_loop()
+        with timer.phase('webhook'):
+            await loop.run_in_executor(None, bot_app.set_telegram_webhook)
+    else:
+        logger.warning("⚠️ WEBHOOK_URL not set, skipping webhook configuration")
+
+    logger.info(f"🎉 Application ready! ({timer.report()})")
+
+
+async def shutdown():
+    await bot_app.stop_update_poller()
+    await bot_app.stop_refresh_scheduler()
+    if feeder_task:
+        feeder_task.cancel()
+    if bot_app.update_dispatcher:
+        await bot_app.update_dispatcher.join()
+    if bot_app.bot_application:
+        await bot_app.bot_application.shutdown()
+    await close_async_client()
+    logger.info("🔚 ASGI application stopped")
+
+
+async def send_json(send, status, payload):
+    body = json.dumps(payload).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+async def webhook(scope, receive, send):
+    """Handle incoming webhook from Telegram"""
+    try:
+        body = await read_body(receive)
+        try:
+            update_data = json.loads(body) if body else None
+        except ValueError:
+            update_data = None
+
+        if not update_data:
+            logger.warning("⚠️ No data received in webhook")
+            await send_json(send, 400, {"status": "error", "message": "No data received"})
+            return
+
+        if bot_app.update_dispatcher is None:
+            await send_json(send, 503, {"status": "error", "message": "Bot not initialized"})
+            return
+
+        update_id = update_data.get('update_id')
+        deduplicator = bot_app.update_deduplicator
+        loop = asyncio.get_running_loop()
+
+        # The shared index is a SQLite table, keep it and the shared queue off the event loop
+        if deduplicator.db_path:
+            duplicate = await loop.run_in_executor(None, deduplicator.is_duplicate, update_id)
+        else:
+            duplicate = deduplicator.is_duplicate(update_id)
+        if duplicate:
+            logger.info("♻️ Duplicate update %s dropped", update_id, extra=log_event('update_duplicate', update_id))
+            await send_json(send, 200, {"status": "ok", "duplicate": True})
+            return
+
+        try:
+            if bot_app.durable_queue:
+                depth = await loop.run_in_executor(None, bot_app.durable_queue.qsize)
+                accepted = bot_app.intake_shedder.admit(classify_update(update_data), depth)
+                if accepted:
+                    await loop.run_in_executor(None, bot_app.durable_queue.put, update_data)
+            else:
+                accepted = bot_app.update_queue.offer(update_data, time.monotonic())
+                if accepted:
+                    intake_ready.set()
+                    logger.debug("📋 Update %s queued. Queue size: %d", update_id, bot_app.update_queue.qsize(),
+                                 extra=log_event('update_queued', update_id))
+        except Exception:
+            # Not queued, so Telegram's retry has to get through
+            deduplicator.forget(update_id)
+            raise
+
+        if not accepted:
+            logger.warning("🚦 Over capacity, shedding update %s", update_id, extra=log_event('update_shed', update_id))
+            await send_json(send, 200, busy_reply(update_data) or {"status": "shed"})
+            return
+
+        await send_json(send, 200, {"status": "ok"})
+
+    except Exception as e:
+        logger.error("❌ Error in webhook endpoint: %s", e, exc_info=True, extra=log_event('webhook_error'))
+        await send_json(send, 500, {"status": "error", "message": str(e)})
+
+
+async def lifespan(scope, receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            try:
+                await startup()
+                await send({'type': 'lifespan.startup.complete'})
+            except Exception as e:
+                logger.error(f"💥 Startup failed: {e}")
+                await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+        elif message['type'] == 'lifespan.shutdown':
+            await shutdown()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(scope, receive, send)
+    elif scope['type'] == 'http' and scope['path'] == '/webhook' and scope['method'] == 'POST':
+        await webhook(scope, receive, send)
+    else:
+        await flask_bridge(scope, receive, send)
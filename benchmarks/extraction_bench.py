@@ -0,0 +1,223 @@
+"""Offline benchmark for AmazonScraper URL handling and page parsing.
+
+Runs ``_clean_amazon_url``, the parsing path of ``extract_product_info`` and
+``generate_affiliate_link`` against the pages in ``fixtures/``, checks the
+extracted fields against ``fixtures/expected.json`` and reports parse time,
+peak memory and throughput. Outbound connections are blocked for the whole
+run.
+
+The fixtures are synthetic: small hand-written pages, 1-4 KB each, built
+around the selectors in ``extraction.py`` (``#productTitle``,
+``#landingImage``, ``.a-price .a-offscreen`` and some of the fallbacks) with
+a bit of navbar and script around them. They are not saved Amazon pages. A real
+product page is several hundred KB with far more markup before and after
+the product fields, so absolute parse times and peak memory here are much
+lower than in production, and the ``amazon_in_large`` case, padded with
+repeated recommendation cards to about 2 MB, is only a rough stand-in for
+that size. Use the numbers to compare engines and changes against each
+other, not as production figures. To measure on real pages, save one with
+its scripts stripped into ``fixtures/`` and add an entry for it to
+``expected.json``.
+
+Peak memory is measured with tracemalloc, so it covers Python allocations
+only; libxml2's own buffers for the lxml engine are not included. The
+"stream KB" column shows how much of each page a streaming fetch reads
+before it stops.
+
+Usage (from the repository root)::
+
+    python benchmarks/extraction_bench.py
+    python benchmarks/extraction_bench.py --engine bs4 --iterations 50
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import statistics
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+sys.path.insert(0, ROOT)
+
+from amazon_scraper import AmazonScraper, EXTRACTION_ENGINES  # noqa: E402
+from page_stream import ProductFieldDetector  # noqa: E402
+from product_cache import ProductCache  # noqa: E402
+
+FIELDS = ('title', 'price', 'image_url')
+
+# Filler that looks like the review and recommendation widgets below the fold
+_FILLER_BLOCK = (
+    '<div class="a-carousel-card" role="listitem">'
+    '<a class="a-link-normal" href="/dp/B0{index:08d}/ref=pd_sim">'
+    '<img alt="" src="https://m.media-amazon.com/images/I/{index:08d}._AC_UL160_.jpg">'
+    '<div class="p13n-sc-truncate">Recommended product number {index} with a long descriptive title</div>'
+    '</a><div class="a-review-text">Great value for money, works as described. {index}</div>'
+    '<span class="a-color-price">₹{index}</span></div>\n'
+)
+
+
+def _block_network():
+    def refuse(*args, **kwargs):
+        raise RuntimeError("Network access is disabled during the benchmark")
+
+    socket.socket.connect = refuse
+    socket.socket.connect_ex = refuse
+    socket.create_connection = refuse
+
+
+def load_corpus():
+    with open(os.path.join(FIXTURES, 'expected.json'), encoding='utf-8') as f:
+        expected = json.load(f)
+
+    corpus = []
+    for name, case in expected.items():
+        with open(os.path.join(FIXTURES, case['file']), 'rb') as f:
+            content = f.read()
+
+        pad_bytes = case.get('pad_bytes')
+        if pad_bytes:
+            content = _pad_page(content, pad_bytes)
+
+        corpus.append((name, content, case))
+    return corpus
+
+
+def _pad_page(content: bytes, pad_bytes: int) -> bytes:
+    blocks = []
+    size = 0
+    index = 0
+    while size < pad_bytes:
+        block = _FILLER_BLOCK.format(index=index).encode('utf-8')
+        blocks.append(block)
+        size += len(block)
+        index += 1
+
+    head, tail = content.rsplit(b'</body>', 1)
+    return head + b''.join(blocks) + b'</body>' + tail
+
+
+def check_case(scraper, case, content, engine):
+    """Return a list of mismatches between extracted and expected values"""
+    problems = []
+
+    clean_url = scraper._clean_amazon_url(case['url'])
+    if clean_url != case['clean_url']:
+        problems.append(f"clean_url: {clean_url!r} != {case['clean_url']!r}")
+
+    affiliate_url = scraper.generate_affiliate_link(case['url'])
+    if affiliate_url != case['affiliate_url']:
+        problems.append(f"affiliate_url: {affiliate_url!r} != {case['affiliate_url']!r}")
+
+    fields = scraper.extract_fields(content, engine=engine)
+    for field in FIELDS:
+        if fields[field] != case[field]:
+            problems.append(f"{field}: {fields[field]!r} != {case[field]!r}")
+
+    return problems
+
+
+def time_parse(scraper, content, clean_url, engine, iterations):
+    scraper.engine = engine
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        scraper._parse_product_page(content, clean_url)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def peak_parse_memory(scraper, content, clean_url, engine):
+    scraper.engine = engine
+    tracemalloc.start()
+    try:
+        scraper._parse_product_page(content, clean_url)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def stream_stop_offset(content, chunk_size=16384):
+    """Bytes a streaming fetch would read before it can stop"""
+    detector = ProductFieldDetector()
+    for start in range(0, len(content), chunk_size):
+        if detector.feed(content[start:start + chunk_size]):
+            return detector.bytes_fed
+    return len(content)
+
+
+def time_url_helpers(scraper, corpus, iterations):
+    urls = [case['url'] for _, _, case in corpus]
+    calls = iterations * 100
+
+    start = time.perf_counter()
+    for _ in range(calls):
+        for url in urls:
+            scraper._clean_amazon_url(url)
+    clean_us = (time.perf_counter() - start) / (calls * len(urls)) * 1e6
+
+    start = time.perf_counter()
+    for _ in range(calls):
+        for url in urls:
+            scraper.generate_affiliate_link(url)
+    affiliate_us = (time.perf_counter() - start) / (calls * len(urls)) * 1e6
+
+    return clean_us, affiliate_us
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--engine', choices=EXTRACTION_ENGINES + ('all',), default='all')
+    parser.add_argument('--iterations', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    _block_network()
+
+    engines = EXTRACTION_ENGINES if args.engine == 'all' else (args.engine,)
+    # An in-process cache only, the benchmark must not open the shared product store
+    scraper = AmazonScraper(cache=ProductCache(store=None))
+    corpus = load_corpus()
+    failures = 0
+
+    print("Fixtures are synthetic pages, compare runs against each other, not with production timings")
+    print(f"{'page':<22} {'engine':<6} {'size KB':>9} {'mean ms':>9} {'min ms':>8} "
+          f"{'peak KB':>9} {'pages/s':>9} {'MB/s':>7} {'stream KB':>10}  check")
+
+    for engine in engines:
+        total_bytes = 0
+        total_time = 0.0
+
+        for name, content, case in corpus:
+            problems = check_case(scraper, case, content, engine)
+            failures += bool(problems)
+
+            timings = time_parse(scraper, content, case['clean_url'], engine, args.iterations)
+            peak = peak_parse_memory(scraper, content, case['clean_url'], engine)
+            mean = statistics.mean(timings)
+
+            total_bytes += len(content) * len(timings)
+            total_time += sum(timings)
+
+            print(f"{name:<22} {engine:<6} {len(content) / 1024:>9.1f} {mean * 1000:>9.2f} "
+                  f"{min(timings) * 1000:>8.2f} {peak / 1024:>9.1f} {1 / mean:>9.1f} "
+                  f"{len(content) / mean / 1e6:>7.1f} {stream_stop_offset(content) / 1024:>10.1f}  "
+                  f"{'ok' if not problems else 'FAIL'}")
+            for problem in problems:
+                print(f"    {problem}")
+
+        print(f"{'total':<22} {engine:<6} {total_bytes / len(corpus) / args.iterations / 1024:>9.1f} "
+              f"{'':>9} {'':>8} {'':>9} {len(corpus) * args.iterations / total_time:>9.1f} "
+              f"{total_bytes / total_time / 1e6:>7.1f}")
+
+    clean_us, affiliate_us = time_url_helpers(scraper, corpus, args.iterations)
+    print(f"\n_clean_amazon_url: {clean_us:.2f} us/call, generate_affiliate_link: {affiliate_us:.2f} us/call")
+
+    if failures:
+        print(f"\n{failures} page check(s) failed")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,158 @@
+"""Offline benchmark for ProductRecord encoding and the shared ProductStore.
+
+Builds a synthetic catalogue of realistic product records in a temporary
+SQLite file and reports:
+
+* encoded size and encode/decode time per record,
+* Python memory per record for ProductRecord against the plain info dict,
+  measured with tracemalloc,
+* bulk load throughput and on-disk bytes per record,
+* lookups per second for single gets, batched ``get_many`` and the
+  in-process ProductCache level, and the combined rate of several reader
+  processes sharing the same file.
+
+Usage (from the repository root)::
+
+    python benchmarks/product_store_bench.py
+    python benchmarks/product_store_bench.py --records 200000 --processes 8
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+import multiprocessing
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from product_cache import ProductCache  # noqa: E402
+from product_store import ProductRecord, ProductStore  # noqa: E402
+
+DOMAINS = ('amazon.in', 'amazon.com', 'amazon.co.uk', 'amazon.de')
+WORDS = ('boAt', 'Rockerz', 'Wireless', 'Bluetooth', 'Headphones', 'with', 'Mic', 'Noise', 'Cancelling',
+         'Echo', 'Dot', '5th', 'Gen', 'Smart', 'Speaker', 'Alexa', 'Black', 'Stainless', 'Steel', 'Bottle')
+
+
+def make_record(index, fetched_at):
+    rng = random.Random(index)
+    title = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(8, 24)))[:200]
+    price = f"₹{rng.randint(99, 99999):,}.00" if rng.random() > 0.1 else None
+    image_url = f"https://m.media-amazon.com/images/I/{rng.getrandbits(64):016x}._SL1500_.jpg"
+    return ProductRecord(DOMAINS[index % len(DOMAINS)], f"B{index:09d}", title, price, image_url, fetched_at)
+
+
+def per_call_us(fn, items, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in items:
+            fn(item)
+        best = min(best, time.perf_counter() - start)
+    return best / len(items) * 1e6
+
+
+def python_memory_per_item(build, count):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    items = [build(index) for index in range(count)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del items
+    return (after - before) / count
+
+
+def lookup_rate(lookup, keys, seconds):
+    done = 0
+    deadline = time.perf_counter() + seconds
+    start = time.perf_counter()
+    while time.perf_counter() < deadline:
+        for key in keys:
+            lookup(key)
+        done += len(keys)
+    return done / (time.perf_counter() - start)
+
+
+def reader_process(db_path, keys, seconds, results):
+    # Each process opens its own connection, the data is shared through the page cache
+    store = ProductStore(db_path)
+    results.put(lookup_rate(store.get, keys, seconds))
+    store.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--records', type=int, default=50000)
+    parser.add_argument('--lookups', type=int, default=5000, help='distinct keys looked up per round')
+    parser.add_argument('--seconds', type=float, default=2.0, help='duration of each lookup measurement')
+    parser.add_argument('--processes', type=int, default=4)
+    args = parser.parse_args(argv)
+
+    now = time.time()
+    # Fetched within the last price TTL, so the cache level serves them without going to the store
+    records = [make_record(index, now - index % 600) for index in range(args.records)]
+    sample = records[:min(len(records), 10000)]
+    encoded = [record.encode() for record in sample]
+
+    encoded_bytes = sum(len(data) for data in encoded) / len(encoded)
+    encode_us = per_call_us(ProductRecord.encode, sample)
+    decode_us = per_call_us(lambda data: ProductRecord.decode(('amazon.in', 'B000000000'), data), encoded)
+    record_memory = python_memory_per_item(lambda index: make_record(index, now), 10000)
+    dict_memory = python_memory_per_item(lambda index: make_record(index, now).to_info(), 10000)
+
+    print(f"{'record':<28} {'bytes':>10} {'us/call':>9}")
+    print(f"{'encoded size':<28} {encoded_bytes:>10.1f}")
+    print(f"{'encode':<28} {'':>10} {encode_us:>9.2f}")
+    print(f"{'decode':<28} {'':>10} {decode_us:>9.2f}")
+    print(f"{'ProductRecord in memory':<28} {record_memory:>10.1f}")
+    print(f"{'info dict in memory':<28} {dict_memory:>10.1f}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = os.path.join(directory, 'products.db')
+        store = ProductStore(db_path, max_records=args.records)
+
+        start = time.perf_counter()
+        store.bulk_load(records)
+        load_seconds = time.perf_counter() - start
+        store.checkpoint()
+        disk_bytes = os.path.getsize(db_path) / args.records
+
+        print(f"\nbulk load: {args.records / load_seconds:,.0f} records/s, "
+              f"{disk_bytes:.1f} bytes/record on disk")
+
+        rng = random.Random(0)
+        keys = [records[rng.randrange(len(records))].key for _ in range(args.lookups)]
+        batches = [keys[start:start + 100] for start in range(0, len(keys), 100)]
+
+        cache = ProductCache(max_size=args.lookups, store=store)
+        for key in keys:
+            cache.get(key)
+
+        print(f"\n{'lookup':<28} {'lookups/s':>12}")
+        print(f"{'ProductStore.get':<28} {lookup_rate(store.get, keys, args.seconds):>12,.0f}")
+        batch_rate = lookup_rate(store.get_many, batches, args.seconds) * 100
+        print(f"{'ProductStore.get_many x100':<28} {batch_rate:>12,.0f}")
+        print(f"{'ProductCache.get (in memory)':<28} {lookup_rate(cache.get, keys, args.seconds):>12,.0f}")
+        store.close()
+
+        context = multiprocessing.get_context('spawn')
+        results = context.Queue()
+        readers = [
+            context.Process(target=reader_process, args=(db_path, keys, args.seconds, results))
+            for _ in range(args.processes)
+        ]
+        for reader in readers:
+            reader.start()
+        rates = [results.get() for _ in readers]
+        for reader in readers:
+            reader.join()
+
+        print(f"{f'{args.processes} reader processes':<28} {sum(rates):>12,.0f}")
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,14 +1,42 @@
-import re
+import time
 import logging
 import asyncio
+from telegram import (
+    InlineQueryResultArticle, InlineQueryResultCachedPhoto, InlineQueryResultPhoto,
+    InputMediaPhoto, InputTextMessageContent
+)
+from telegram.error import BadRequest, TimedOut
+from amazon_links import find_links, get_short_link_resolver, is_short_link
 from amazon_scraper import AmazonScraper
+from config import Config
+from file_id_cache import FileIdCache
+from log_setup import log_event
+from metrics import STAGE_SECONDS, record_result, track_stage
+from refresh_scheduler import RefreshScheduler
 from url_shortener import URLShortener
 
 logger = logging.getLogger(__name__)
 
+# Telegram limits for a text message and for an album
+MAX_MESSAGE_LENGTH = 4096
+MAX_MEDIA_GROUP_SIZE = 10
+
+# Bad Request descriptions Telegram gives for a file_id it no longer accepts
+FILE_ID_REJECTIONS = (
+    'wrong file identifier',
+    'wrong remote file identifier',
+    'wrong padding in the string',
+    'wrong string length',
+)
+
 # Initialize services
 amazon_scraper = AmazonScraper()
 url_shortener = URLShortener()
+photo_file_ids = FileIdCache()
+refresh_scheduler = RefreshScheduler(amazon_scraper)
+
+# Links with a background cache fill running for an inline query
+inline_fills = set()
 
 async def start_handler(update, context):
     """Handle /start command"""
@@ -32,7 +60,8 @@ Type /help for more information! 🚀
 """
         
         await update.message.reply_text(welcome_message)
-        logger.info(f"Start command handled for user {update.effective_user.id}")
+        logger.info("Start command handled for user %s", update.effective_user.id,
+                    extra=log_event('command_handled', update.update_id))
         
     except Exception as e:
         logger.error(f"Error in start_handler: {e}")
@@ -67,7 +96,8 @@ Need more help? Just ask! 💬
 """
         
         await update.message.reply_text(help_message)
-        logger.info(f"Help command handled for user {update.effective_user.id}")
+        logger.info("Help command handled for user %s", update.effective_user.id,
+                    extra=log_event('command_handled', update.update_id))
         
     except Exception as e:
         logger.error(f"Error in help_handler: {e}")
@@ -82,14 +112,14 @@ async def message_handler(update, context):
         message_text = update.message.text
         user_id = update.effective_user.id
         
-        logger.info(f"Message received from user {user_id}: {message_text[:50]}...")
+        logger.info("Message received from user %s: %.50s...", user_id, message_text,
+                    extra=log_event('message_received', update.update_id))
         
-        # Check if message contains Amazon URL
-        amazon_url_pattern = r'https?://(?:www\.)?amazon\.[a-z.]{2,6}/(?:[^/]+/)?(?:dp|gp/product)/([A-Z0-9]{10})'
-        match = re.search(amazon_url_pattern, message_text)
+        # Check if message contains Amazon URLs
+        urls = extract_amazon_urls(message_text)
         
-        if match:
-            await handle_amazon_url(update, context, message_text)
+        if urls:
+            await handle_amazon_urls(update, context, urls)
         else:
             await handle_general_message(update, context, message_text)
             
@@ -100,53 +130,124 @@ async def message_handler(update, context):
         except:
             pass
 
+def extract_amazon_urls(text):
+    """Return every distinct Amazon product or short link in the text, in order"""
+    urls = []
+    seen = set()
+    
+    for link in find_links(text):
+        clean_url = None if link.short else amazon_scraper._clean_amazon_url(link.url)
+        key = amazon_scraper._cache_key(clean_url) if clean_url else link.url
+        
+        if key not in seen:
+            seen.add(key)
+            urls.append(link.url)
+    
+    if len(urls) > Config.MAX_LINKS_PER_MESSAGE:
+        logger.warning("Message has %d Amazon links, handling the first %d", len(urls), Config.MAX_LINKS_PER_MESSAGE,
+                       extra=log_event('links_truncated'))
+    
+    return urls[:Config.MAX_LINKS_PER_MESSAGE]
+
+async def resolve_product(url):
+    """Scrape product info and shorten its affiliate link, both at once"""
+    if is_short_link(url):
+        # Resolved once, after that the short link is a cache hit like any product URL
+        url = await get_short_link_resolver().resolve_async(url)
+        if not url:
+            return None
+    
+    clean_url = amazon_scraper._clean_amazon_url(url)
+    if not clean_url:
+        return None
+    
+    # Popular products are re-scraped in the background before their price expires
+    refresh_scheduler.touch(clean_url)
+    
+    # Built from the clean /dp/ASIN URL, the same key inline_result looks the short link up by
+    affiliate_url = amazon_scraper.generate_affiliate_link(clean_url)
+    
+    product_info, shortened_url = await asyncio.gather(
+        amazon_scraper.extract_product_info_async(clean_url),
+        url_shortener.shorten_url_async(affiliate_url)
+    )
+    
+    if not product_info:
+        return None
+    
+    return {'info': product_info, 'short_url': shortened_url}
+
+def format_product_message(product_info, shortened_url):
+    """Build the reply text for a single product"""
+    response_message = f"🛍️ **{product_info['title']}**\n\n"
+    
+    if product_info.get('price'):
+        response_message += f"💰 **Price:** {product_info['price']}\n\n"
+        
+    response_message += f"🔗 **Yahan hai aapka affiliate link:**\n{shortened_url}\n\n"
+    response_message += "✨ Is link se purchase karne par mujhe commission milegi! Thank you! 😊"
+    return response_message
+
+def format_product_summary(index, product_info, shortened_url):
+    """Build the short entry used when several products share one reply"""
+    summary = f"{index}. 🛍️ **{product_info['title']}**\n"
+    
+    if product_info.get('price'):
+        summary += f"💰 {product_info['price']}\n"
+        
+    summary += f"🔗 {shortened_url}"
+    return summary
+
 async def handle_amazon_url(update, context, url):
-    """Handle Amazon product URL"""
+    """Handle a single Amazon product URL"""
+    await handle_amazon_urls(update, context, [url])
+
+async def handle_amazon_urls(update, context, urls):
+    """Handle one or more Amazon product URLs from the same message"""
     try:
-        processing_msg = await update.message.reply_text("🔍 Processing kar raha hun... Wait karo! ⏳")
+        if len(urls) > 1:
+            processing_msg = await update.message.reply_text(f"🔍 {len(urls)} products process kar raha hun... Wait karo! ⏳")
+        else:
+            processing_msg = await update.message.reply_text("🔍 Processing kar raha hun... Wait karo! ⏳")
+        
+        # Resolve all links concurrently, bounded per message
+        semaphore = asyncio.Semaphore(Config.LINK_CONCURRENCY)
+        
+        async def resolve_limited(url):
+            async with semaphore:
+                start = time.perf_counter()
+                product = None
+                try:
+                    product = await resolve_product(url)
+                    return product
+                finally:
+                    STAGE_SECONDS.observe(time.perf_counter() - start, stage='amazon_link')
+                    record_result('amazon_link', 'success' if product else 'failure')
         
-        # Extract product information (run in thread to avoid blocking)
-        loop = asyncio.get_event_loop()
-        product_info = await loop.run_in_executor(None, amazon_scraper.extract_product_info, url)
+        results = await asyncio.gather(*(resolve_limited(url) for url in urls), return_exceptions=True)
         
-        if not product_info:
+        products = []
+        for url, result in zip(urls, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error resolving {url}: {result}")
+            elif result:
+                products.append(result)
+        
+        if not products:
             await processing_msg.edit_text(
                 "😔 Sorry! Product information extract nahi kar paya.\n"
                 "Kya aap sure hain ki ye valid Amazon product link hai? 🤔"
             )
             return
         
-        # Generate affiliate link
-        affiliate_url = amazon_scraper.generate_affiliate_link(url)
-        
-        # Shorten the affiliate link (run in thread)
-        shortened_url = await loop.run_in_executor(None, url_shortener.shorten_url, affiliate_url)
-        
-        # Prepare response message
-        response_message = f"🛍️ **{product_info['title']}**\n\n"
-        
-        if product_info.get('price'):
-            response_message += f"💰 **Price:** {product_info['price']}\n\n"
+        with track_stage('telegram_send', timeout_types=(TimedOut,)):
+            if len(urls) == 1:
+                await send_single_product(update, processing_msg, products[0])
+            else:
+                await send_product_batch(update, processing_msg, products, failed=len(urls) - len(products))
             
-        response_message += f"🔗 **Yahan hai aapka affiliate link:**\n{shortened_url}\n\n"
-        response_message += "✨ Is link se purchase karne par mujhe commission milegi! Thank you! 😊"
-        
-        # Send product image if available
-        if product_info.get('image_url'):
-            try:
-                await update.message.reply_photo(
-                    photo=product_info['image_url'],
-                    caption=response_message,
-                    parse_mode='Markdown'
-                )
-                await processing_msg.delete()
-            except Exception as e:
-                logger.error(f"Error sending image: {e}")
-                await processing_msg.edit_text(response_message, parse_mode='Markdown')
-        else:
-            await processing_msg.edit_text(response_message, parse_mode='Markdown')
-            
-        logger.info(f"Successfully processed Amazon URL for user {update.effective_user.id}")
+        logger.info("Successfully processed %d/%d Amazon URLs for user %s", len(products), len(urls),
+                    update.effective_user.id, extra=log_event('links_processed', update.update_id))
         
     except Exception as e:
         logger.error(f"Error handling Amazon URL: {e}")
@@ -158,6 +259,243 @@ async def handle_amazon_url(update, context, url):
         except:
             pass
 
+async def send_single_product(update, processing_msg, product):
+    """Reply with one product, as a photo when an image is available"""
+    product_info = product['info']
+    response_message = format_product_message(product_info, product['short_url'])
+    
+    # Send product image if available
+    if product_info.get('image_url'):
+        try:
+            await send_product_photo(update, product_info, response_message)
+            await processing_msg.delete()
+        except Exception as e:
+            logger.error(f"Error sending image: {e}")
+            await processing_msg.edit_text(response_message, parse_mode='Markdown')
+    else:
+        await processing_msg.edit_text(response_message, parse_mode='Markdown')
+
+async def send_product_batch(update, processing_msg, products, failed=0):
+    """Reply with several products in one round trip"""
+    failure_note = f"\n\n⚠️ {failed} link(s) process nahi ho paye." if failed else ""
+    
+    # One album when every product has an image
+    album_fits = 2 <= len(products) <= MAX_MEDIA_GROUP_SIZE
+    if album_fits and all(product['info'].get('image_url') for product in products):
+        try:
+            await send_product_album(update, products)
+            
+            if failed:
+                await processing_msg.edit_text(failure_note.strip())
+            else:
+                await processing_msg.delete()
+            return
+        except Exception as e:
+            logger.error(f"Error sending media group: {e}")
+    
+    # Otherwise combined text messages, as few as the length limit allows
+    entries = [
+        format_product_summary(index, product['info'], product['short_url'])
+        for index, product in enumerate(products, start=1)
+    ]
+    entries.append("✨ In links se purchase karne par mujhe commission milegi! Thank you! 😊" + failure_note)
+    messages = pack_message_entries(entries)
+    
+    await processing_msg.edit_text(messages[0], parse_mode='Markdown')
+    for message in messages[1:]:
+        await update.message.reply_text(message, parse_mode='Markdown')
+
+def telegram_length(text):
+    """Length as Telegram counts it, in UTF-16 code units"""
+    return len(text.encode('utf-16-le')) // 2
+
+def pack_message_entries(entries, separator="\n\n", limit=MAX_MESSAGE_LENGTH):
+    """Join whole entries into messages of at most ``limit``, never splitting an entry and its Markdown"""
+    messages = []
+    current = None
+    for entry in entries:
+        if current is not None and telegram_length(current) + telegram_length(separator + entry) <= limit:
+            current += separator + entry
+            continue
+        if current is not None:
+            messages.append(current)
+        current = entry
+    if current is not None:
+        messages.append(current)
+    return messages
+
+def product_asin(product_info):
+    """ASIN of a scraped product, from its cleaned URL"""
+    return amazon_scraper._cache_key(product_info['url'])[1]
+
+def is_file_id_rejection(error):
+    """True if Telegram refused the cached file_id itself, not the upload, size or caption"""
+    message = str(error).lower()
+    return any(reason in message for reason in FILE_ID_REJECTIONS)
+
+def remember_photo(product_info, message, sent_file_id=None):
+    """Cache the file_id Telegram assigned to a product photo we sent"""
+    if message is None or not message.photo:
+        return
+    file_id = message.photo[-1].file_id
+    if file_id != sent_file_id:
+        photo_file_ids.put(product_asin(product_info), product_info['image_url'], file_id)
+
+async def send_product_photo(update, product_info, caption):
+    """Send a product photo, by cached file_id when Telegram already has it"""
+    asin = product_asin(product_info)
+    file_id = await photo_file_ids.get_async(asin, product_info['image_url'])
+    
+    if file_id:
+        try:
+            return await update.message.reply_photo(photo=file_id, caption=caption, parse_mode='Markdown')
+        except BadRequest as e:
+            if not is_file_id_rejection(e):
+                raise
+            photo_file_ids.reject(asin)
+    
+    message = await update.message.reply_photo(
+        photo=product_info['image_url'],
+        caption=caption,
+        parse_mode='Markdown'
+    )
+    remember_photo(product_info, message)
+    return message
+
+async def send_product_album(update, products):
+    """Send several products as one album, reusing cached file_ids"""
+    file_ids = await asyncio.gather(*(
+        photo_file_ids.get_async(product_asin(product['info']), product['info']['image_url']) for product in products
+    ))
+    
+    def build_media(file_ids):
+        return [
+            InputMediaPhoto(
+                media=file_id or product['info']['image_url'],
+                caption=format_product_message(product['info'], product['short_url']),
+                parse_mode='Markdown'
+            )
+            for product, file_id in zip(products, file_ids)
+        ]
+    
+    try:
+        messages = await update.message.reply_media_group(media=build_media(file_ids))
+    except BadRequest as e:
+        if not any(file_ids) or not is_file_id_rejection(e):
+            raise
+        # Telegram does not say which item it refused, drop every cached id used here
+        for product, file_id in zip(products, file_ids):
+            if file_id:
+                photo_file_ids.reject(product_asin(product['info']))
+        file_ids = [None] * len(products)
+        messages = await update.message.reply_media_group(media=build_media(file_ids))
+    
+    for product, message, file_id in zip(products, messages, file_ids):
+        remember_photo(product['info'], message, file_id)
+    return messages
+
+async def inline_query_handler(update, context):
+    """Answer @bot <amazon link> straight from the caches, filling them in the background on a miss"""
+    query = update.inline_query
+    try:
+        urls = extract_amazon_urls(query.query)
+        if not urls:
+            await query.answer([], cache_time=Config.INLINE_CACHE_TIME)
+            return
+        
+        results = {}
+        complete = True
+        for url in urls:
+            result = inline_result(url)
+            if result is None:
+                complete = False
+                result = provisional_inline_result(url)
+                fill_inline_cache(context, url)
+            # A short link and a product link can name the same product
+            results.setdefault(result.id, result)
+        
+        # Provisional answers must not be cached by Telegram, the next keystroke should get the real one
+        await query.answer(list(results.values()), cache_time=Config.INLINE_CACHE_TIME if complete else 0, is_personal=False)
+        record_result('inline_query', 'cached' if complete else 'provisional')
+        
+    except Exception as e:
+        logger.error(f"Error in inline_query_handler: {e}")
+
+def inline_product_url(url):
+    """Clean product URL for a link, None for a short link we have not resolved yet"""
+    if is_short_link(url):
+        return get_short_link_resolver().cached(url)
+    return amazon_scraper._clean_amazon_url(url)
+
+def inline_result(url):
+    """A finished inline result built only from cached data, None if anything is missing"""
+    product_url = inline_product_url(url)
+    if not product_url:
+        return None
+    
+    product_info = amazon_scraper.cached_product_info(product_url)
+    shortened_url = url_shortener.memoized(amazon_scraper.generate_affiliate_link(product_url))
+    if not product_info or not shortened_url:
+        return None
+    
+    refresh_scheduler.touch(product_url)
+    asin = product_asin(product_info)
+    caption = format_product_message(product_info, shortened_url)
+    image_url = product_info.get('image_url')
+    
+    if image_url:
+        file_id = photo_file_ids.cached(asin, image_url)
+        if file_id:
+            return InlineQueryResultCachedPhoto(
+                id=f"{asin}:c", photo_file_id=file_id, title=product_info['title'],
+                caption=caption, parse_mode='Markdown'
+            )
+        return InlineQueryResultPhoto(
+            id=f"{asin}:p", photo_url=image_url, thumbnail_url=image_url, title=product_info['title'],
+            caption=caption, parse_mode='Markdown'
+        )
+    
+    return InlineQueryResultArticle(
+        id=f"{asin}:a", title=product_info['title'], description=product_info.get('price') or shortened_url,
+        input_message_content=InputTextMessageContent(caption, parse_mode='Markdown')
+    )
+
+def provisional_inline_result(url):
+    """Answer for a product we know nothing about yet: its affiliate link, details follow on the next query"""
+    product_url = inline_product_url(url)
+    if product_url:
+        affiliate_url = amazon_scraper.generate_affiliate_link(product_url)
+        link = url_shortener.memoized(affiliate_url) or affiliate_url
+    else:
+        # Not resolved yet, so there is no affiliate link to give, share the original link for now
+        link = url
+    
+    return InlineQueryResultArticle(
+        id=f"pending:{abs(hash(url)) % 10 ** 12}",
+        title="🔍 Product details aa rahe hain...",
+        description="Thodi der mein dobara type karo, ya abhi affiliate link bhejo",
+        input_message_content=InputTextMessageContent(
+            f"🛍️ Amazon product\n\n🔗 **Yahan hai aapka affiliate link:**\n{link}",
+            parse_mode='Markdown'
+        )
+    )
+
+def fill_inline_cache(context, url):
+    """Scrape and shorten a product in the background so the next inline query is a cache hit"""
+    if url in inline_fills:
+        return
+    inline_fills.add(url)
+    
+    async def fill():
+        try:
+            await resolve_product(url)
+        except Exception as e:
+            logger.error(f"Error filling inline cache for {url}: {e}")
+        finally:
+            inline_fills.discard(url)
+    
+    context.application.create_task(fill())
+
 async def handle_general_message(update, context, message):
     """Handle general conversation"""
     try:
@@ -175,7 +513,8 @@ async def handle_general_message(update, context, message):
             response = "Main sirf Amazon product links handle karta hun! 🛒\n\nKoi Amazon product ka link bhejo jaise:\n• amazon.in/dp/PRODUCT_ID\n\nMain image aur affiliate link banake dunga! 😊"
             
         await update.message.reply_text(response)
-        logger.info(f"General message handled for user {update.effective_user.id}")
+        logger.info("General message handled for user %s", update.effective_user.id,
+                    extra=log_event('general_message', update.update_id))
         
     except Exception as e:
         logger.error(f"Error in handle_general_message: {e}")
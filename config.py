@@ -8,3 +8,144 @@ class Config:
     DEBUG = os.getenv('FLASK_DEBUG', 'False').lower() == 'true'
     AFFILIATE_TAG = "budgetlooks08-21"
     REQUEST_TIMEOUT = 10
+
+    # 'wsgi' (Flask + worker thread, default) or 'asgi' (uvicorn asgi:app)
+    SERVER_MODE = os.getenv('SERVER_MODE', 'wsgi').lower()
+
+    # Update processing
+    MAX_CONCURRENT_UPDATES = int(os.getenv('MAX_CONCURRENT_UPDATES', 32))
+    UPDATE_TIMEOUT = float(os.getenv('UPDATE_TIMEOUT', 30))
+    # Updates a chat may queue behind its running one, they hold no concurrency slot while they wait
+    MAX_CHAT_BACKLOG = int(os.getenv('MAX_CHAT_BACKLOG', 100))
+
+    # Product info cache
+    PRODUCT_CACHE_SIZE = int(os.getenv('PRODUCT_CACHE_SIZE', 5000))
+    PRODUCT_CACHE_TTL = float(os.getenv('PRODUCT_CACHE_TTL', 6 * 3600))
+    PRICE_CACHE_TTL = float(os.getenv('PRICE_CACHE_TTL', 900))
+    # Second level shared by all worker processes on the host, set PRODUCT_STORE_PATH empty to disable
+    PRODUCT_STORE_PATH = os.getenv('PRODUCT_STORE_PATH', 'data/products.db')
+    PRODUCT_STORE_MAX_RECORDS = int(os.getenv('PRODUCT_STORE_MAX_RECORDS', 100000))
+    PRODUCT_STORE_MMAP_BYTES = int(os.getenv('PRODUCT_STORE_MMAP_BYTES', 64 * 1024 * 1024))
+
+    # Shortened URL memo
+    SHORT_URL_DB_PATH = os.getenv('SHORT_URL_DB_PATH', 'data/short_urls.db')
+    SHORT_URL_CACHE_SIZE = int(os.getenv('SHORT_URL_CACHE_SIZE', 10000))
+
+    # Outbound HTTP
+    HTTP_POOL_HOSTS = int(os.getenv('HTTP_POOL_HOSTS', 10))
+    HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', 32))
+    HTTP_KEEPALIVE_EXPIRY = float(os.getenv('HTTP_KEEPALIVE_EXPIRY', 60))
+    HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', 5))
+    HTTP_TIMEOUT = float(os.getenv('HTTP_TIMEOUT', 15))
+    AMAZON_TIMEOUT = float(os.getenv('AMAZON_TIMEOUT', 15))
+    TINYURL_TIMEOUT = float(os.getenv('TINYURL_TIMEOUT', 10))
+    ISGD_TIMEOUT = float(os.getenv('ISGD_TIMEOUT', 5))
+
+    # Stop downloading product pages once title, price and image are found
+    STREAMING_FETCH = os.getenv('STREAMING_FETCH', 'True').lower() == 'true'
+    STREAM_CHUNK_SIZE = int(os.getenv('STREAM_CHUNK_SIZE', 16384))
+
+    # Product page parser: 'lxml' (compiled selectors) or 'bs4' (BeautifulSoup)
+    EXTRACTION_ENGINE = os.getenv('EXTRACTION_ENGINE', 'lxml')
+
+    # Messages with several Amazon links
+    MAX_LINKS_PER_MESSAGE = int(os.getenv('MAX_LINKS_PER_MESSAGE', 10))
+    LINK_CONCURRENCY = int(os.getenv('LINK_CONCURRENCY', 5))
+
+    # Update queue: 'memory' (per process) or 'sqlite' (shared by all worker processes on the host)
+    UPDATE_QUEUE_BACKEND = os.getenv('UPDATE_QUEUE_BACKEND', 'memory').lower()
+    UPDATE_QUEUE_DB_PATH = os.getenv('UPDATE_QUEUE_DB_PATH', 'data/update_queue.db')
+    UPDATE_LEASE_SECONDS = float(os.getenv('UPDATE_LEASE_SECONDS', UPDATE_TIMEOUT + 30))
+    UPDATE_MAX_ATTEMPTS = int(os.getenv('UPDATE_MAX_ATTEMPTS', 3))
+    UPDATE_QUEUE_POLL_INTERVAL = float(os.getenv('UPDATE_QUEUE_POLL_INTERVAL', 0.25))
+    LEADER_LOCK_PATH = os.getenv('LEADER_LOCK_PATH', 'data/leader.lock')
+
+    # Drop redelivered updates: ids seen within the window are ignored by /webhook.
+    # Shared through the update queue's SQLite file when UPDATE_DEDUP_SHARED is on
+    UPDATE_DEDUP_WINDOW = float(os.getenv('UPDATE_DEDUP_WINDOW', 24 * 3600))
+    UPDATE_DEDUP_MAX_ENTRIES = int(os.getenv('UPDATE_DEDUP_MAX_ENTRIES', 100000))
+    UPDATE_DEDUP_SHARED = os.getenv('UPDATE_DEDUP_SHARED', str(UPDATE_QUEUE_BACKEND == 'sqlite')).lower() == 'true'
+
+    # Intake backpressure: above the high watermark Amazon-link updates get a busy reply
+    # until the backlog is back at the low watermark, everything is shed at the max size
+    UPDATE_QUEUE_MAX_SIZE = int(os.getenv('UPDATE_QUEUE_MAX_SIZE', 500))
+    UPDATE_QUEUE_HIGH_WATERMARK = int(os.getenv('UPDATE_QUEUE_HIGH_WATERMARK', 200))
+    UPDATE_QUEUE_LOW_WATERMARK = int(os.getenv('UPDATE_QUEUE_LOW_WATERMARK', 100))
+
+    # Telegram file_ids of product photos, reused instead of re-sending the image URL
+    FILE_ID_DB_PATH = os.getenv('FILE_ID_DB_PATH', 'data/file_ids.db')
+    FILE_ID_CACHE_SIZE = int(os.getenv('FILE_ID_CACHE_SIZE', 5000))
+    FILE_ID_MAX_ROWS = int(os.getenv('FILE_ID_MAX_ROWS', 50000))
+
+    # Shortener providers, tried in this order. The API URLs can point at local stand-ins
+    SHORTENER_PROVIDERS = [name.strip() for name in os.getenv('SHORTENER_PROVIDERS', 'tinyurl,isgd').split(',') if name.strip()]
+    TINYURL_API_URL = os.getenv('TINYURL_API_URL', 'http://tinyurl.com/api-create.php')
+    ISGD_API_URL = os.getenv('ISGD_API_URL', 'https://is.gd/create.php')
+    # Hedge to the next provider after the current one's p95 latency, or this many seconds until it has history
+    SHORTENER_HEDGE_DELAY = float(os.getenv('SHORTENER_HEDGE_DELAY', 1.0))
+    SHORTENER_HEALTH_WINDOW = int(os.getenv('SHORTENER_HEALTH_WINDOW', 50))
+    SHORTENER_FAILURE_THRESHOLD = int(os.getenv('SHORTENER_FAILURE_THRESHOLD', 5))
+    SHORTENER_CIRCUIT_COOLDOWN = float(os.getenv('SHORTENER_CIRCUIT_COOLDOWN', 30))
+
+    # Self-hosted shortener, enable by adding 'local' to SHORTENER_PROVIDERS.
+    # Links look like <base url>/<code>, the base defaults to WEBHOOK_URL + /r
+    # LOCAL_SHORTENER_CACHE_SIZE bounds the links kept in memory, the rest are read from the database
+    LOCAL_SHORTENER_DB_PATH = os.getenv('LOCAL_SHORTENER_DB_PATH', 'data/short_links.db')
+    LOCAL_SHORTENER_BASE_URL = os.getenv('LOCAL_SHORTENER_BASE_URL', '')
+    LOCAL_SHORTENER_CACHE_SIZE = int(os.getenv('LOCAL_SHORTENER_CACHE_SIZE', 10000))
+
+    # How long webhook setup waits for the bot worker to come up
+    BOT_STARTUP_TIMEOUT = float(os.getenv('BOT_STARTUP_TIMEOUT', 60))
+
+    # Logging: 'async' hands records to a background writer thread, 'sync' writes on the calling thread.
+    # LOG_FORMAT 'json' writes one object per line with the update_id of hot-path records.
+    # LOG_SAMPLE_EVERY keeps every Nth record of an event type ("update_received=10,queue_idle=0"), 0 drops them
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'DEBUG')
+    LOG_MODE = os.getenv('LOG_MODE', 'async')
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')
+    LOG_SAMPLE_EVERY = os.getenv('LOG_SAMPLE_EVERY', 'queue_idle=100')
+
+    # amzn.to / a.co short links: resolved targets are remembered, redirects are followed within Amazon only
+    SHORT_LINK_DB_PATH = os.getenv('SHORT_LINK_DB_PATH', 'data/short_link_targets.db')
+    SHORT_LINK_CACHE_SIZE = int(os.getenv('SHORT_LINK_CACHE_SIZE', 10000))
+    SHORT_LINK_MAX_ROWS = int(os.getenv('SHORT_LINK_MAX_ROWS', 200000))
+    SHORT_LINK_TIMEOUT = float(os.getenv('SHORT_LINK_TIMEOUT', 5))
+    SHORT_LINK_MAX_REDIRECTS = int(os.getenv('SHORT_LINK_MAX_REDIRECTS', 3))
+
+    # Re-scrape popular products before their price expires. Popularity halves every REFRESH_HALF_LIFE seconds,
+    # products scoring below REFRESH_MIN_SCORE are left to expire. The budget is per worker process
+    REFRESH_ENABLED = os.getenv('REFRESH_ENABLED', 'true').lower() == 'true'
+    REFRESH_BUDGET_PER_MINUTE = float(os.getenv('REFRESH_BUDGET_PER_MINUTE', 30))
+    REFRESH_LEAD_SECONDS = float(os.getenv('REFRESH_LEAD_SECONDS', 120))
+    REFRESH_HOT_SIZE = int(os.getenv('REFRESH_HOT_SIZE', 300))
+    REFRESH_MIN_SCORE = float(os.getenv('REFRESH_MIN_SCORE', 2))
+    REFRESH_HALF_LIFE = float(os.getenv('REFRESH_HALF_LIFE', 3600))
+    REFRESH_INTERVAL = float(os.getenv('REFRESH_INTERVAL', 5))
+    REFRESH_MAX_TRACKED = int(os.getenv('REFRESH_MAX_TRACKED', 5000))
+
+    # Amazon request pacing per storefront: the rate (requests/s) starts at AMAZON_RATE, climbs on success and
+    # halves whenever Amazon throttles us (429, 503, captcha page). Throttled and transient failures are retried
+    # with jittered backoff for up to AMAZON_MAX_ATTEMPTS attempts, all within AMAZON_FETCH_DEADLINE seconds and never
+    # later than AMAZON_REPLY_RESERVE seconds before the update's own UPDATE_TIMEOUT runs out, so there is time to reply
+    AMAZON_RATE = float(os.getenv('AMAZON_RATE', 2))
+    AMAZON_RATE_BURST = float(os.getenv('AMAZON_RATE_BURST', 5))
+    AMAZON_RATE_MIN = float(os.getenv('AMAZON_RATE_MIN', 0.2))
+    AMAZON_RATE_MAX = float(os.getenv('AMAZON_RATE_MAX', 10))
+    AMAZON_MAX_ATTEMPTS = int(os.getenv('AMAZON_MAX_ATTEMPTS', 4))
+    AMAZON_RETRY_BASE = float(os.getenv('AMAZON_RETRY_BASE', 0.5))
+    AMAZON_RETRY_CAP = float(os.getenv('AMAZON_RETRY_CAP', 8))
+    AMAZON_REPLY_RESERVE = float(os.getenv('AMAZON_REPLY_RESERVE', 5))
+    AMAZON_FETCH_DEADLINE = float(os.getenv('AMAZON_FETCH_DEADLINE', max(UPDATE_TIMEOUT - AMAZON_REPLY_RESERVE, 1)))
+
+    # Seconds Telegram may cache a complete inline answer, provisional answers are never cached
+    INLINE_CACHE_TIME = int(os.getenv('INLINE_CACHE_TIME', 300))
+
+    # How updates arrive: 'webhook' (Telegram POSTs to /webhook) or 'polling' (long-polling getUpdates, for hosts
+    # Telegram cannot reach). In polling mode the webhook is removed at startup and only the leader process polls,
+    # up to POLL_LIMIT (max 100) updates per call. Polled updates always go through the sqlite update queue,
+    # whatever UPDATE_QUEUE_BACKEND says, and POLL_OFFSET_PATH keeps the next offset across restarts
+    INGEST_MODE = os.getenv('INGEST_MODE', 'webhook').lower()
+    POLL_LIMIT = int(os.getenv('POLL_LIMIT', 100))
+    POLL_TIMEOUT = int(os.getenv('POLL_TIMEOUT', 50))
+    POLL_RETRY_CAP = float(os.getenv('POLL_RETRY_CAP', 30))
+    POLL_OFFSET_PATH = os.getenv('POLL_OFFSET_PATH', 'data/poll_offset')
@@ -0,0 +1,136 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateDeduplicator:
+    """Remember recently seen ``update_id`` values to drop Telegram redeliveries.
+
+    Entries are kept for ``window`` seconds and at most ``max_entries`` of them
+    are kept. Without ``db_path`` the index lives in this process only. With
+    ``db_path`` it is a SQLite table that every worker process on the host
+    shares, so a retry that lands on a different worker is caught as well.
+    """
+
+    def __init__(self, window: float = 86400.0, max_entries: int = 100000,
+                 db_path: Optional[str] = None, prune_every: int = 500):
+        self.window = window
+        self.max_entries = max(1, max_entries)
+        self.db_path = db_path
+        self.prune_every = max(1, prune_every)
+
+        self._seen: "OrderedDict[int, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._inserts_since_prune = 0
+
+        self.checked = 0
+        self.duplicates = 0
+
+        self._conn = None
+        if db_path:
+            directory = os.path.dirname(db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS seen_updates (update_id INTEGER PRIMARY KEY, seen_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS seen_updates_seen_at ON seen_updates (seen_at)")
+
+    def is_duplicate(self, update_id: Any) -> bool:
+        """Record ``update_id`` and return True if it was already seen in the window.
+
+        Updates without an integer id are never treated as duplicates.
+        """
+        if not isinstance(update_id, int):
+            return False
+
+        now = time.time()
+        with self._lock:
+            self.checked += 1
+            if self._conn is not None:
+                duplicate = self._check_shared(update_id, now)
+            else:
+                duplicate = self._check_local(update_id, now)
+            if duplicate:
+                self.duplicates += 1
+            return duplicate
+
+    def forget(self, update_id: Any) -> None:
+        """Drop an id again, for updates that were recorded but could not be queued"""
+        if not isinstance(update_id, int):
+            return
+        with self._lock:
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM seen_updates WHERE update_id = ?", (update_id,))
+            else:
+                self._seen.pop(update_id, None)
+
+    def size(self) -> int:
+        with self._lock:
+            if self._conn is not None:
+                return self._conn.execute("SELECT COUNT(*) FROM seen_updates").fetchone()[0]
+            return len(self._seen)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "sqlite" if self._conn is not None else "memory",
+            "size": self.size(),
+            "window_seconds": self.window,
+            "checked": self.checked,
+            "duplicates": self.duplicates,
+        }
+
+    def _check_local(self, update_id: int, now: float) -> bool:
+        """Caller holds the lock"""
+        cutoff = now - self.window
+        while self._seen:
+            oldest_id, seen_at = next(iter(self._seen.items()))
+            if seen_at >= cutoff and len(self._seen) < self.max_entries:
+                break
+            del self._seen[oldest_id]
+
+        if update_id in self._seen:
+            return True
+        self._seen[update_id] = now
+        return False
+
+    def _check_shared(self, update_id: int, now: float) -> bool:
+        """Caller holds the lock"""
+        cursor = self._conn.execute(
+            "INSERT OR IGNORE INTO seen_updates (update_id, seen_at) VALUES (?, ?)", (update_id, now)
+        )
+        if cursor.rowcount == 0:
+            # Already there, but it only counts if it is still inside the window
+            seen_at = self._conn.execute(
+                "SELECT seen_at FROM seen_updates WHERE update_id = ?", (update_id,)
+            ).fetchone()[0]
+            if seen_at >= now - self.window:
+                return True
+            self._conn.execute("UPDATE seen_updates SET seen_at = ? WHERE update_id = ?", (now, update_id))
+            return False
+
+        self._inserts_since_prune += 1
+        if self._inserts_since_prune >= self.prune_every:
+            self._inserts_since_prune = 0
+            self._prune_shared(now)
+        return False
+
+    def _prune_shared(self, now: float) -> None:
+        try:
+            self._conn.execute("DELETE FROM seen_updates WHERE seen_at < ?", (now - self.window,))
+            self._conn.execute(
+                "DELETE FROM seen_updates WHERE update_id IN ("
+                "SELECT update_id FROM seen_updates ORDER BY seen_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+        except sqlite3.Error as e:
+            logger.error(f"Error pruning seen updates: {e}")
@@ -0,0 +1,210 @@
+import time
+import asyncio
+import logging
+import contextvars
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Set, Tuple
+from log_setup import current_update_id, log_event
+from metrics import STAGE_SECONDS, record_result
+
+logger = logging.getLogger(__name__)
+
+# time.monotonic() by which the update handled by the current task is cancelled, None outside the dispatcher
+update_deadline: contextvars.ContextVar = contextvars.ContextVar('update_deadline', default=None)
+
+
+def get_chat_key(update_data: Dict[str, Any]) -> Optional[int]:
+    """Return the chat id an update belongs to, or None if it has no chat"""
+    for field in ('message', 'edited_message', 'channel_post', 'edited_channel_post'):
+        payload = update_data.get(field)
+        if isinstance(payload, dict) and isinstance(payload.get('chat'), dict):
+            return payload['chat'].get('id')
+
+    callback_query = update_data.get('callback_query')
+    if isinstance(callback_query, dict):
+        message = callback_query.get('message')
+        if isinstance(message, dict) and isinstance(message.get('chat'), dict):
+            return message['chat'].get('id')
+
+    return None
+
+
+class UpdateDispatcher:
+    """Run updates concurrently on one event loop while keeping per-chat order.
+
+    At most ``max_concurrency`` updates run at a time. Updates that belong to
+    the same chat are chained and handled one after another, updates from
+    different chats run in parallel.
+
+    A slot is only taken when an update starts, so updates queued behind
+    their own chat hold none and one busy chat cannot crowd the others out.
+    Instead each chat may queue up to ``max_chat_backlog`` updates, ``submit``
+    waits beyond that, which holds up the feed only for a chat flooding us.
+    """
+
+    def __init__(self,
+                 process_update: Callable[[Dict[str, Any]], Awaitable[bool]],
+                 max_concurrency: int = 32,
+                 timeout: float = 30.0,
+                 on_done: Optional[Callable[[Dict[str, Any], bool], None]] = None,
+                 max_chat_backlog: int = 100):
+        self.process_update = process_update
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_chat_backlog = max(1, max_chat_backlog)
+        self.timeout = timeout
+        self.on_done = on_done
+
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        self._held_slots = 0
+        self._chat_backlogs: Dict[int, Deque[Tuple[Dict[str, Any], float]]] = {}
+        self._backlog_changed = asyncio.Condition()
+        self._tasks: Set[asyncio.Task] = set()
+
+        self.processed_count = 0
+        self.failed_count = 0
+        self.timeout_count = 0
+        self.active_count = 0
+
+    async def submit(self, update_data: Dict[str, Any], enqueued_at: Optional[float] = None) -> None:
+        """Schedule the update, waiting only while it could not be started or queued.
+
+        ``enqueued_at`` is the ``time.monotonic()`` value from when the update
+        arrived, used to report how long it waited before processing started.
+        """
+        if enqueued_at is None:
+            enqueued_at = time.monotonic()
+
+        chat_key = get_chat_key(update_data)
+        if chat_key is None:
+            await self._acquire()
+            self._spawn(self._run_unordered(update_data, enqueued_at))
+            return
+
+        while True:
+            backlog = self._chat_backlogs.get(chat_key)
+            if backlog is None:
+                # Nothing from this chat is in flight, the update starts right away and needs a slot
+                await self._acquire()
+                if chat_key not in self._chat_backlogs:
+                    break
+                self._release()
+                continue
+
+            if len(backlog) < self.max_chat_backlog:
+                # An update from this chat is already running, queue behind it without a slot
+                backlog.append((update_data, enqueued_at))
+                return
+
+            async with self._backlog_changed:
+                await self._backlog_changed.wait_for(
+                    lambda: len(self._chat_backlogs.get(chat_key, ())) < self.max_chat_backlog)
+
+        self._chat_backlogs[chat_key] = deque([(update_data, enqueued_at)])
+        self._spawn(self._drain_chat(chat_key))
+
+    async def join(self) -> None:
+        """Wait until every accepted update has finished"""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    def free_slots(self) -> int:
+        """How many more updates can be started without waiting"""
+        return self.max_concurrency - self._held_slots
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "processed": self.processed_count,
+            "failed": self.failed_count,
+            "timeouts": self.timeout_count,
+            "active": self.active_count,
+            "waiting": sum(len(backlog) for backlog in self._chat_backlogs.values()),
+            "busy_chats": len(self._chat_backlogs),
+            "max_concurrency": self.max_concurrency,
+        }
+
+    def _spawn(self, coro) -> None:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _acquire(self) -> None:
+        await self._slots.acquire()
+        self._held_slots += 1
+
+    def _release(self) -> None:
+        self._held_slots -= 1
+        self._slots.release()
+
+    async def _drain_chat(self, chat_key: int) -> None:
+        """Run a chat's updates in order, ``submit`` already took the slot for the first one"""
+        backlog = self._chat_backlogs[chat_key]
+        has_slot = True
+        try:
+            while backlog:
+                if not has_slot:
+                    await self._acquire()
+                    has_slot = True
+                update_data, enqueued_at = backlog.popleft()
+                await self._notify_backlog_changed()
+                try:
+                    await self._run_one(update_data, enqueued_at)
+                finally:
+                    self._release()
+                    has_slot = False
+        finally:
+            if has_slot:
+                self._release()
+            del self._chat_backlogs[chat_key]
+            await self._notify_backlog_changed()
+
+    async def _notify_backlog_changed(self) -> None:
+        async with self._backlog_changed:
+            self._backlog_changed.notify_all()
+
+    async def _run_unordered(self, update_data: Dict[str, Any], enqueued_at: float) -> None:
+        try:
+            await self._run_one(update_data, enqueued_at)
+        finally:
+            self._release()
+
+    async def _run_one(self, update_data: Dict[str, Any], enqueued_at: float) -> None:
+        update_id = update_data.get('update_id', 'unknown')
+        started_at = time.monotonic()
+        STAGE_SECONDS.observe(started_at - enqueued_at, stage='queue_wait')
+
+        self.active_count += 1
+        result = 'failure'
+        # Copied into the handler task by wait_for, the log records below the handlers pick it up
+        current_update_id.set(update_data.get('update_id'))
+        update_deadline.set(started_at + self.timeout)
+        try:
+            success = await asyncio.wait_for(self.process_update(update_data), timeout=self.timeout)
+            if success:
+                result = 'success'
+        except asyncio.TimeoutError:
+            logger.error("⏰ Timeout processing update %s", update_id, extra=log_event('update_timeout', update_id))
+            self.timeout_count += 1
+            result = 'timeout'
+            success = False
+        except Exception as e:
+            logger.error("❌ Unexpected error processing update %s: %s", update_id, e, exc_info=True,
+                         extra=log_event('update_failed', update_id))
+            success = False
+        finally:
+            self.active_count -= 1
+            STAGE_SECONDS.observe(time.monotonic() - started_at, stage='update')
+            record_result('update', result)
+
+        if success:
+            self.processed_count += 1
+            logger.info("✅ Successfully processed update %s (Total: %d)", update_id, self.processed_count,
+                        extra=log_event('update_done', update_id))
+        else:
+            self.failed_count += 1
+            logger.error("❌ Failed to process update %s", update_id, extra=log_event('update_failed', update_id))
+
+        if self.on_done:
+            try:
+                self.on_done(update_data, success)
+            except Exception as e:
+                logger.error(f"❌ Error in update completion callback: {e}")
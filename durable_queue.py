@@ -0,0 +1,246 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from dispatcher import get_chat_key
+
+try:
+    import fcntl
+except ImportError:  # Windows, no multi-process workers there
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_leader_lock_file = None
+
+
+def acquire_leadership(lock_path: str) -> bool:
+    """Try to become the leader process for one-off startup work.
+
+    Takes a non-blocking exclusive ``flock`` on ``lock_path`` and keeps it for
+    the life of the process. The OS drops the lock when the process exits, so
+    a recycled leader hands over to whichever worker asks next.
+    """
+    global _leader_lock_file
+
+    if _leader_lock_file is not None:
+        return True
+    if fcntl is None:
+        return True
+
+    directory = os.path.dirname(lock_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    lock_file = open(lock_path, 'a')
+    try:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return False
+
+    lock_file.truncate(0)
+    lock_file.write(str(os.getpid()))
+    lock_file.flush()
+    _leader_lock_file = lock_file
+    return True
+
+
+class DurableUpdateQueue:
+    """Update queue in a SQLite file shared by every worker process on a host.
+
+    Updates are keyed by ``update_id``, so a delivery that is already queued
+    is ignored. Workers ``claim`` updates under a lease and ``ack`` them once
+    handled. If a worker dies or is recycled before acking, its lease expires
+    and another worker picks the update up again, up to ``max_attempts``
+    times. At most one update per chat is leased at a time, so per-chat order
+    holds across processes as well.
+
+    Each process opens its own connection, so create the queue after the
+    worker has forked.
+    """
+
+    def __init__(self, db_path: str, lease_seconds: float = 60.0, max_attempts: int = 3):
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max(1, max_attempts)
+        self.owner = f"{os.getpid()}"
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+
+        self.enqueued = 0
+        self.duplicates = 0
+        self.claimed = 0
+        self.reclaimed = 0
+        self.acked = 0
+        self.dropped = 0
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # Autocommit mode, transactions are opened explicitly with BEGIN IMMEDIATE
+        self._conn = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS updates ("
+            "update_id INTEGER PRIMARY KEY, chat_id INTEGER, payload TEXT NOT NULL, "
+            "enqueued_at REAL NOT NULL, lease_owner TEXT, lease_expires REAL, "
+            "attempts INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS updates_lease ON updates (lease_expires)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS updates_chat ON updates (chat_id, update_id)")
+
+    def put(self, update_data: Dict[str, Any]) -> bool:
+        """Store an update, returns False if it has no update_id or is already queued"""
+        update_id = update_data.get('update_id')
+        if not isinstance(update_id, int):
+            logger.warning(f"⚠️ Update without a valid update_id, not queued: {update_id!r}")
+            return False
+
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO updates (update_id, chat_id, payload, enqueued_at) VALUES (?, ?, ?, ?)",
+                (update_id, get_chat_key(update_data), json.dumps(update_data), time.time())
+            )
+            if cursor.rowcount == 0:
+                self.duplicates += 1
+                return False
+            self.enqueued += 1
+
+        self._wakeup.set()
+        return True
+
+    def put_many(self, updates: List[Dict[str, Any]]) -> int:
+        """Store a batch of updates in one transaction, returns how many were new"""
+        now = time.time()
+        rows = []
+        for update_data in updates:
+            update_id = update_data.get('update_id')
+            if not isinstance(update_id, int):
+                logger.warning(f"⚠️ Update without a valid update_id, not queued: {update_id!r}")
+                continue
+            rows.append((update_id, get_chat_key(update_data), json.dumps(update_data), now))
+        if not rows:
+            return 0
+
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO updates (update_id, chat_id, payload, enqueued_at) VALUES (?, ?, ?, ?)",
+                    rows
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            added = self._conn.total_changes - before
+            self.enqueued += added
+            self.duplicates += len(rows) - added
+
+        if added:
+            self._wakeup.set()
+        return added
+
+    def claim(self, limit: int) -> List[Tuple[float, Dict[str, Any]]]:
+        """Lease up to ``limit`` updates, returns ``(enqueued_at, update_data)`` pairs.
+
+        ``enqueued_at`` is converted to this process's ``time.monotonic()``
+        clock so queue wait can be measured like the in-memory queue.
+        """
+        if limit <= 0:
+            return []
+
+        now = time.time()
+        claimed = []
+        poisoned = []
+
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Only the oldest update of a chat is claimable and only while none of its updates is leased,
+                # so a chat with a long backlog cannot fill the window and starve the others
+                rows = self._conn.execute(
+                    "SELECT update_id, chat_id, payload, enqueued_at, lease_owner, attempts FROM updates AS u "
+                    "WHERE (lease_expires IS NULL OR lease_expires < ?) AND (chat_id IS NULL OR ("
+                    "chat_id NOT IN (SELECT chat_id FROM updates WHERE lease_expires >= ? AND chat_id IS NOT NULL) "
+                    "AND update_id = (SELECT MIN(update_id) FROM updates WHERE chat_id = u.chat_id))) "
+                    "ORDER BY update_id LIMIT ?",
+                    (now, now, limit)
+                ).fetchall()
+
+                for update_id, chat_id, payload, enqueued_at, lease_owner, attempts in rows:
+                    if attempts >= self.max_attempts:
+                        poisoned.append(update_id)
+                        continue
+                    if lease_owner is not None:
+                        self.reclaimed += 1
+                    claimed.append((update_id, enqueued_at, payload))
+
+                self._conn.executemany(
+                    "UPDATE updates SET lease_owner = ?, lease_expires = ?, attempts = attempts + 1 "
+                    "WHERE update_id = ?",
+                    [(self.owner, now + self.lease_seconds, update_id) for update_id, _, _ in claimed]
+                )
+                if poisoned:
+                    self._conn.executemany("DELETE FROM updates WHERE update_id = ?", [(u,) for u in poisoned])
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+            self.claimed += len(claimed)
+            self.dropped += len(poisoned)
+
+        for update_id in poisoned:
+            logger.error(f"🗑️ Dropping update {update_id} after {self.max_attempts} attempts")
+
+        offset = time.monotonic() - time.time()
+        return [(enqueued_at + offset, json.loads(payload)) for _, enqueued_at, payload in claimed]
+
+    def ack(self, update_id: Any) -> None:
+        """Remove a handled update from the queue"""
+        with self._lock:
+            self._conn.execute("DELETE FROM updates WHERE update_id = ?", (update_id,))
+            self.acked += 1
+        # An acked update may unblock the next one from the same chat
+        self._wakeup.set()
+
+    def wait(self, timeout: float) -> None:
+        """Block until this process queues or acks an update, or ``timeout`` passes"""
+        self._wakeup.wait(timeout)
+        self._wakeup.clear()
+
+    def qsize(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM updates").fetchone()[0]
+
+    def oldest_age(self) -> Optional[float]:
+        with self._lock:
+            oldest = self._conn.execute("SELECT MIN(enqueued_at) FROM updates").fetchone()[0]
+        return time.time() - oldest if oldest is not None else None
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "sqlite",
+            "size": self.qsize(),
+            "oldest_age_seconds": self.oldest_age(),
+            "enqueued": self.enqueued,
+            "duplicates": self.duplicates,
+            "claimed": self.claimed,
+            "reclaimed": self.reclaimed,
+            "acked": self.acked,
+            "dropped": self.dropped,
+        }
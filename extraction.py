@@ -0,0 +1,203 @@
+import re
+import logging
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Selector chains in fallback order, shared by every extraction engine
+TITLE_SELECTORS = [
+    '#productTitle',
+    '.product-title',
+    'h1.a-size-large',
+    'h1 span',
+    '[data-automation-id="product-title"]'
+]
+
+PRICE_SELECTORS = [
+    '.a-price .a-offscreen',
+    '.a-price-whole',
+    '#price_inside_buybox',
+    '.a-price.a-text-price.a-size-medium.apexPriceToPay',
+    '[data-automation-id="product-price"]',
+    '.a-price-range'
+]
+
+IMAGE_SELECTORS = [
+    '#landingImage',
+    '#imgBlkFront',
+    '#main-image',
+    '.a-dynamic-image',
+    '[data-automation-id="product-image"]'
+]
+
+DEFAULT_TITLE = "Amazon Product"
+
+_IMAGE_SIZE_SUFFIX = re.compile(r'\._[A-Z0-9_,]+_\.')
+_META_CHARSET = re.compile(rb'<meta[^>]+charset=["\']?([A-Za-z0-9_\-]+)', re.IGNORECASE)
+_COMPOUND_PART = re.compile(r'([#.])([\w-]+)|\[([\w-]+)(?:="([^"]*)")?\]')
+_SKIPPED_TEXT_TAGS = {'script', 'style', 'template'}
+
+# Phrases only found on Amazon's captcha / automated-access pages
+_ROBOT_CHECK_MARKERS = (
+    b'/errors/validateCaptcha',
+    b'Type the characters you see in this image',
+    b'To discuss automated access to Amazon data',
+    b"Sorry, we just need to make sure you're not a robot",
+)
+
+
+def is_robot_check(content: bytes) -> bool:
+    """True for a captcha or robot-check page served instead of the product"""
+    return any(marker in content for marker in _ROBOT_CHECK_MARKERS)
+
+
+def has_digit(text: str) -> bool:
+    return any(char.isdigit() for char in text)
+
+
+def normalize_image_url(img_url) -> Optional[str]:
+    """Strip Amazon size suffixes and make the URL absolute, None if unusable"""
+    if not img_url or not isinstance(img_url, str):
+        return None
+
+    img_url = _IMAGE_SIZE_SUFFIX.sub('.', img_url)
+
+    if img_url.startswith('//'):
+        img_url = 'https:' + img_url
+
+    if img_url.startswith('http'):
+        return img_url
+    return None
+
+
+def css_to_xpath(selector: str) -> str:
+    """Translate the small CSS subset used by the selector chains into XPath.
+
+    Supports descendant combinators and compound selectors made of a tag name,
+    ``#id``, ``.class`` and ``[attr]`` / ``[attr="value"]``. The XPath selects
+    the first match in document order, like ``select_one``.
+    """
+    steps = []
+    for compound in selector.split():
+        tag_match = re.match(r'[a-zA-Z][\w-]*', compound)
+        tag = tag_match.group(0) if tag_match else '*'
+        rest = compound[tag_match.end():] if tag_match else compound
+
+        predicates = []
+        position = 0
+        for part in _COMPOUND_PART.finditer(rest):
+            if part.start() != position:
+                raise ValueError(f"Unsupported selector: {selector}")
+            position = part.end()
+
+            prefix, name, attr, value = part.groups()
+            if prefix == '#':
+                predicates.append(f"@id='{name}'")
+            elif prefix == '.':
+                predicates.append(f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')")
+            elif value is None:
+                predicates.append(f"@{attr}")
+            else:
+                predicates.append(f"@{attr}='{value}'")
+
+        if position != len(rest):
+            raise ValueError(f"Unsupported selector: {selector}")
+
+        steps.append(tag + ''.join(f"[{predicate}]" for predicate in predicates))
+
+    return '(//' + '//'.join(steps) + ')[1]'
+
+
+def element_text(element) -> str:
+    """Equivalent of BeautifulSoup's get_text(strip=True) for an lxml element"""
+    parts: List[str] = []
+
+    def collect(text):
+        if text:
+            text = text.strip()
+            if text:
+                parts.append(text)
+
+    def walk(node):
+        if isinstance(node.tag, str) and node.tag not in _SKIPPED_TEXT_TAGS:
+            collect(node.text)
+            for child in node:
+                walk(child)
+                collect(child.tail)
+
+    walk(element)
+    return ''.join(parts)
+
+
+class LxmlExtractor:
+    """Product field extraction on an lxml tree with precompiled selectors.
+
+    Every selector chain is compiled to XPath once, when the extractor is
+    created. A page is parsed once and each field walks its compiled chain in
+    the same fallback order as the BeautifulSoup implementation, so both
+    engines return the same values for the same page.
+    """
+
+    def __init__(self):
+        from lxml import etree
+
+        self._etree = etree
+        self._title_paths = [etree.XPath(css_to_xpath(selector)) for selector in TITLE_SELECTORS]
+        self._price_paths = [etree.XPath(css_to_xpath(selector)) for selector in PRICE_SELECTORS]
+        self._image_paths = [etree.XPath(css_to_xpath(selector)) for selector in IMAGE_SELECTORS]
+
+    def parse(self, content: bytes):
+        match = _META_CHARSET.search(content[:4096])
+        encoding = match.group(1).decode('ascii') if match else 'utf-8'
+        try:
+            parser = self._etree.HTMLParser(encoding=encoding)
+        except LookupError:
+            parser = self._etree.HTMLParser(encoding='utf-8')
+        return self._etree.fromstring(content, parser)
+
+    def extract(self, content: bytes) -> Dict[str, Optional[str]]:
+        root = self.parse(content)
+        if root is None:
+            return {'title': DEFAULT_TITLE, 'price': None, 'image_url': None}
+
+        return {
+            'title': self._extract_title(root),
+            'price': self._extract_price(root),
+            'image_url': self._extract_image_url(root)
+        }
+
+    def _extract_title(self, root) -> str:
+        try:
+            for path in self._title_paths:
+                for element in path(root):
+                    title = element_text(element)
+                    if title:
+                        return title[:200]
+            return DEFAULT_TITLE
+        except Exception as e:
+            logger.error(f"Error extracting title: {e}")
+            return DEFAULT_TITLE
+
+    def _extract_price(self, root) -> Optional[str]:
+        try:
+            for path in self._price_paths:
+                for element in path(root):
+                    price = element_text(element)
+                    if price and has_digit(price):
+                        return price
+            return None
+        except Exception as e:
+            logger.error(f"Error extracting price: {e}")
+            return None
+
+    def _extract_image_url(self, root) -> Optional[str]:
+        try:
+            for path in self._image_paths:
+                for element in path(root):
+                    img_url = normalize_image_url(element.get('src') or element.get('data-src'))
+                    if img_url:
+                        return img_url
+            return None
+        except Exception as e:
+            logger.error(f"Error extracting image: {e}")
+            return None
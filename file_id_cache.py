@@ -0,0 +1,64 @@
+import logging
+from typing import Any, Dict, Optional
+
+from config import Config
+from persistent_memo import PersistentMemo
+
+logger = logging.getLogger(__name__)
+
+
+class FileIdCache:
+    """Telegram file_ids of product photos we already sent, per ASIN.
+
+    Sending a photo by file_id lets Telegram reuse the copy it already has
+    instead of downloading the image from Amazon's CDN again. The image URL
+    is stored next to the id, so a product whose image changed is uploaded
+    fresh.
+
+    Handlers use ``get_async``, or ``cached`` where only memory may be
+    consulted, ``put`` and ``reject`` only touch memory and leave the disk
+    write to the memo's flusher thread.
+    """
+
+    def __init__(self, memo: Optional[PersistentMemo] = None):
+        self.memo = memo if memo is not None else PersistentMemo(
+            Config.FILE_ID_DB_PATH,
+            table="photo_file_ids",
+            front_cache_size=Config.FILE_ID_CACHE_SIZE,
+            max_rows=Config.FILE_ID_MAX_ROWS
+        )
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+
+    def get(self, asin: str, image_url: str) -> Optional[str]:
+        return self._match(self.memo.get(asin), image_url)
+
+    async def get_async(self, asin: str, image_url: str) -> Optional[str]:
+        """``get`` for the event loop, a disk lookup runs on the memo's thread"""
+        return self._match(await self.memo.get_async(asin), image_url)
+
+    def cached(self, asin: str, image_url: str) -> Optional[str]:
+        """The file_id if it is in memory, for answers that must not wait on the disk"""
+        return self._match(self.memo.peek(asin), image_url)
+
+    def put(self, asin: str, image_url: str, file_id: str) -> None:
+        self.memo.put(asin, f"{file_id} {image_url}")
+
+    def reject(self, asin: str) -> None:
+        """Forget an id Telegram refused, the next send uploads from the URL again"""
+        self.rejected += 1
+        self.memo.delete(asin)
+        logger.warning(f"Cached photo file_id for {asin} was rejected, using the image URL")
+
+    def stats(self) -> Dict[str, Any]:
+        return {"hits": self.hits, "misses": self.misses, "rejected": self.rejected, **self.memo.stats()}
+
+    def _match(self, value: Optional[str], image_url: str) -> Optional[str]:
+        if value:
+            file_id, _, cached_image_url = value.partition(' ')
+            if cached_image_url == image_url:
+                self.hits += 1
+                return file_id
+        self.misses += 1
+        return None
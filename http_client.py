@@ -0,0 +1,92 @@
+import asyncio
+import threading
+import logging
+from typing import Optional
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+_async_client: Optional[httpx.AsyncClient] = None
+_async_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def get_session() -> requests.Session:
+    """Return the shared keep-alive session used for blocking outbound calls.
+
+    requests keeps one connection pool per host; ``HTTP_POOL_HOSTS`` bounds how
+    many host pools are kept and ``HTTP_POOL_MAXSIZE`` how many connections
+    each pool holds, which should cover the number of executor threads.
+    """
+    global _session
+
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=Config.HTTP_POOL_HOSTS,
+                    pool_maxsize=Config.HTTP_POOL_MAXSIZE,
+                    pool_block=False
+                )
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+                logger.info(f"HTTP session ready (hosts={Config.HTTP_POOL_HOSTS}, per host={Config.HTTP_POOL_MAXSIZE})")
+
+    return _session
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Return the shared async client for the running event loop"""
+    global _async_client, _async_client_loop
+
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_client_loop is not loop or _async_client.is_closed:
+        _async_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=Config.HTTP_POOL_HOSTS * Config.HTTP_POOL_MAXSIZE,
+                max_keepalive_connections=Config.HTTP_POOL_MAXSIZE,
+                keepalive_expiry=Config.HTTP_KEEPALIVE_EXPIRY
+            ),
+            timeout=httpx.Timeout(Config.HTTP_TIMEOUT, connect=Config.HTTP_CONNECT_TIMEOUT),
+            follow_redirects=True
+        )
+        _async_client_loop = loop
+        logger.info("Async HTTP client ready")
+
+    return _async_client
+
+
+def request_timeout(read_timeout: float):
+    """Build a (connect, read) timeout for requests calls"""
+    return (Config.HTTP_CONNECT_TIMEOUT, read_timeout)
+
+
+def async_request_timeout(read_timeout: float) -> httpx.Timeout:
+    """Build the same timeout for async client calls"""
+    return httpx.Timeout(read_timeout, connect=Config.HTTP_CONNECT_TIMEOUT)
+
+
+async def close_async_client() -> None:
+    global _async_client, _async_client_loop
+
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+        _async_client_loop = None
+
+
+def close_session() -> None:
+    global _session
+
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
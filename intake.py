@@ -0,0 +1,183 @@
+import time
+import queue
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from amazon_links import AMAZON_HINT
+from dispatcher import get_chat_key
+
+HIGH = 'high'
+LOW = 'low'
+PRIORITIES = (HIGH, LOW)
+
+BUSY_MESSAGE = "⏳ Abhi bahut saare requests aa rahe hain! Thodi der baad dobara try karo please 🙏"
+
+def classify_update(update_data: Dict[str, Any]) -> str:
+    """LOW for messages with Amazon links (scrape + shorten), HIGH for everything else"""
+    message = update_data.get('message') or update_data.get('edited_message')
+    if isinstance(message, dict):
+        text = message.get('text') or ''
+        if not text.startswith('/') and AMAZON_HINT.search(text):
+            return LOW
+    return HIGH
+
+
+def busy_reply(update_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Bot API call to return as the webhook response for a shed update.
+
+    Telegram executes a method given in the webhook response body, so the
+    busy notice costs no extra request from our side.
+    """
+    message = update_data.get('message')
+    chat_id = get_chat_key(update_data)
+    if not isinstance(message, dict) or chat_id is None:
+        return None
+
+    reply = {"method": "sendMessage", "chat_id": chat_id, "text": BUSY_MESSAGE}
+    if 'message_id' in message:
+        reply["reply_to_message_id"] = message['message_id']
+    return reply
+
+
+class LoadShedder:
+    """Admission control with hysteresis on queue depth.
+
+    Once the depth reaches ``high_watermark`` low-priority updates are shed
+    until it has drained back to ``low_watermark``. High-priority updates are
+    only shed when the queue is completely full at ``max_size``.
+    """
+
+    def __init__(self, max_size: int, high_watermark: int, low_watermark: int):
+        self.max_size = max(1, max_size)
+        self.high_watermark = min(max(1, high_watermark), self.max_size)
+        self.low_watermark = min(max(0, low_watermark), self.high_watermark)
+
+        self.shedding = False
+        self.shed_counts = {priority: 0 for priority in PRIORITIES}
+        self.shedding_episodes = 0
+        self._lock = threading.Lock()
+
+    def admit(self, priority: str, depth: int) -> bool:
+        with self._lock:
+            if self.shedding and depth <= self.low_watermark:
+                self.shedding = False
+            elif not self.shedding and depth >= self.high_watermark:
+                self.shedding = True
+                self.shedding_episodes += 1
+
+            if depth >= self.max_size or (self.shedding and priority == LOW):
+                self.shed_counts[priority] += 1
+                return False
+            return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "shedding": self.shedding,
+            "shedding_episodes": self.shedding_episodes,
+            "shed": dict(self.shed_counts),
+            "max_size": self.max_size,
+            "high_watermark": self.high_watermark,
+            "low_watermark": self.low_watermark,
+        }
+
+
+class PriorityUpdateQueue:
+    """Bounded in-memory intake with two priority classes.
+
+    Drop-in for the ``queue.Queue`` the worker reads from: items are
+    ``(enqueued_at, update_data)`` pairs, ``get`` hands out high-priority
+    updates first and FIFO within a class. ``offer`` applies the shedder and
+    returns False instead of queueing when the update is shed.
+
+    Priority only reorders chats, never a chat's own updates: while a chat
+    has a low-priority update queued its later updates queue behind it in
+    the low class, whatever their own priority.
+    """
+
+    def __init__(self, shedder: LoadShedder):
+        self.shedder = shedder
+        self._items: Dict[str, Deque[Tuple[float, Dict[str, Any]]]] = {priority: deque() for priority in PRIORITIES}
+        # Low-priority updates queued per chat
+        self._low_chats: Dict[Any, int] = {}
+        self._not_empty = threading.Condition()
+        self._unfinished = 0
+
+        self.accepted = 0
+
+    def offer(self, update_data: Dict[str, Any], enqueued_at: Optional[float] = None) -> bool:
+        priority = classify_update(update_data)
+        with self._not_empty:
+            if not self.shedder.admit(priority, self._size()):
+                return False
+            chat_key = get_chat_key(update_data)
+            if chat_key is not None and (priority == LOW or chat_key in self._low_chats):
+                # Served after the chat's earlier low-priority update, not ahead of it
+                priority = LOW
+                self._low_chats[chat_key] = self._low_chats.get(chat_key, 0) + 1
+            self._items[priority].append((enqueued_at if enqueued_at is not None else time.monotonic(), update_data))
+            self._unfinished += 1
+            self.accepted += 1
+            self._not_empty.notify()
+        return True
+
+    def get(self, block: bool = True, timeout: Optional[float] = None) -> Tuple[float, Dict[str, Any]]:
+        """Same contract as ``queue.Queue.get``, raises ``queue.Empty`` on timeout"""
+        with self._not_empty:
+            if block and not self._size():
+                self._not_empty.wait_for(self._size, timeout)
+            item = self._pop()
+            if item is None:
+                raise queue.Empty
+            return item
+
+    def get_nowait(self) -> Optional[Tuple[float, Dict[str, Any]]]:
+        """Next item or None, for callers that wait on their own signal"""
+        with self._not_empty:
+            return self._pop()
+
+    def task_done(self) -> None:
+        with self._not_empty:
+            self._unfinished = max(0, self._unfinished - 1)
+
+    def qsize(self) -> int:
+        with self._not_empty:
+            return self._size()
+
+    def oldest_age(self) -> Optional[float]:
+        with self._not_empty:
+            heads = [items[0][0] for items in self._items.values() if items]
+        return time.monotonic() - min(heads) if heads else None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._not_empty:
+            depth = {priority: len(items) for priority, items in self._items.items()}
+        oldest = self.oldest_age()
+        return {
+            "depth": depth,
+            "oldest_age_seconds": round(oldest, 3) if oldest is not None else None,
+            "accepted": self.accepted,
+            "unfinished": self._unfinished,
+            **self.shedder.stats(),
+        }
+
+    def _size(self) -> int:
+        return sum(len(items) for items in self._items.values())
+
+    def _pop(self) -> Optional[Tuple[float, Dict[str, Any]]]:
+        for priority in PRIORITIES:
+            if self._items[priority]:
+                item = self._items[priority].popleft()
+                if priority == LOW:
+                    self._forget_low(get_chat_key(item[1]))
+                return item
+        return None
+
+    def _forget_low(self, chat_key: Any) -> None:
+        if chat_key is None:
+            return
+        remaining = self._low_chats.get(chat_key, 0) - 1
+        if remaining > 0:
+            self._low_chats[chat_key] = remaining
+        else:
+            self._low_chats.pop(chat_key, None)
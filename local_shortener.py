@@ -0,0 +1,240 @@
+import os
+import time
+import asyncio
+import secrets
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from config import Config
+from log_setup import log_event
+from shortener_providers import new_provider_health
+
+logger = logging.getLogger(__name__)
+
+BASE62_ALPHABET = '0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
+_BASE62_CHARS = frozenset(BASE62_ALPHABET)
+
+# 62^8 is about 2e14 codes, guessing a live one is hopeless even with millions of links
+CODE_LENGTH = 8
+# Rowid codes from before codes were random, 64-bit rowids need at most 11 characters
+MAX_CODE_LENGTH = 11
+
+
+def encode_base62(number: int) -> str:
+    if number == 0:
+        return BASE62_ALPHABET[0]
+    chars = []
+    while number:
+        number, remainder = divmod(number, 62)
+        chars.append(BASE62_ALPHABET[remainder])
+    return ''.join(reversed(chars))
+
+
+def random_code() -> str:
+    return ''.join(secrets.choice(BASE62_ALPHABET) for _ in range(CODE_LENGTH))
+
+
+class LocalShortener:
+    """Self-hosted short links served by the bot's own ``/r/<code>`` route.
+
+    A code is a random base62 string, so the links the bot hands out cannot
+    be enumerated by counting. Links made before codes were random keep
+    their rowid code. Recently used links are held in a bounded LRU in both
+    directions, anything else, including links created by another worker
+    process, is read from the database on first use.
+
+    It also acts as a provider in ``URLShortener``'s chain, so it has the
+    same ``shorten``/``shorten_async`` interface as the HTTP providers.
+    """
+
+    name = 'local'
+
+    def __init__(self, db_path: str, base_url: str, max_cached: int = 10000):
+        self.db_path = db_path
+        self.base_url = base_url.rstrip('/')
+        self.max_cached = max_cached
+        self.health = new_provider_health()
+
+        self._code_to_url: "OrderedDict[str, str]" = OrderedDict()
+        self._url_to_code: "OrderedDict[str, str]" = OrderedDict()
+        # The LRUs have their own lock, so a lookup from the event loop never waits on a database write
+        self._cache_lock = threading.Lock()
+        self._lock = threading.Lock()
+
+        self.wins = 0
+        self.hedges = 0
+        self.created = 0
+        self.redirects = 0
+        self.not_found = 0
+        self.collisions = 0
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS short_links "
+            "(id INTEGER PRIMARY KEY AUTOINCREMENT, url TEXT NOT NULL UNIQUE, code TEXT)"
+        )
+        self._migrate()
+        self._conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS short_links_code ON short_links (code)")
+        self._conn.commit()
+
+    def create(self, url: str) -> str:
+        """Return the code for ``url``, creating it on first use"""
+        code = self._cached_code(url)
+        if code:
+            return code
+
+        with self._lock:
+            while True:
+                row = self._conn.execute("SELECT code FROM short_links WHERE url = ?", (url,)).fetchone()
+                if row is not None:
+                    # Created by another worker process, or by us before it left the LRU
+                    code = row[0]
+                    break
+
+                code = random_code()
+                inserted = self._conn.execute(
+                    "INSERT OR IGNORE INTO short_links (url, code) VALUES (?, ?)", (url, code)
+                ).rowcount
+                self._conn.commit()
+                if inserted:
+                    self.created += 1
+                    break
+                # Either the code is taken or another process just added the URL, the SELECT tells which
+                self.collisions += 1
+
+        self._cache(code, url)
+        return code
+
+    def resolve(self, code: str) -> Optional[str]:
+        """Long URL for a code, or None"""
+        with self._cache_lock:
+            url = self._code_to_url.get(code)
+            if url is not None:
+                self._code_to_url.move_to_end(code)
+        if url is None:
+            url = self._load(code)
+
+        if url is None:
+            self.not_found += 1
+        else:
+            self.redirects += 1
+        return url
+
+    def short_url(self, code: str) -> str:
+        return f"{self.base_url}/{code}"
+
+    def hedge_delay(self) -> float:
+        return Config.SHORTENER_HEDGE_DELAY
+
+    def shorten(self, url: str) -> Optional[str]:
+        if not self.base_url:
+            logger.error("Local shortener has no base URL, set LOCAL_SHORTENER_BASE_URL or WEBHOOK_URL")
+            return None
+
+        start = time.perf_counter()
+        shortened_url = None
+        try:
+            shortened_url = self.short_url(self.create(url))
+            logger.info("URL shortened (local): %s -> %s", url, shortened_url, extra=log_event('url_shortened'))
+        except sqlite3.Error as e:
+            logger.error(f"Local shortener error: {e}")
+        finally:
+            self.health.record(time.perf_counter() - start, shortened_url is not None)
+        return shortened_url
+
+    async def shorten_async(self, url: str) -> Optional[str]:
+        # Recently used links are an LRU hit, only the rest need the database
+        code = self._cached_code(url)
+        if code and self.base_url:
+            # No round trip to measure, keeps the latency quantiles to real database work
+            self.health.record(None, True)
+            return self.short_url(code)
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.shorten, url)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "cached": len(self._code_to_url),
+            "max_cached": self.max_cached,
+            "created": self.created,
+            "collisions": self.collisions,
+            "redirects": self.redirects,
+            "not_found": self.not_found,
+            "wins": self.wins,
+            "hedges": self.hedges,
+            **self.health.stats(),
+        }
+
+    def _migrate(self) -> None:
+        """Give links from before random codes their rowid code, so links already handed out keep working"""
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(short_links)")]
+        if 'code' not in columns:
+            self._conn.execute("ALTER TABLE short_links ADD COLUMN code TEXT")
+
+        legacy = self._conn.execute("SELECT id FROM short_links WHERE code IS NULL").fetchall()
+        if legacy:
+            self._conn.executemany(
+                "UPDATE short_links SET code = ? WHERE id = ?", [(encode_base62(row_id), row_id) for row_id, in legacy]
+            )
+            logger.info(f"Kept rowid codes for {len(legacy)} existing local short links")
+
+    def _cached_code(self, url: str) -> Optional[str]:
+        with self._cache_lock:
+            code = self._url_to_code.get(url)
+            if code is not None:
+                self._url_to_code.move_to_end(url)
+            return code
+
+    def _cache(self, code: str, url: str) -> None:
+        with self._cache_lock:
+            self._code_to_url[code] = url
+            self._code_to_url.move_to_end(code)
+            self._url_to_code[url] = code
+            self._url_to_code.move_to_end(url)
+
+            while len(self._code_to_url) > self.max_cached:
+                self._code_to_url.popitem(last=False)
+            while len(self._url_to_code) > self.max_cached:
+                self._url_to_code.popitem(last=False)
+
+    def _load(self, code: str) -> Optional[str]:
+        # Not a code we could have made, no need to ask the database
+        if not code or len(code) > MAX_CODE_LENGTH or not _BASE62_CHARS.issuperset(code):
+            return None
+
+        with self._lock:
+            row = self._conn.execute("SELECT url FROM short_links WHERE code = ?", (code,)).fetchone()
+        if row is None:
+            return None
+        self._cache(code, row[0])
+        return row[0]
+
+
+_local_shortener: Optional[LocalShortener] = None
+_local_shortener_lock = threading.Lock()
+
+
+def get_local_shortener() -> LocalShortener:
+    """The process-wide local shortener shared by the provider chain and ``/r/<code>``"""
+    global _local_shortener
+
+    if _local_shortener is None:
+        with _local_shortener_lock:
+            if _local_shortener is None:
+                base_url = Config.LOCAL_SHORTENER_BASE_URL
+                if not base_url and Config.WEBHOOK_URL:
+                    base_url = f"{Config.WEBHOOK_URL.rstrip('/')}/r"
+                _local_shortener = LocalShortener(Config.LOCAL_SHORTENER_DB_PATH, base_url or '',
+                                                  max_cached=Config.LOCAL_SHORTENER_CACHE_SIZE)
+
+    return _local_shortener
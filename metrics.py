@@ -0,0 +1,294 @@
+import time
+import bisect
+import asyncio
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 15.0, 30.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+Sample = Tuple[str, Dict[str, str], float]
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(labels) -> str:
+    if not labels:
+        return ''
+    pairs = labels.items() if isinstance(labels, dict) else labels
+    escaped = (
+        f'{name}="' + str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for name, value in pairs
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self._lock = threading.Lock()
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._render_samples())
+        return lines
+
+    def _render_samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, help_text: str):
+        super().__init__(name, help_text)
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _render_samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def __init__(self, name: str, help_text: str):
+        super().__init__(name, help_text)
+        self._values: Dict[LabelKey, float] = {}
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def _render_samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text)
+        self.buckets = tuple(sorted(buckets))
+        # label key -> [bucket counts..., sum, count]
+        self._values: Dict[LabelKey, List[float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _render_samples(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._values.items()]
+
+        lines = []
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                labels = key + (('le', _format_value(bound)),)
+                lines.append(f"{self.name}_bucket{_format_labels(labels)} {_format_value(cumulative)}")
+            labels = key + (('le', '+Inf'),)
+            lines.append(f"{self.name}_bucket{_format_labels(labels)} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {_format_value(series[-1])}")
+        return lines
+
+
+class Registry:
+    """Holds metrics and renders them in the Prometheus text format.
+
+    Collectors are callables that return ``(name, type, help, samples)``
+    tuples at scrape time, for values that already live elsewhere such as
+    cache statistics.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, str, List[Sample]]]]] = []
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, help_text: str, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text, **kwargs)
+            return metric
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        return self._get_or_create(Counter, name, help_text)
+
+    def gauge(self, name: str, help_text: str) -> Gauge:
+        return self._get_or_create(Gauge, name, help_text)
+
+    def histogram(self, name: str, help_text: str, buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help_text, buckets=buckets)
+
+    def add_collector(self, collector: Callable[[], Iterable[Tuple[str, str, str, List[Sample]]]]) -> None:
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+
+        for collector in collectors:
+            try:
+                families = list(collector())
+            except Exception as e:
+                lines.append(f"# collector error: {e}")
+                continue
+            for name, kind, help_text, samples in families:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for sample_name, labels, value in samples:
+                    lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+# Per-stage latency of an update: queue_wait, update (the whole update), amazon_link,
+# amazon_fetch, html_parse, shorten, shorten_<provider> and telegram_send
+STAGE_SECONDS = registry.histogram(
+    'bot_stage_duration_seconds',
+    'Time spent in each stage of handling an update'
+)
+STAGE_RESULTS = registry.counter(
+    'bot_stage_results_total',
+    'Outcomes per stage: success, failure, timeout or cancelled'
+)
+EXECUTOR_TASKS = registry.gauge('bot_executor_tasks', 'Tasks in the default executor by state')
+EXECUTOR_WORKERS = registry.gauge('bot_executor_max_workers', 'Thread limit of the default executor')
+STARTUP_SECONDS = registry.gauge('bot_startup_phase_seconds', 'Time spent in each startup phase')
+
+
+def record_result(stage: str, result: str) -> None:
+    STAGE_RESULTS.inc(stage=stage, result=result)
+
+
+@contextmanager
+def track_stage(stage: str, timeout_types: Tuple[type, ...] = ()):
+    """Time a stage and count it as success, timeout, cancelled or failure"""
+    start = time.perf_counter()
+    try:
+        yield
+    except timeout_types:
+        record_result(stage, 'timeout')
+        raise
+    except asyncio.CancelledError:
+        # Abandoned by the caller, e.g. the losing side of a hedged request
+        record_result(stage, 'cancelled')
+        raise
+    except BaseException:
+        record_result(stage, 'failure')
+        raise
+    else:
+        record_result(stage, 'success')
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage)
+
+
+class InstrumentedThreadPoolExecutor(ThreadPoolExecutor):
+    """ThreadPoolExecutor that reports queued and active tasks"""
+
+    def __init__(self, max_workers: Optional[int] = None, thread_name_prefix: str = ''):
+        super().__init__(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+        EXECUTOR_WORKERS.set(self._max_workers)
+
+    def submit(self, fn, /, *args, **kwargs):
+        EXECUTOR_TASKS.inc(state='queued')
+
+        def run():
+            EXECUTOR_TASKS.dec(state='queued')
+            EXECUTOR_TASKS.inc(state='active')
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                EXECUTOR_TASKS.dec(state='active')
+
+        return super().submit(run)
+
+
+class StartupTimer:
+    """Record how long each startup phase took, for the startup report and /metrics"""
+
+    def __init__(self, started_at: Optional[float] = None):
+        self.started_at = started_at if started_at is not None else time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.phases[name] = seconds
+        STARTUP_SECONDS.set(seconds, phase=name)
+
+    def mark(self, name: str) -> None:
+        """Record the time from process start until now as ``name``"""
+        self.record(name, time.perf_counter() - self.started_at)
+
+    def report(self) -> str:
+        with self._lock:
+            phases = list(self.phases.items())
+        return ', '.join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in phases)
@@ -0,0 +1,81 @@
+import logging
+from typing import Optional
+
+from lxml import etree
+from extraction import element_text, has_digit, normalize_image_url
+
+logger = logging.getLogger(__name__)
+
+
+def _has_class(element, class_name: str) -> bool:
+    return class_name in (element.get('class') or '').split()
+
+
+class ProductFieldDetector:
+    """Watch a product page as it downloads and report when it is complete enough.
+
+    Chunks are fed to an incremental lxml parser. The page counts as complete
+    once the first match of the highest priority selector for title
+    (``#productTitle``), price (``.a-price .a-offscreen``) and image
+    (``#landingImage``) has been closed and holds a usable value. Those are the
+    elements the full extraction would pick first, so parsing the downloaded
+    prefix gives the same result as parsing the whole page. If any of them is
+    missing or unusable the caller keeps reading to the end.
+    """
+
+    def __init__(self):
+        self._parser = etree.HTMLPullParser(events=('end',))
+        self.title: Optional[bool] = None
+        self.price: Optional[bool] = None
+        self.image: Optional[bool] = None
+        self.failed = False
+        self.bytes_fed = 0
+
+    @property
+    def complete(self) -> bool:
+        return bool(self.title and self.price and self.image)
+
+    @property
+    def hopeless(self) -> bool:
+        """True once a primary field failed and only a full download can decide"""
+        return self.failed or False in (self.title, self.price, self.image)
+
+    def feed(self, chunk: bytes) -> bool:
+        """Feed a chunk, return True once reading can stop"""
+        if self.hopeless:
+            return False
+
+        self.bytes_fed += len(chunk)
+        try:
+            self._parser.feed(chunk)
+            for _, element in self._parser.read_events():
+                if not isinstance(element.tag, str):
+                    continue
+                self._inspect(element)
+        except Exception as e:
+            logger.debug(f"Incremental parse failed, reading full page: {e}")
+            self.failed = True
+            return False
+
+        return self.complete
+
+    def _inspect(self, element) -> None:
+        element_id = element.get('id')
+
+        if self.title is None and element_id == 'productTitle':
+            self.title = bool(element_text(element))
+
+        elif self.image is None and element_id == 'landingImage':
+            self.image = normalize_image_url(element.get('src') or element.get('data-src')) is not None
+
+        if self.price is None and _has_class(element, 'a-offscreen') and self._inside_price(element):
+            self.price = has_digit(element_text(element))
+
+    @staticmethod
+    def _inside_price(element) -> bool:
+        parent = element.getparent()
+        while parent is not None:
+            if _has_class(parent, 'a-price'):
+                return True
+            parent = parent.getparent()
+        return False
@@ -0,0 +1,252 @@
+import os
+import time
+import atexit
+import asyncio
+import sqlite3
+import threading
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class PersistentMemo:
+    """Durable string-to-string mapping backed by SQLite.
+
+    Reads go through a bounded in-memory LRU front cache, writes and deletes
+    are buffered and flushed to disk in batches by a background thread, either
+    when ``batch_size`` changes are pending or every ``flush_interval``
+    seconds, so ``put`` and ``delete`` never wait for SQLite. The most
+    recently written rows are loaded into the front cache on startup. With
+    ``max_rows`` the table keeps only that many of the most recently written
+    rows.
+
+    ``get`` reads the disk on a front cache miss. Code on the event loop uses
+    ``get_async``, which does that read on a thread of its own, or ``peek``
+    when a memory-only answer is good enough.
+    """
+
+    def __init__(self, db_path: str, table: str = "memo", front_cache_size: int = 10000,
+                 batch_size: int = 50, flush_interval: float = 5.0, warm_load: bool = True,
+                 max_rows: Optional[int] = None):
+        self.db_path = db_path
+        self.table = table
+        self.front_cache_size = front_cache_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_rows = max_rows
+
+        self._front: "OrderedDict[str, str]" = OrderedDict()
+        # None marks a pending delete
+        self._pending: Dict[str, Optional[str]] = {}
+        self._flushing: Dict[str, Optional[str]] = {}
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._flush_requested = threading.Event()
+        self._reader = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"{table}-read")
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.flushes = 0
+        self.evictions = 0
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_updated_at ON {table} (updated_at)")
+        self._conn.commit()
+
+        if warm_load:
+            self._warm_load()
+
+        self._flusher = threading.Thread(target=self._flush_loop, name=f"{table}-flusher", daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+
+    def get(self, key: str) -> Optional[str]:
+        found, value = self._lookup_memory(key)
+        if found:
+            return value
+        return self._lookup_disk(key)
+
+    async def get_async(self, key: str) -> Optional[str]:
+        """``get`` for the event loop, a front cache miss is read on the memo's own thread"""
+        found, value = self._lookup_memory(key)
+        if found:
+            return value
+        return await asyncio.get_running_loop().run_in_executor(self._reader, self._lookup_disk, key)
+
+    def peek(self, key: str) -> Optional[str]:
+        """The value if it is in memory, never touches the disk or the hit counters"""
+        with self._lock:
+            changed, value = self._pending_change(key)
+            return value if changed else self._front.get(key)
+
+    def put(self, key: str, value: str) -> None:
+        with self._lock:
+            self._remember(key, value)
+            self._pending[key] = value
+            self.writes += 1
+            if len(self._pending) >= self.batch_size:
+                self._flush_requested.set()
+
+    def delete(self, key: str) -> None:
+        """Forget a key now, the row is removed from disk with the next flush"""
+        with self._lock:
+            self._front.pop(key, None)
+            self._pending[key] = None
+            if len(self._pending) >= self.batch_size:
+                self._flush_requested.set()
+
+    def flush(self) -> None:
+        """Write all buffered changes to disk in one transaction"""
+        with self._lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, {}
+            # Still answered from memory until it is committed, a read in between would see the old row
+            self._flushing = batch
+
+        now = time.time()
+        try:
+            with self._db_lock:
+                self._conn.executemany(
+                    f"INSERT OR REPLACE INTO {self.table} (key, value, updated_at) VALUES (?, ?, ?)",
+                    [(key, value, now) for key, value in batch.items() if value is not None]
+                )
+                self._conn.executemany(
+                    f"DELETE FROM {self.table} WHERE key = ?",
+                    [(key,) for key, value in batch.items() if value is None]
+                )
+                if self.max_rows:
+                    cursor = self._conn.execute(
+                        f"DELETE FROM {self.table} WHERE key IN ("
+                        f"SELECT key FROM {self.table} ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+                        (self.max_rows,)
+                    )
+                    self.evictions += max(cursor.rowcount, 0)
+                self._conn.commit()
+            self.flushes += 1
+        except sqlite3.Error as e:
+            logger.error(f"Error flushing {self.table}: {e}")
+            # Keep the entries so the next flush retries them
+            with self._lock:
+                for key, value in batch.items():
+                    self._pending.setdefault(key, value)
+        finally:
+            with self._lock:
+                self._flushing = {}
+
+    def close(self) -> None:
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._flush_requested.set()
+        if self._flusher is not threading.current_thread():
+            self._flusher.join(timeout=5)
+        self._reader.shutdown(wait=True)
+        self.flush()
+        with self._db_lock:
+            self._conn.close()
+
+    def __len__(self) -> int:
+        with self._db_lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "front_cache_size": len(self._front),
+            "pending_writes": len(self._pending),
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "flushes": self.flushes,
+            "evictions": self.evictions,
+        }
+
+    def _lookup_memory(self, key: str) -> Tuple[bool, Optional[str]]:
+        """``(True, value)`` when memory has the answer, a pending delete counts as a miss"""
+        with self._lock:
+            value = self._front.get(key)
+            if value is not None:
+                self._front.move_to_end(key)
+                self.memory_hits += 1
+                return True, value
+
+            changed, value = self._pending_change(key)
+            if changed:
+                if value is None:
+                    self.misses += 1
+                else:
+                    self.memory_hits += 1
+                return True, value
+        return False, None
+
+    def _lookup_disk(self, key: str) -> Optional[str]:
+        with self._db_lock:
+            row = self._conn.execute(
+                f"SELECT value FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+
+        with self._lock:
+            changed, value = self._pending_change(key)
+            if changed:
+                # Written or deleted while we were reading, the pending change is newer
+                return value
+            if row is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, row[0])
+            return row[0]
+
+    def _pending_change(self, key: str) -> Tuple[bool, Optional[str]]:
+        """A write or delete not on disk yet, including the batch being flushed, caller holds the lock"""
+        for changes in (self._pending, self._flushing):
+            if key in changes:
+                return True, changes[key]
+        return False, None
+
+    def _remember(self, key: str, value: str) -> None:
+        """Put an entry in the front cache, caller holds the lock"""
+        self._front[key] = value
+        self._front.move_to_end(key)
+        while len(self._front) > self.front_cache_size:
+            self._front.popitem(last=False)
+
+    def _warm_load(self) -> None:
+        with self._db_lock:
+            rows = self._conn.execute(
+                f"SELECT key, value FROM {self.table} ORDER BY updated_at DESC LIMIT ?",
+                (self.front_cache_size,)
+            ).fetchall()
+
+        with self._lock:
+            # Oldest first so the most recent rows end up most recently used
+            for key, value in reversed(rows):
+                self._remember(key, value)
+
+        logger.info(f"Warm-loaded {len(rows)} entries from {self.table}")
+
+    def _flush_loop(self) -> None:
+        while not self._stop.is_set():
+            # Woken early once a batch is pending
+            self._flush_requested.wait(self.flush_interval)
+            self._flush_requested.clear()
+            if self._stop.is_set():
+                break
+            self.flush()
@@ -0,0 +1,200 @@
+import os
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from config import Config
+from log_setup import log_event
+from rate_limiter import backoff_delay
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_API = "https://api.telegram.org/bot{token}/{method}"
+
+
+class BotApiError(Exception):
+    """A Bot API call answered with ``ok: false``"""
+
+    def __init__(self, method: str, description: str, retry_after: Optional[float] = None):
+        super().__init__(f"{method}: {description}")
+        self.retry_after = retry_after
+
+
+class UpdatePoller:
+    """Receive updates with long-polling ``getUpdates`` instead of a webhook.
+
+    Each call waits up to ``timeout`` seconds for updates and returns up to
+    ``limit`` of them, which are handed to ``ingest`` as one batch, so a burst
+    costs one round trip per ``limit`` updates rather than one POST each.
+
+    The next offset is written to ``offset_path`` once a batch has been
+    ingested, and Telegram only drops updates below the offset we send. That
+    confirms updates before they are handled, so ``ingest`` must store them
+    durably (the app uses the shared SQLite queue): then a restart neither
+    replays handled updates nor loses queued ones. A crash between ingest
+    and the offset write replays that one batch, which the queue and the
+    dedup index catch.
+
+    ``ingest(updates)`` runs on a thread of its own and returns the number of
+    updates queued and the busy replies for the ones that were shed. Those
+    are sent with the Bot API, since there is no webhook response to carry
+    them, in the background so polling carries on while we are overloaded.
+    """
+
+    def __init__(self, token: str, ingest: Callable[[List[Dict[str, Any]]], Tuple[int, List[Dict[str, Any]]]],
+                 offset_path: str, limit: Optional[int] = None, timeout: Optional[int] = None,
+                 retry_cap: Optional[float] = None):
+        self.token = token
+        self.ingest = ingest
+        self.offset_path = offset_path
+        self.limit = min(max(Config.POLL_LIMIT if limit is None else limit, 1), 100)
+        self.timeout = Config.POLL_TIMEOUT if timeout is None else timeout
+        self.retry_cap = Config.POLL_RETRY_CAP if retry_cap is None else retry_cap
+
+        self.offset = self._load_offset()
+        self._task: Optional[asyncio.Task] = None
+        self._reply_tasks: Set[asyncio.Task] = set()
+        # Batch ingest and offset writes touch SQLite and the disk, keep them off the loop and the bot-io pool
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="update-poll")
+
+        self.polls = 0
+        self.empty_polls = 0
+        self.updates = 0
+        self.queued = 0
+        self.shed = 0
+        self.errors = 0
+
+    def start(self, loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        """Poll on ``loop``, by default the running one"""
+        if self._task is None or self._task.done():
+            self._task = (loop or asyncio.get_running_loop()).create_task(self._run())
+            logger.info(f"📡 Polling for updates (up to {self.limit} per call, {self.timeout}s long poll, "
+                        f"offset {self.offset})")
+
+    async def stop(self) -> None:
+        """Cancel the poll loop, the offset of everything ingested is already on disk"""
+        task, self._task = self._task, None
+        tasks = [task] if task is not None else []
+        tasks.extend(self._reply_tasks)
+        for pending in tasks:
+            pending.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._executor.shutdown(wait=False)
+        logger.info("📡 Update polling stopped")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "offset": self.offset,
+            "polls": self.polls,
+            "empty_polls": self.empty_polls,
+            "updates": self.updates,
+            "queued": self.queued,
+            "shed": self.shed,
+            "errors": self.errors,
+            "updates_per_poll": round(self.updates / self.polls, 2) if self.polls else 0,
+        }
+
+    async def _run(self) -> None:
+        failures = 0
+        webhook_deleted = False
+        while True:
+            try:
+                if not webhook_deleted:
+                    # getUpdates is refused while a webhook is set
+                    await self._call('deleteWebhook', {"drop_pending_updates": False})
+                    webhook_deleted = True
+                    logger.info("📡 Webhook removed, receiving updates by polling")
+
+                updates = await self._call('getUpdates', self._poll_params(), read_timeout=self.timeout + 10)
+                self.polls += 1
+                if updates:
+                    await self._ingest(updates)
+                else:
+                    self.empty_polls += 1
+                failures = 0
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                retry_after = getattr(e, 'retry_after', None)
+                delay = retry_after if retry_after else backoff_delay(failures, 1.0, self.retry_cap)
+                failures += 1
+                logger.error(f"❌ Polling for updates failed ({e}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    def _poll_params(self) -> Dict[str, Any]:
+        params = {"limit": self.limit, "timeout": self.timeout}
+        if self.offset is not None:
+            params["offset"] = self.offset
+        return params
+
+    async def _ingest(self, updates: List[Dict[str, Any]]) -> None:
+        loop = asyncio.get_running_loop()
+        self.updates += len(updates)
+        logger.debug("📨 Polled %d update(s)", len(updates), extra=log_event('updates_polled'))
+
+        # If this raises the offset stays put and the same batch comes back on the next poll
+        queued, busy_replies = await loop.run_in_executor(self._executor, self.ingest, updates)
+        self.queued += queued
+        self.shed += len(busy_replies)
+
+        last_id = max((u['update_id'] for u in updates if isinstance(u.get('update_id'), int)), default=None)
+        if last_id is not None:
+            self.offset = last_id + 1
+            await loop.run_in_executor(self._executor, self._save_offset, self.offset)
+
+        if busy_replies:
+            task = loop.create_task(self._send_busy_replies(busy_replies))
+            self._reply_tasks.add(task)
+            task.add_done_callback(self._reply_tasks.discard)
+
+    async def _send_busy_replies(self, busy_replies: List[Dict[str, Any]]) -> None:
+        async def send(reply):
+            params = dict(reply)
+            method = params.pop('method')
+            try:
+                await self._call(method, params)
+            except Exception as e:
+                logger.warning(f"⚠️ Could not send busy reply to chat {params.get('chat_id')}: {e}")
+
+        await asyncio.gather(*(send(reply) for reply in busy_replies))
+
+    async def _call(self, method: str, params: Dict[str, Any], read_timeout: Optional[float] = None) -> Any:
+        from http_client import get_async_client, async_request_timeout
+
+        response = await get_async_client().post(
+            TELEGRAM_API.format(token=self.token, method=method),
+            json=params,
+            timeout=async_request_timeout(read_timeout or Config.HTTP_TIMEOUT)
+        )
+        try:
+            result = response.json()
+        except ValueError:
+            raise BotApiError(method, f"HTTP {response.status_code}")
+        if not result.get('ok'):
+            parameters = result.get('parameters') or {}
+            raise BotApiError(method, result.get('description') or f"HTTP {response.status_code}",
+                              parameters.get('retry_after'))
+        return result.get('result')
+
+    def _load_offset(self) -> Optional[int]:
+        try:
+            with open(self.offset_path) as offset_file:
+                return int(offset_file.read().strip())
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            logger.warning(f"⚠️ Ignoring unreadable poll offset in {self.offset_path}")
+            return None
+
+    def _save_offset(self, offset: int) -> None:
+        directory = os.path.dirname(self.offset_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Written next to the file and renamed over it, so a crash never leaves half an offset
+        temp_path = f"{self.offset_path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w') as offset_file:
+            offset_file.write(str(offset))
+        os.replace(temp_path, self.offset_path)
@@ -0,0 +1,262 @@
+import time
+import asyncio
+import sqlite3
+import threading
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+from product_store import ProductRecord, ProductStore
+
+logger = logging.getLogger(__name__)
+
+CacheKey = Tuple[str, str]
+
+
+class ProductCache:
+    """Bounded LRU cache of product info keyed by (domain, ASIN).
+
+    Title and image change rarely, price changes often, so each has its own
+    TTL. An entry whose price has expired is a miss for ``get`` but its title
+    and image can still be served through ``get_stale`` when a fresh fetch
+    fails.
+
+    With a ``store`` the cache is the first level in front of a ProductStore
+    shared by all worker processes: every put is written through, and a
+    local miss or expired price is looked up there, so a product one worker
+    scraped is warm in all of them and survives restarts. Writes to the
+    store happen on a background thread in order, so ``put`` and
+    ``invalidate`` never wait on SQLite from the event loop. Code on the
+    loop reads with the ``*_async`` variants, which look a local miss up in
+    the store on a reader thread, or with ``get_local``, which never reads
+    the store. The store opens its file on first use, on one of those
+    threads.
+    """
+
+    def __init__(self, max_size: int = 5000, ttl: float = 6 * 3600, price_ttl: float = 900,
+                 store: Optional[ProductStore] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.price_ttl = price_ttl
+        self.store = store
+        self._store_writer = None
+        self._store_reader = None
+        if store is not None:
+            self._store_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="product-store")
+            self._store_reader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="product-store-read")
+
+        self._entries: "OrderedDict[CacheKey, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.stale_hits = 0
+        self.store_hits = 0
+
+    def get(self, key: CacheKey) -> Optional[Dict[str, str]]:
+        """Return product info if title, image and price are all fresh"""
+        now = time.monotonic()
+        return self._fresh_info(key, self._entry(key, now), now)
+
+    async def get_async(self, key: CacheKey) -> Optional[Dict[str, str]]:
+        """``get`` for the event loop, the store is read on the cache's reader thread"""
+        now = time.monotonic()
+        return self._fresh_info(key, await self._entry_async(key, now), now)
+
+    def get_stale(self, key: CacheKey) -> Optional[Dict[str, str]]:
+        """Return title and image without the price if only the price expired"""
+        now = time.monotonic()
+        return self._stale_info(self._entry(key, now), now)
+
+    async def get_stale_async(self, key: CacheKey) -> Optional[Dict[str, str]]:
+        """``get_stale`` for the event loop, the store is read on the cache's reader thread"""
+        now = time.monotonic()
+        return self._stale_info(await self._entry_async(key, now), now)
+
+    def get_local(self, key: CacheKey) -> Optional[Dict[str, str]]:
+        """Like ``get_stale`` from this process's entries only, for answers that must not wait on the store"""
+        now = time.monotonic()
+        return self._stale_info(self._local_entry(key, now), now)
+
+    def price_expires_in(self, key: CacheKey) -> Optional[float]:
+        """Seconds until the entry's price expires, negative once it has, None if there is no entry.
+
+        Does not count as a lookup or refresh the entry's LRU position.
+        """
+        now = time.monotonic()
+        return self._expires_in(self._peek(key, now), now)
+
+    async def price_expires_in_async(self, key: CacheKey) -> Optional[float]:
+        """``price_expires_in`` for the event loop, the store is read on the cache's reader thread"""
+        now = time.monotonic()
+        entry = self._peek_local(key, now)
+        if self._needs_store(entry, now):
+            stored = await self._load_from_store_async(key, now)
+            if self._is_newer(stored, entry):
+                entry = stored
+        return self._expires_in(entry, now)
+
+    def put(self, key: CacheKey, info: Dict[str, str]) -> None:
+        now = time.monotonic()
+        self._insert(key, {
+            'info': dict(info),
+            'expires_at': now + self.ttl,
+            'price_expires_at': now + self.price_ttl,
+        })
+
+        if self.store is not None:
+            self._store_writer.submit(self._write_to_store, self.store.put, key, ProductRecord.from_info(key, info))
+
+    def invalidate(self, key: CacheKey) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.store is not None:
+            self._store_writer.submit(self._write_to_store, self.store.delete, key, key)
+
+    def flush(self) -> None:
+        """Wait until every queued write has reached the shared store"""
+        if self._store_writer is not None:
+            self._store_writer.submit(lambda: None).result()
+
+    def clear(self) -> None:
+        """Empty this process's entries, the shared store is left alone"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "stale_hits": self.stale_hits,
+            "store_hits": self.store_hits,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+    def _entry(self, key: CacheKey, now: float) -> Optional[Dict]:
+        """The live entry for a key, from the shared store if ours is missing or has an expired price"""
+        entry = self._local_entry(key, now)
+        if self._needs_store(entry, now):
+            # Another worker may have scraped it since
+            entry = self._adopt(key, entry, self._load_from_store(key, now))
+        return entry
+
+    async def _entry_async(self, key: CacheKey, now: float) -> Optional[Dict]:
+        entry = self._local_entry(key, now)
+        if self._needs_store(entry, now):
+            entry = self._adopt(key, entry, await self._load_from_store_async(key, now))
+        return entry
+
+    def _local_entry(self, key: CacheKey, now: float) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now >= entry['expires_at']:
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+        return entry
+
+    def _needs_store(self, entry: Optional[Dict], now: float) -> bool:
+        return self.store is not None and (entry is None or now >= entry['price_expires_at'])
+
+    def _is_newer(self, stored: Optional[Dict], entry: Optional[Dict]) -> bool:
+        return stored is not None and (entry is None or stored['price_expires_at'] > entry['price_expires_at'])
+
+    def _adopt(self, key: CacheKey, entry: Optional[Dict], stored: Optional[Dict]) -> Optional[Dict]:
+        """Keep the store's entry if it is fresher than ours"""
+        if not self._is_newer(stored, entry):
+            return entry
+        self._insert(key, stored)
+        with self._lock:
+            self.store_hits += 1
+        return stored
+
+    def _peek(self, key: CacheKey, now: float) -> Optional[Dict]:
+        """Like _entry, but leaves the entries, their order and the counters as they are"""
+        entry = self._peek_local(key, now)
+        if self._needs_store(entry, now):
+            stored = self._load_from_store(key, now)
+            if self._is_newer(stored, entry):
+                entry = stored
+        return entry
+
+    def _peek_local(self, key: CacheKey, now: float) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and now >= entry['expires_at']:
+            return None
+        return entry
+
+    def _fresh_info(self, key: CacheKey, entry: Optional[Dict], now: float) -> Optional[Dict[str, str]]:
+        with self._lock:
+            if entry is None or now >= entry['price_expires_at']:
+                self.misses += 1
+                return None
+
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(entry['info'])
+
+    def _stale_info(self, entry: Optional[Dict], now: float) -> Optional[Dict[str, str]]:
+        with self._lock:
+            if entry is None:
+                return None
+
+            self.stale_hits += 1
+            info = dict(entry['info'])
+            if now >= entry['price_expires_at']:
+                info['price'] = None
+            return info
+
+    def _expires_in(self, entry: Optional[Dict], now: float) -> Optional[float]:
+        if entry is None:
+            return None
+        return entry['price_expires_at'] - now
+
+    def _write_to_store(self, write, key: CacheKey, argument) -> None:
+        try:
+            write(argument)
+        except sqlite3.Error as e:
+            logger.error(f"Error updating {key[0]}/{key[1]} in the product store: {e}")
+
+    async def _load_from_store_async(self, key: CacheKey, now: float) -> Optional[Dict]:
+        return await asyncio.get_running_loop().run_in_executor(self._store_reader, self._load_from_store, key, now)
+
+    def _load_from_store(self, key: CacheKey, now: float) -> Optional[Dict]:
+        try:
+            record = self.store.get(key)
+        except sqlite3.Error as e:
+            logger.error(f"Error reading {key[0]}/{key[1]} from the product store: {e}")
+            return None
+        if record is None:
+            return None
+
+        # Wall-clock age, the record may come from another process or an earlier run
+        age = max(0.0, time.time() - record.fetched_at)
+        if age >= self.ttl:
+            return None
+        return {
+            'info': record.to_info(),
+            'expires_at': now + self.ttl - age,
+            'price_expires_at': now + self.price_ttl - age,
+        }
+
+    def _insert(self, key: CacheKey, entry: Dict) -> None:
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
@@ -0,0 +1,307 @@
+import os
+import time
+import struct
+import sqlite3
+import logging
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CacheKey = Tuple[str, str]
+
+# Most product images live under one of these, storing an index instead saves ~40 bytes a record
+IMAGE_PREFIXES = (
+    '',
+    'https://m.media-amazon.com/images/I/',
+    'https://images-na.ssl-images-amazon.com/images/I/',
+    'https://images-eu.ssl-images-amazon.com/images/I/',
+    'https://images-fe.ssl-images-amazon.com/images/I/',
+)
+
+_HAS_PRICE = 0x01
+_HAS_IMAGE = 0x02
+_WWW_HOST = 0x04
+
+# fetched_at, flags, image prefix index, then the byte lengths of title, price and image path
+_HEADER = struct.Struct('<dBBHHH')
+_MAX_FIELD_BYTES = 0xFFFF
+
+
+def _encode_field(value: Optional[str]) -> bytes:
+    data = value.encode('utf-8') if value else b''
+    # Titles are capped at 200 characters by the extractors, this only guards against corrupt input
+    return data[:_MAX_FIELD_BYTES]
+
+
+class ProductRecord:
+    """One product's cached details, with a compact binary form for the shared store"""
+
+    __slots__ = ('domain', 'asin', 'title', 'price', 'image_url', 'fetched_at', 'www')
+
+    def __init__(self, domain: str, asin: str, title: str, price: Optional[str], image_url: Optional[str],
+                 fetched_at: float, www: bool = True):
+        self.domain = domain
+        self.asin = asin
+        self.title = title
+        self.price = price
+        self.image_url = image_url
+        self.fetched_at = fetched_at
+        self.www = www
+
+    @classmethod
+    def from_info(cls, key: CacheKey, info: Dict[str, Any], fetched_at: Optional[float] = None) -> "ProductRecord":
+        """Record for the product info dict the scraper returns, keyed like ProductCache"""
+        return cls(
+            key[0],
+            key[1],
+            info.get('title') or '',
+            info.get('price'),
+            info.get('image_url'),
+            time.time() if fetched_at is None else fetched_at,
+            www='://www.' in (info.get('url') or 'https://www.')
+        )
+
+    @property
+    def key(self) -> CacheKey:
+        return self.domain, self.asin
+
+    def to_info(self) -> Dict[str, Optional[str]]:
+        host = f"www.{self.domain}" if self.www else self.domain
+        return {
+            'title': self.title,
+            'price': self.price,
+            'image_url': self.image_url,
+            'url': f"https://{host}/dp/{self.asin}",
+        }
+
+    def encode(self) -> bytes:
+        flags = (_HAS_PRICE if self.price is not None else 0) | (_WWW_HOST if self.www else 0)
+
+        prefix_index = 0
+        image_path = self.image_url or ''
+        if self.image_url is not None:
+            flags |= _HAS_IMAGE
+            for index in range(len(IMAGE_PREFIXES) - 1, 0, -1):
+                if image_path.startswith(IMAGE_PREFIXES[index]):
+                    prefix_index = index
+                    image_path = image_path[len(IMAGE_PREFIXES[index]):]
+                    break
+
+        title = _encode_field(self.title)
+        price = _encode_field(self.price)
+        image = _encode_field(image_path)
+        return _HEADER.pack(self.fetched_at, flags, prefix_index, len(title), len(price), len(image)) + title + price + image
+
+    @classmethod
+    def decode(cls, key: CacheKey, data: bytes) -> "ProductRecord":
+        fetched_at, flags, prefix_index, title_len, price_len, image_len = _HEADER.unpack_from(data)
+        view = memoryview(data)
+        offset = _HEADER.size
+        title = str(view[offset:offset + title_len], 'utf-8')
+        offset += title_len
+        price = str(view[offset:offset + price_len], 'utf-8') if flags & _HAS_PRICE else None
+        offset += price_len
+        image_url = None
+        if flags & _HAS_IMAGE:
+            image_url = IMAGE_PREFIXES[prefix_index] + str(view[offset:offset + image_len], 'utf-8')
+        return cls(key[0], key[1], title, price, image_url, fetched_at, www=bool(flags & _WWW_HOST))
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, ProductRecord):
+            return NotImplemented
+        return all(getattr(self, field) == getattr(other, field) for field in self.__slots__)
+
+    def __repr__(self) -> str:
+        return f"ProductRecord({self.domain}/{self.asin}, {self.title[:30]!r}, price={self.price!r})"
+
+
+class ProductStore:
+    """Product records in a SQLite file shared by every worker process on the host.
+
+    Records are stored in their binary form under ``"<domain>/<asin>"``.
+    Reads go through SQLite's memory-mapped I/O (``mmap_size``), so all
+    processes share the OS page cache instead of each holding its own copy
+    of the dataset. The table is kept to ``max_records`` rows by dropping
+    the least recently fetched ones every ``evict_every`` writes.
+
+    The file is opened on first use. Reads and writes have a connection and
+    lock each: with WAL a read never waits for a write, and reads give up
+    after ``read_timeout`` rather than hold up the lookups queued behind
+    them. Every call blocks, ProductCache makes them from threads of its own.
+    """
+
+    def __init__(self, db_path: str, max_records: int = 100000, mmap_size: int = 64 * 1024 * 1024,
+                 evict_every: int = 100, read_timeout: float = 0.1, write_timeout: float = 30):
+        self.db_path = db_path
+        self.max_records = max_records
+        self.mmap_size = int(mmap_size)
+        self.evict_every = max(1, evict_every)
+        self.read_timeout = read_timeout
+        self.write_timeout = write_timeout
+
+        self._read_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._reader: Optional[sqlite3.Connection] = None
+        self._writer: Optional[sqlite3.Connection] = None
+        self._writes_since_evict = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+    def get(self, key: CacheKey) -> Optional[ProductRecord]:
+        with self._read_lock:
+            row = self._read_conn().execute(
+                "SELECT record FROM products WHERE key = ?", (self._db_key(key),)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return ProductRecord.decode(key, row[0])
+
+    def get_many(self, keys: Iterable[CacheKey]) -> Dict[CacheKey, ProductRecord]:
+        by_db_key = {self._db_key(key): key for key in keys}
+        if not by_db_key:
+            return {}
+
+        records = {}
+        db_keys = list(by_db_key)
+        with self._read_lock:
+            conn = self._read_conn()
+            # SQLite allows 999 bound parameters in older builds
+            for start in range(0, len(db_keys), 500):
+                chunk = db_keys[start:start + 500]
+                rows = conn.execute(
+                    f"SELECT key, record FROM products WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                for db_key, data in rows:
+                    key = by_db_key[db_key]
+                    records[key] = ProductRecord.decode(key, data)
+            self.hits += len(records)
+            self.misses += len(by_db_key) - len(records)
+        return records
+
+    def put(self, record: ProductRecord) -> None:
+        with self._write_lock:
+            conn = self._write_conn()
+            conn.execute(
+                "INSERT OR REPLACE INTO products (key, record, fetched_at) VALUES (?, ?, ?)",
+                (self._db_key(record.key), record.encode(), record.fetched_at)
+            )
+            self.writes += 1
+            self._writes_since_evict += 1
+            if self._writes_since_evict >= self.evict_every:
+                self._evict()
+            conn.commit()
+
+    def bulk_load(self, records: Iterable[ProductRecord], batch_size: int = 1000) -> int:
+        """Insert many records, one transaction per batch, and return how many were written"""
+        loaded = 0
+        batch: List[Tuple[str, bytes, float]] = []
+
+        def write(batch):
+            with self._write_lock:
+                conn = self._write_conn()
+                conn.executemany(
+                    "INSERT OR REPLACE INTO products (key, record, fetched_at) VALUES (?, ?, ?)", batch
+                )
+                conn.commit()
+
+        for record in records:
+            batch.append((self._db_key(record.key), record.encode(), record.fetched_at))
+            if len(batch) >= batch_size:
+                write(batch)
+                loaded += len(batch)
+                batch = []
+        if batch:
+            write(batch)
+            loaded += len(batch)
+
+        with self._write_lock:
+            self.writes += loaded
+            self._evict()
+            self._write_conn().commit()
+        logger.info(f"Bulk-loaded {loaded} product records")
+        return loaded
+
+    def delete(self, key: CacheKey) -> None:
+        with self._write_lock:
+            conn = self._write_conn()
+            conn.execute("DELETE FROM products WHERE key = ?", (self._db_key(key),))
+            conn.commit()
+
+    def checkpoint(self) -> None:
+        """Fold the WAL back into the main file"""
+        with self._write_lock:
+            self._write_conn().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def close(self) -> None:
+        with self._read_lock:
+            if self._reader is not None:
+                self._reader.close()
+                self._reader = None
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+    def __len__(self) -> int:
+        with self._read_lock:
+            return self._read_conn().execute("SELECT COUNT(*) FROM products").fetchone()[0]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "records": len(self),
+            "max_records": self.max_records,
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "evictions": self.evictions,
+        }
+
+    def _db_key(self, key: CacheKey) -> str:
+        return f"{key[0]}/{key[1]}"
+
+    def _read_conn(self) -> sqlite3.Connection:
+        """Caller holds the read lock"""
+        if self._reader is None:
+            # The schema is created once through the write connection, with its long timeout
+            with self._write_lock:
+                self._write_conn()
+            self._reader = self._connect(self.read_timeout)
+        return self._reader
+
+    def _write_conn(self) -> sqlite3.Connection:
+        """Caller holds the write lock"""
+        if self._writer is None:
+            self._writer = self._connect(self.write_timeout)
+            self._writer.execute("PRAGMA journal_mode=WAL")
+            self._writer.execute("PRAGMA synchronous=NORMAL")
+            self._writer.execute(
+                "CREATE TABLE IF NOT EXISTS products ("
+                "key TEXT PRIMARY KEY, record BLOB NOT NULL, fetched_at REAL NOT NULL) WITHOUT ROWID"
+            )
+            self._writer.execute("CREATE INDEX IF NOT EXISTS products_fetched_at ON products (fetched_at)")
+            self._writer.commit()
+        return self._writer
+
+    def _connect(self, timeout: float) -> sqlite3.Connection:
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=timeout, check_same_thread=False)
+        conn.execute(f"PRAGMA mmap_size={self.mmap_size}")
+        return conn
+
+    def _evict(self) -> None:
+        """Drop the least recently fetched records over the limit, caller holds the write lock"""
+        self._writes_since_evict = 0
+        cursor = self._write_conn().execute(
+            "DELETE FROM products WHERE key IN ("
+            "SELECT key FROM products ORDER BY fetched_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_records,)
+        )
+        self.evictions += max(cursor.rowcount, 0)
@@ -0,0 +1,138 @@
+import time
+import random
+import asyncio
+import logging
+import threading
+from typing import Any, Callable, Dict, Optional
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveRateLimiter:
+    """Token bucket whose rate follows the throttling the remote side shows us.
+
+    Every success raises the rate by ``increase / rate``, which at a steady
+    stream of successes adds about ``increase`` requests/s every second. Every
+    throttle (503, 429, robot check) multiplies the rate by ``decrease``. The
+    rate stays within ``[min_rate, max_rate]``.
+
+    Callers reserve a slot and sleep until it comes up, slots further away
+    than the caller's deadline are refused instead of waited for. Deadlines
+    and refills are measured on ``clock``, ``time.monotonic`` by default.
+    """
+
+    def __init__(self, name: str, rate: float, burst: float, min_rate: float, max_rate: float,
+                 increase: float = 0.1, decrease: float = 0.5, clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.min_rate = min_rate
+        self.max_rate = max(max_rate, min_rate)
+        self.rate = min(max(rate, self.min_rate), self.max_rate)
+        self.burst = max(1.0, burst)
+        self.increase = increase
+        self.decrease = decrease
+        self.clock = clock
+
+        self._tokens = self.burst
+        self._updated_at = clock()
+        self._lock = threading.Lock()
+
+        self.granted = 0
+        self.refused = 0
+        self.successes = 0
+        self.throttles = 0
+        self.waited_seconds = 0.0
+
+    def reserve(self, max_wait: float) -> Optional[float]:
+        """Take a slot, returns how long to wait for it, or None if that is longer than ``max_wait``"""
+        with self._lock:
+            now = self.clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+
+            # Tokens go negative for callers queued behind each other
+            wait = max(0.0, (1.0 - self._tokens) / self.rate)
+            if wait > max_wait:
+                self.refused += 1
+                return None
+
+            self._tokens -= 1.0
+            self.granted += 1
+            self.waited_seconds += wait
+            return wait
+
+    def acquire(self, deadline: float) -> bool:
+        wait = self.reserve(deadline - self.clock())
+        if wait is None:
+            return False
+        if wait:
+            time.sleep(wait)
+        return True
+
+    async def acquire_async(self, deadline: float) -> bool:
+        wait = self.reserve(deadline - self.clock())
+        if wait is None:
+            return False
+        if wait:
+            await asyncio.sleep(wait)
+        return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.successes += 1
+            self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+
+    def record_throttle(self) -> None:
+        with self._lock:
+            self.throttles += 1
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            # Whatever was saved up is what got us throttled
+            self._tokens = min(self._tokens, 0.0)
+        logger.warning(f"🐢 {self.name} is throttling us, slowing down to {self.rate:.2f} requests/s")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rate": round(self.rate, 3),
+            "granted": self.granted,
+            "refused": self.refused,
+            "successes": self.successes,
+            "throttles": self.throttles,
+            "waited_seconds": round(self.waited_seconds, 3),
+        }
+
+
+class DomainRateLimiters:
+    """One AdaptiveRateLimiter per Amazon storefront, created on first use"""
+
+    def __init__(self):
+        self._limiters: Dict[str, AdaptiveRateLimiter] = {}
+        self._lock = threading.Lock()
+
+    def get(self, domain: str) -> AdaptiveRateLimiter:
+        domain = domain.lower()
+        if domain.startswith('www.'):
+            domain = domain[4:]
+
+        limiter = self._limiters.get(domain)
+        if limiter is None:
+            with self._lock:
+                limiter = self._limiters.get(domain)
+                if limiter is None:
+                    limiter = AdaptiveRateLimiter(
+                        domain,
+                        rate=Config.AMAZON_RATE,
+                        burst=Config.AMAZON_RATE_BURST,
+                        min_rate=Config.AMAZON_RATE_MIN,
+                        max_rate=Config.AMAZON_RATE_MAX
+                    )
+                    self._limiters[domain] = limiter
+        return limiter
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {domain: limiter.stats() for domain, limiter in self._limiters.items()}
+
+
+def backoff_delay(attempt: int, base: float, cap: float, rng: Optional[random.Random] = None) -> float:
+    """Full-jitter exponential backoff: uniform in [0, min(cap, base * 2**attempt)], drawn from ``rng`` if given"""
+    return (rng or random).uniform(0, min(cap, base * 2 ** attempt))
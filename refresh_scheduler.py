@@ -0,0 +1,189 @@
+import time
+import heapq
+import asyncio
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import Config
+from metrics import STAGE_SECONDS, record_result
+
+logger = logging.getLogger(__name__)
+
+CacheKey = Tuple[str, str]
+
+
+class RefreshScheduler:
+    """Re-scrape popular products shortly before their cached price expires.
+
+    Every product request counts towards the product's popularity score,
+    which halves every ``half_life`` seconds. Each tick the ``hot_size``
+    highest-scoring products with at least ``min_score`` are checked, and
+    the ones whose price expires within ``lead_time`` (or that dropped out of
+    the cache) are fetched again, soonest first. Fetches are paced by a
+    token bucket of ``budget_per_minute``, whatever is over budget waits for
+    the next tick.
+    """
+
+    def __init__(self, scraper, budget_per_minute: Optional[float] = None, lead_time: Optional[float] = None,
+                 hot_size: Optional[int] = None, min_score: Optional[float] = None,
+                 half_life: Optional[float] = None, interval: Optional[float] = None,
+                 max_tracked: Optional[int] = None):
+        self.scraper = scraper
+        self.budget_per_minute = Config.REFRESH_BUDGET_PER_MINUTE if budget_per_minute is None else budget_per_minute
+        self.lead_time = Config.REFRESH_LEAD_SECONDS if lead_time is None else lead_time
+        self.hot_size = Config.REFRESH_HOT_SIZE if hot_size is None else hot_size
+        self.min_score = Config.REFRESH_MIN_SCORE if min_score is None else min_score
+        self.half_life = Config.REFRESH_HALF_LIFE if half_life is None else half_life
+        self.interval = Config.REFRESH_INTERVAL if interval is None else interval
+        self.max_tracked = Config.REFRESH_MAX_TRACKED if max_tracked is None else max_tracked
+
+        # key -> [score, scored_at, clean_url]
+        self._scores: Dict[CacheKey, List[Any]] = {}
+        # key -> (next attempt, failures in a row)
+        self._retry_at: Dict[CacheKey, Tuple[float, int]] = {}
+        self._lock = threading.Lock()
+
+        self._tokens = 0.0
+        self._tokens_at = time.monotonic()
+        self._task: Optional[asyncio.Task] = None
+
+        self.due = 0
+        self.refreshed = 0
+        self.failed = 0
+        self.deferred = 0
+        self.ticks = 0
+
+    def touch(self, url: str) -> None:
+        """Count a request for the product behind ``url``"""
+        clean_url = self.scraper._clean_amazon_url(url)
+        if not clean_url:
+            return
+
+        key = self.scraper._cache_key(clean_url)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._scores.get(key)
+            if entry is None:
+                if len(self._scores) >= self.max_tracked:
+                    self._forget_coldest(now)
+                self._scores[key] = [1.0, now, clean_url]
+            else:
+                entry[0] = self._decayed(entry, now) + 1.0
+                entry[1] = now
+
+    def hottest(self, limit: Optional[int] = None) -> List[Tuple[CacheKey, float, str]]:
+        """``(key, score, clean_url)`` of the most requested products, hottest first"""
+        now = time.monotonic()
+        with self._lock:
+            scored = [(self._decayed(entry, now), key, entry[2]) for key, entry in self._scores.items()]
+        top = heapq.nlargest(limit or self.hot_size, scored)
+        return [(key, score, clean_url) for score, key, clean_url in top if score >= self.min_score]
+
+    def start(self, loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        """Run the scheduler on ``loop``, by default the running one"""
+        if self._task is None or self._task.done():
+            self._task = (loop or asyncio.get_running_loop()).create_task(self._run())
+            logger.info(f"🔁 Refresh scheduler started ({self.budget_per_minute:g} fetches/min, {self.lead_time:g}s lead)")
+
+    async def stop(self) -> None:
+        """Cancel the loop and wait for an in-flight refresh to unwind"""
+        task, self._task = self._task, None
+        if task is None:
+            return
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        logger.info("🔁 Refresh scheduler stopped")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "tracked": len(self._scores),
+            "due": self.due,
+            "refreshed": self.refreshed,
+            "failed": self.failed,
+            "deferred": self.deferred,
+            "ticks": self.ticks,
+            "budget_per_minute": self.budget_per_minute,
+            "tokens": round(self._tokens, 2),
+        }
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.tick()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Refresh scheduler error: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def tick(self) -> None:
+        """Refresh the hot products that are due, as far as the budget allows"""
+        self.ticks += 1
+        now = time.monotonic()
+        cache = self.scraper.cache
+
+        due = []
+        for key, score, clean_url in self.hottest():
+            if self._retry_at.get(key, (0.0, 0))[0] > now:
+                continue
+            remaining = await cache.price_expires_in_async(key)
+            if remaining is None or remaining <= self.lead_time:
+                # Already expired or evicted entries sort first, they are what users would wait on
+                due.append((remaining if remaining is not None else float('-inf'), -score, key, clean_url))
+        due.sort()
+        self.due = len(due)
+
+        for index, (remaining, _, key, clean_url) in enumerate(due):
+            if not self._take_token():
+                self.deferred += len(due) - index
+                break
+            await self._refresh(key, clean_url)
+
+    async def _refresh(self, key: CacheKey, clean_url: str) -> None:
+        cache = self.scraper.cache
+        before = await cache.price_expires_in_async(key)
+        start = time.perf_counter()
+
+        await self.scraper.refresh_product_info_async(clean_url)
+
+        after = await cache.price_expires_in_async(key)
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage='refresh')
+        if after is not None and (before is None or after > before):
+            self.refreshed += 1
+            self._retry_at.pop(key, None)
+            record_result('refresh', 'success')
+        else:
+            # Back off exponentially, up to one price TTL, so a broken page does not eat the budget
+            self.failed += 1
+            failures = self._retry_at.get(key, (0.0, 0))[1] + 1
+            backoff = min(max(self.lead_time, self.interval) * 2 ** (failures - 1), cache.price_ttl)
+            self._retry_at[key] = (time.monotonic() + backoff, failures)
+            record_result('refresh', 'failure')
+
+    def _take_token(self) -> bool:
+        now = time.monotonic()
+        rate = self.budget_per_minute / 60.0
+        # At most one tick's worth of fetches can be saved up
+        capacity = max(1.0, rate * self.interval)
+        self._tokens = min(capacity, self._tokens + (now - self._tokens_at) * rate)
+        self._tokens_at = now
+        if self._tokens >= 1.0:
+            self._tokens -= 1.0
+            return True
+        return False
+
+    def _decayed(self, entry: List[Any], now: float) -> float:
+        return entry[0] * 0.5 ** ((now - entry[1]) / self.half_life)
+
+    def _forget_coldest(self, now: float) -> None:
+        # Drop the coldest tenth at once so a stream of one-off products does not scan on every touch
+        coldest = heapq.nsmallest(max(1, len(self._scores) // 10), self._scores,
+                                  key=lambda key: self._decayed(self._scores[key], now))
+        for key in coldest:
+            del self._scores[key]
+            self._retry_at.pop(key, None)
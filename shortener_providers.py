@@ -0,0 +1,229 @@
+import time
+import asyncio
+import logging
+import threading
+import urllib.parse
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import httpx
+import requests
+from config import Config
+from http_client import get_session, get_async_client, request_timeout, async_request_timeout
+from log_setup import log_event
+from metrics import track_stage
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class ProviderHealth:
+    """Rolling latency and error record of one shortener provider, with a circuit breaker.
+
+    The breaker opens after ``failure_threshold`` failures in a row and
+    rejects calls for ``cooldown`` seconds. After that one trial call is let
+    through: success closes the breaker, failure opens it again.
+    """
+
+    def __init__(self, window: int = 50, failure_threshold: int = 5, cooldown: float = 30.0,
+                 min_samples: int = 5):
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self.min_samples = min_samples
+
+        self._samples: Deque[Tuple[Optional[float], bool]] = deque(maxlen=max(1, window))
+        self._lock = threading.Lock()
+
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.consecutive_failures = 0
+        self.trial_in_flight = False
+
+        self.calls = 0
+        self.failures = 0
+        self.rejected = 0
+        self.circuit_opens = 0
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = HALF_OPEN
+                self.trial_in_flight = False
+
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+
+            self.rejected += 1
+            return False
+
+    def record(self, latency: Optional[float], ok: bool) -> None:
+        """Record a call's outcome, ``latency`` is None for an answer that needed no round trip.
+
+        Those count for the breaker and the error rate but not for the
+        latency quantiles, they would make the provider look faster than it is.
+        """
+        with self._lock:
+            self.calls += 1
+            self._samples.append((latency, ok))
+
+            if ok:
+                self.consecutive_failures = 0
+                self.state = CLOSED
+                return
+
+            self.failures += 1
+            self.consecutive_failures += 1
+            if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.circuit_opens += 1
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def release_trial(self) -> None:
+        """A half-open trial was cancelled before it finished, let the next call try"""
+        with self._lock:
+            self.trial_in_flight = False
+
+    def latency_quantile(self, quantile: float) -> Optional[float]:
+        """Latency quantile of recent successful calls, None until there are enough samples"""
+        with self._lock:
+            latencies = sorted(latency for latency, ok in self._samples if ok and latency is not None)
+        if len(latencies) < self.min_samples:
+            return None
+        index = min(len(latencies) - 1, int(quantile * len(latencies)))
+        return latencies[index]
+
+    def error_rate(self) -> float:
+        with self._lock:
+            if not self._samples:
+                return 0.0
+            return sum(1 for _, ok in self._samples if not ok) / len(self._samples)
+
+    def stats(self) -> Dict[str, Any]:
+        p50 = self.latency_quantile(0.5)
+        p95 = self.latency_quantile(0.95)
+        return {
+            "state": self.state,
+            "calls": self.calls,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "circuit_opens": self.circuit_opens,
+            "consecutive_failures": self.consecutive_failures,
+            "error_rate": round(self.error_rate(), 3),
+            "p50_seconds": round(p50, 3) if p50 is not None else None,
+            "p95_seconds": round(p95, 3) if p95 is not None else None,
+        }
+
+
+class HTTPShortenerProvider:
+    """Shortener behind a GET API that answers with the short link as plain text.
+
+    Answers are accepted only if they are a URL on the API's own host, so an
+    error page or a stand-in server on another address is never taken for a
+    short link.
+    """
+
+    def __init__(self, name: str, api_url: str, timeout: float, extra_params: Optional[Dict[str, str]] = None,
+                 health: Optional[ProviderHealth] = None):
+        self.name = name
+        self.api_url = api_url
+        self.timeout = timeout
+        self.extra_params = extra_params or {}
+        self.health = health or new_provider_health()
+        self.short_host = (urllib.parse.urlparse(api_url).hostname or '').lower()
+
+        self.wins = 0
+        self.hedges = 0
+
+    def hedge_delay(self) -> float:
+        """How long to wait on this provider before also asking the next one"""
+        p95 = self.health.latency_quantile(0.95)
+        delay = p95 if p95 is not None else Config.SHORTENER_HEDGE_DELAY
+        return min(max(delay, 0.05), self.timeout)
+
+    def shorten(self, url: str) -> Optional[str]:
+        start = time.perf_counter()
+        shortened_url = None
+        try:
+            with track_stage(f'shorten_{self.name}', timeout_types=(requests.Timeout,)):
+                response = get_session().get(self.api_url, params=self._params(url), timeout=request_timeout(self.timeout))
+                response.raise_for_status()
+            shortened_url = self._check(url, response.text)
+        except Exception as e:
+            logger.error(f"{self.name} shortener error: {e}")
+        finally:
+            self.health.record(time.perf_counter() - start, shortened_url is not None)
+        return shortened_url
+
+    async def shorten_async(self, url: str) -> Optional[str]:
+        start = time.perf_counter()
+        shortened_url = None
+        try:
+            with track_stage(f'shorten_{self.name}', timeout_types=(httpx.TimeoutException,)):
+                response = await get_async_client().get(self.api_url, params=self._params(url), timeout=async_request_timeout(self.timeout))
+                response.raise_for_status()
+            shortened_url = self._check(url, response.text)
+        except asyncio.CancelledError:
+            # Lost a hedge race, says nothing about the provider's health
+            self.health.release_trial()
+            raise
+        except Exception as e:
+            logger.error(f"{self.name} shortener error: {e}")
+        self.health.record(time.perf_counter() - start, shortened_url is not None)
+        return shortened_url
+
+    def stats(self) -> Dict[str, Any]:
+        return {"wins": self.wins, "hedges": self.hedges, "hedge_delay_seconds": round(self.hedge_delay(), 3),
+                **self.health.stats()}
+
+    def _params(self, url: str) -> Dict[str, str]:
+        return {**self.extra_params, 'url': url}
+
+    def _check(self, url: str, body: str) -> Optional[str]:
+        shortened_url = body.strip()
+        host = (urllib.parse.urlparse(shortened_url).hostname or '').lower()
+
+        if shortened_url.startswith('http') and host and (host == self.short_host or host.endswith('.' + self.short_host)):
+            logger.info("URL shortened (%s): %s -> %s", self.name, url, shortened_url, extra=log_event('url_shortened'))
+            return shortened_url
+
+        logger.warning("%s failed: %.200s", self.name, shortened_url, extra=log_event('shortener_failed'))
+        return None
+
+
+def new_provider_health() -> ProviderHealth:
+    return ProviderHealth(
+        window=Config.SHORTENER_HEALTH_WINDOW,
+        failure_threshold=Config.SHORTENER_FAILURE_THRESHOLD,
+        cooldown=Config.SHORTENER_CIRCUIT_COOLDOWN
+    )
+
+
+def _local_provider():
+    from local_shortener import get_local_shortener
+    return get_local_shortener()
+
+
+def build_providers(names: List[str]) -> List[Any]:
+    """Create the providers named in ``SHORTENER_PROVIDERS``, in order"""
+    factories = {
+        'tinyurl': lambda: HTTPShortenerProvider('tinyurl', Config.TINYURL_API_URL, Config.TINYURL_TIMEOUT),
+        'isgd': lambda: HTTPShortenerProvider('isgd', Config.ISGD_API_URL, Config.ISGD_TIMEOUT,
+                                              extra_params={'format': 'simple'}),
+        'local': _local_provider,
+    }
+
+    providers = []
+    for name in names:
+        factory = factories.get(name)
+        if factory is None:
+            logger.error(f"Unknown shortener provider: {name}")
+            continue
+        providers.append(factory())
+    return providers
@@ -0,0 +1,20 @@
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Modules build their services from Config at import time, point every file they open at a scratch directory
+_data_dir = tempfile.mkdtemp(prefix='bot-tests-')
+for name, filename in (
+    ('SHORT_URL_DB_PATH', 'short_urls.db'),
+    ('FILE_ID_DB_PATH', 'file_ids.db'),
+    ('SHORT_LINK_DB_PATH', 'short_links.db'),
+    ('UPDATE_QUEUE_DB_PATH', 'updates.db'),
+    ('LEADER_LOCK_PATH', 'leader.lock'),
+    ('POLL_OFFSET_PATH', 'poll_offset'),
+):
+    os.environ.setdefault(name, os.path.join(_data_dir, filename))
+os.environ.setdefault('PRODUCT_STORE_PATH', '')
+os.environ.setdefault('TELEGRAM_BOT_TOKEN', '1:test')
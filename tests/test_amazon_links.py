@@ -0,0 +1,78 @@
+import pytest
+
+from amazon_links import ShortLinkResolver, clean_product_url, find_links, is_short_link
+from persistent_memo import PersistentMemo
+
+
+@pytest.mark.parametrize("url, host, asin", [
+    ("https://www.amazon.in/dp/B07PR1CL3S", "www.amazon.in", "B07PR1CL3S"),
+    ("https://amazon.com/dp/B0CHX1W1XY?th=1&psc=1", "amazon.com", "B0CHX1W1XY"),
+    ("https://m.amazon.in/dp/B07PR1CL3S/ref=mp_s_a_1_1", "m.amazon.in", "B07PR1CL3S"),
+    ("https://smile.amazon.com/gp/product/B0CHX1W1XY", "smile.amazon.com", "B0CHX1W1XY"),
+    ("https://www.amazon.co.uk/boAt-Rockerz-450-Wireless/dp/B07PR1CL3S/ref=sr_1_3", "www.amazon.co.uk",
+     "B07PR1CL3S"),
+    ("https://www.amazon.in/Brand-Store/Some-Slug/dp/B07PR1CL3S", "www.amazon.in", "B07PR1CL3S"),
+    ("https://www.amazon.in/gp/aw/d/B07PR1CL3S", "www.amazon.in", "B07PR1CL3S"),
+    ("http://WWW.AMAZON.IN/exec/obidos/ASIN/B07PR1CL3S", "WWW.AMAZON.IN", "B07PR1CL3S"),
+])
+def test_product_link_forms(url, host, asin):
+    links = find_links(f"dekho {url} isko")
+
+    assert links == [(url, asin, False)]
+    assert clean_product_url(url) == f"https://{host}/dp/{asin}"
+    assert not is_short_link(url)
+
+
+@pytest.mark.parametrize("url", [
+    "https://amzn.to/3xYz12",
+    "https://amzn.in/d/4AbCdEf",
+    "https://amzn.eu/d/0Ab1",
+    "https://amzn.asia/d/xyz",
+    "https://a.co/d/5gHiJkL",
+    "http://AMZN.TO/3xYz12",
+])
+def test_short_link_hosts(url):
+    links = find_links(url)
+
+    assert links == [(url, None, True)]
+    assert is_short_link(url)
+    assert clean_product_url(url) is None
+
+
+@pytest.mark.parametrize("text, url", [
+    ("(https://amzn.to/3xYz12)", "https://amzn.to/3xYz12"),
+    ("https://amzn.to/3xYz12, https://amzn.to/other", "https://amzn.to/3xYz12"),
+    ("Buy here: https://amzn.to/3xYz12.", "https://amzn.to/3xYz12"),
+    ("'https://a.co/d/5gHiJkL'", "https://a.co/d/5gHiJkL"),
+    ('"https://amzn.in/d/4AbCdEf"!', "https://amzn.in/d/4AbCdEf"),
+    ("[https://www.amazon.in/dp/B07PR1CL3S?th=1]", "https://www.amazon.in/dp/B07PR1CL3S?th=1"),
+    ("https://www.amazon.in/dp/B07PR1CL3S?tag=x;", "https://www.amazon.in/dp/B07PR1CL3S?tag=x"),
+    ("kya ye accha hai https://amzn.to/3xYz12?", "https://amzn.to/3xYz12"),
+])
+def test_trailing_punctuation_is_not_part_of_the_link(text, url):
+    assert find_links(text)[0].url == url
+
+
+def test_several_links_in_order():
+    text = "pehla https://amzn.to/aaa aur doosra https://www.amazon.in/dp/B07PR1CL3S, teesra a.co/d/x"
+
+    assert [link.url for link in find_links(text)] == ["https://amzn.to/aaa", "https://www.amazon.in/dp/B07PR1CL3S"]
+
+
+@pytest.mark.parametrize("text", [
+    "https://www.amazon.in/s?k=headphones",
+    "https://www.amazon.in/dp/B07PR1",
+    "https://notamazon.example/dp/B07PR1CL3S",
+    "https://amzn.to/",
+])
+def test_non_product_links_are_ignored(text):
+    assert find_links(text) == []
+
+
+def test_short_link_key_ignores_query_and_trailing_slash(tmp_path):
+    memo = PersistentMemo(str(tmp_path / "short_links.db"), table="short_link_targets", flush_interval=60)
+    resolver = ShortLinkResolver(memo=memo)
+    link = find_links("(https://AMZN.to/3xYz12/?tag=foo)")[0]
+
+    assert resolver._key(link.url) == "amzn.to/3xYz12"
+    memo.close()
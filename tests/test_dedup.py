@@ -0,0 +1,109 @@
+import pytest
+
+import dedup
+from dedup import UpdateDeduplicator
+
+
+class Clock:
+    def __init__(self, now=1700000000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(dedup.time, "time", clock)
+    return clock
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    """Build deduplicators on either backend, sqlite ones share one file like worker processes do"""
+    db_path = str(tmp_path / "updates.db") if request.param == "sqlite" else None
+
+    def build(**kwargs):
+        return UpdateDeduplicator(db_path=db_path, **kwargs)
+    return build
+
+
+def test_redelivery_inside_the_window_is_a_duplicate(backend, clock):
+    deduplicator = backend(window=60)
+
+    assert not deduplicator.is_duplicate(1)
+    assert deduplicator.is_duplicate(1)
+    assert not deduplicator.is_duplicate(2)
+    assert deduplicator.stats()["duplicates"] == 1
+    assert deduplicator.stats()["checked"] == 3
+
+
+def test_ids_are_forgotten_once_the_window_has_passed(backend, clock):
+    deduplicator = backend(window=60)
+    deduplicator.is_duplicate(1)
+
+    clock.now += 61
+    assert not deduplicator.is_duplicate(1)
+    assert deduplicator.is_duplicate(1)
+
+
+def test_forget_lets_a_failed_enqueue_be_retried(backend, clock):
+    deduplicator = backend(window=60)
+    assert not deduplicator.is_duplicate(1)
+
+    deduplicator.forget(1)
+    assert not deduplicator.is_duplicate(1)
+    assert deduplicator.is_duplicate(1)
+
+
+def test_updates_without_an_integer_id_are_never_duplicates(backend, clock):
+    deduplicator = backend(window=60)
+
+    assert not deduplicator.is_duplicate(None)
+    assert not deduplicator.is_duplicate(None)
+    assert not deduplicator.is_duplicate("1")
+    deduplicator.forget(None)
+    assert deduplicator.size() == 0
+
+
+def test_local_index_keeps_at_most_max_entries(clock):
+    deduplicator = UpdateDeduplicator(window=3600, max_entries=3)
+    for update_id in range(5):
+        clock.now += 1
+        deduplicator.is_duplicate(update_id)
+
+    assert deduplicator.size() == 3
+    # The oldest ids made room, the newest are still caught
+    assert not deduplicator.is_duplicate(0)
+    assert deduplicator.is_duplicate(4)
+
+
+def test_shared_index_is_pruned_to_the_window_and_max_entries(tmp_path, clock):
+    deduplicator = UpdateDeduplicator(window=60, max_entries=3, db_path=str(tmp_path / "updates.db"), prune_every=1)
+    for update_id in range(5):
+        clock.now += 1
+        deduplicator.is_duplicate(update_id)
+    assert deduplicator.size() == 3
+
+    clock.now += 120
+    deduplicator.is_duplicate(100)
+    assert deduplicator.size() == 1
+
+
+def test_shared_index_catches_a_retry_on_another_worker(tmp_path, clock):
+    db_path = str(tmp_path / "updates.db")
+    first_worker = UpdateDeduplicator(window=60, db_path=db_path)
+    second_worker = UpdateDeduplicator(window=60, db_path=db_path)
+
+    assert not first_worker.is_duplicate(7)
+    assert second_worker.is_duplicate(7)
+
+    second_worker.forget(7)
+    assert not first_worker.is_duplicate(7)
+    assert first_worker.stats()["backend"] == "sqlite"
+
+
+def test_local_index_is_per_process(clock):
+    assert not UpdateDeduplicator(window=60).is_duplicate(7)
+    assert not UpdateDeduplicator(window=60).is_duplicate(7)
@@ -0,0 +1,133 @@
+import asyncio
+
+from dispatcher import UpdateDispatcher, get_chat_key, update_deadline
+
+
+def update(update_id, chat_id):
+    return {"update_id": update_id, "message": {"message_id": update_id, "chat": {"id": chat_id}, "text": "hi"}}
+
+
+class Recorder:
+    """Handler that records start and finish order and holds ``slow_chat``'s updates until released"""
+
+    def __init__(self, slow_chat=None):
+        self.slow_chat = slow_chat
+        self.release = asyncio.Event()
+        self.started = []
+        self.finished = []
+        self.running = 0
+        self.max_running = 0
+
+    async def __call__(self, update_data):
+        self.started.append(update_data['update_id'])
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            if get_chat_key(update_data) == self.slow_chat:
+                await self.release.wait()
+            else:
+                await asyncio.sleep(0)
+        finally:
+            self.running -= 1
+        self.finished.append(update_data['update_id'])
+        return True
+
+
+def test_updates_of_one_chat_run_in_order_one_at_a_time():
+    async def run():
+        handler = Recorder()
+        dispatcher = UpdateDispatcher(handler, max_concurrency=8)
+        for update_id in range(10):
+            await dispatcher.submit(update(update_id, 1))
+        await dispatcher.join()
+        return handler, dispatcher
+
+    handler, dispatcher = asyncio.run(run())
+    assert handler.finished == list(range(10))
+    assert handler.max_running == 1
+    assert dispatcher.stats()["processed"] == 10
+    assert dispatcher.free_slots() == 8
+
+
+def test_a_chat_backlog_holds_no_slots_and_other_chats_keep_running():
+    async def run():
+        handler = Recorder(slow_chat=1)
+        dispatcher = UpdateDispatcher(handler, max_concurrency=2)
+        for update_id in range(20):
+            await dispatcher.submit(update(update_id, 1))
+        # Chat 1 has one update running and 19 queued, only the running one holds a slot
+        assert dispatcher.free_slots() == 1
+        for update_id in range(100, 105):
+            await asyncio.wait_for(dispatcher.submit(update(update_id, update_id)), timeout=1)
+        await asyncio.sleep(0.05)
+        other_chats_done = [u for u in handler.finished if u >= 100]
+        handler.release.set()
+        await dispatcher.join()
+        return handler, other_chats_done
+
+    handler, other_chats_done = asyncio.run(run())
+    assert other_chats_done == list(range(100, 105))
+    assert [u for u in handler.finished if u < 100] == list(range(20))
+    assert handler.max_running <= 2
+
+
+def test_submit_waits_once_a_chat_backlog_is_full():
+    async def run():
+        handler = Recorder(slow_chat=1)
+        dispatcher = UpdateDispatcher(handler, max_concurrency=4, max_chat_backlog=3)
+        for update_id in range(4):
+            await dispatcher.submit(update(update_id, 1))
+        blocked = asyncio.ensure_future(dispatcher.submit(update(4, 1)))
+        await asyncio.sleep(0.02)
+        was_blocked = not blocked.done()
+        handler.release.set()
+        await blocked
+        await dispatcher.join()
+        return handler, was_blocked
+
+    handler, was_blocked = asyncio.run(run())
+    assert was_blocked
+    assert handler.finished == list(range(5))
+
+
+def test_new_chats_wait_for_a_slot():
+    async def run():
+        handler = Recorder(slow_chat=1)
+        dispatcher = UpdateDispatcher(handler, max_concurrency=1)
+        await dispatcher.submit(update(1, 1))
+        blocked = asyncio.ensure_future(dispatcher.submit(update(2, 2)))
+        await asyncio.sleep(0.02)
+        was_blocked = not blocked.done()
+        handler.release.set()
+        await blocked
+        await dispatcher.join()
+        return handler, was_blocked
+
+    handler, was_blocked = asyncio.run(run())
+    assert was_blocked
+    assert handler.finished == [1, 2]
+
+
+def test_timeouts_and_failures_are_reported_to_on_done():
+    done = []
+
+    async def handler(update_data):
+        if update_data['update_id'] == 1:
+            await asyncio.sleep(1)
+        if update_data['update_id'] == 2:
+            raise RuntimeError("boom")
+        assert update_deadline.get() is not None
+        return True
+
+    async def run():
+        dispatcher = UpdateDispatcher(handler, timeout=0.05,
+                                      on_done=lambda data, success: done.append((data['update_id'], success)))
+        for update_id in (1, 2, 3):
+            await dispatcher.submit(update(update_id, update_id))
+        await dispatcher.join()
+        return dispatcher
+
+    dispatcher = asyncio.run(run())
+    assert sorted(done) == [(1, False), (2, False), (3, True)]
+    assert dispatcher.stats()["timeouts"] == 1
+    assert dispatcher.stats()["failed"] == 2
@@ -0,0 +1,52 @@
+from durable_queue import DurableUpdateQueue
+
+
+def message(update_id, chat_id):
+    return {"update_id": update_id, "message": {"message_id": update_id, "chat": {"id": chat_id}, "text": "hi"}}
+
+
+def claimed_ids(claimed):
+    return [update_data["update_id"] for _, update_data in claimed]
+
+
+def test_busy_chat_backlog_does_not_starve_other_chats(tmp_path):
+    queue = DurableUpdateQueue(str(tmp_path / "updates.db"))
+    for update_id in range(1, 21):
+        queue.put(message(update_id, chat_id=1))
+    queue.put(message(21, chat_id=2))
+
+    assert claimed_ids(queue.claim(2)) == [1, 21]
+    # Chat 1 holds a lease and chat 2 has nothing left
+    assert queue.claim(2) == []
+
+
+def test_chat_order_holds_across_claims(tmp_path):
+    queue = DurableUpdateQueue(str(tmp_path / "updates.db"))
+    for update_id in (1, 2, 3):
+        queue.put(message(update_id, chat_id=1))
+
+    assert claimed_ids(queue.claim(5)) == [1]
+    queue.ack(1)
+    assert claimed_ids(queue.claim(5)) == [2]
+    queue.ack(2)
+    assert claimed_ids(queue.claim(5)) == [3]
+
+
+def test_updates_without_a_chat_are_claimed_together(tmp_path):
+    queue = DurableUpdateQueue(str(tmp_path / "updates.db"))
+    queue.put({"update_id": 1, "inline_query": {"id": "a", "query": ""}})
+    queue.put({"update_id": 2, "inline_query": {"id": "b", "query": ""}})
+    queue.put(message(3, chat_id=5))
+
+    assert claimed_ids(queue.claim(10)) == [1, 2, 3]
+
+
+def test_expired_lease_is_reclaimed(tmp_path):
+    queue = DurableUpdateQueue(str(tmp_path / "updates.db"), lease_seconds=-1)
+    queue.put(message(1, chat_id=1))
+    queue.put(message(2, chat_id=1))
+
+    assert claimed_ids(queue.claim(1)) == [1]
+    # The lease is already over, so the same update comes back before the next one of its chat
+    assert claimed_ids(queue.claim(1)) == [1]
+    assert queue.reclaimed == 1
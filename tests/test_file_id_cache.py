@@ -0,0 +1,104 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from telegram.error import BadRequest, TimedOut
+
+import bot_handlers
+from file_id_cache import FileIdCache
+from persistent_memo import PersistentMemo
+
+IMAGE_URL = "https://m.media-amazon.com/images/I/product.jpg"
+PRODUCT = {"title": "boAt Rockerz 450", "url": "https://www.amazon.in/dp/B07PR1CL3S", "image_url": IMAGE_URL}
+ASIN = "B07PR1CL3S"
+
+
+class FakeMessage:
+    """``update.message`` whose reply_photo fails for file_ids with the given errors"""
+
+    def __init__(self, errors=None):
+        self.errors = errors or {}
+        self.sent = []
+
+    async def reply_photo(self, photo, caption=None, parse_mode=None):
+        self.sent.append(photo)
+        if photo in self.errors:
+            raise self.errors[photo]
+        file_id = photo if not photo.startswith("http") else "uploaded-file-id"
+        return SimpleNamespace(photo=[SimpleNamespace(file_id=file_id)])
+
+
+@pytest.fixture
+def file_ids(tmp_path, monkeypatch):
+    cache = FileIdCache(PersistentMemo(str(tmp_path / "file_ids.db"), table="photo_file_ids", flush_interval=60))
+    monkeypatch.setattr(bot_handlers, "photo_file_ids", cache)
+    yield cache
+    cache.memo.close()
+
+
+def send(message):
+    return asyncio.run(bot_handlers.send_product_photo(SimpleNamespace(message=message), PRODUCT, "caption"))
+
+
+def test_uploaded_photo_is_remembered_and_reused(file_ids):
+    first = FakeMessage()
+    send(first)
+    assert first.sent == [IMAGE_URL]
+
+    second = FakeMessage()
+    send(second)
+    assert second.sent == ["uploaded-file-id"]
+    assert file_ids.stats()["hits"] == 1
+
+
+def test_rejected_file_id_falls_back_to_the_image_url_and_is_evicted(file_ids):
+    file_ids.put(ASIN, IMAGE_URL, "stale-id")
+    message = FakeMessage({"stale-id": BadRequest("Wrong file identifier/http url specified")})
+
+    send(message)
+
+    assert message.sent == ["stale-id", IMAGE_URL]
+    assert file_ids.stats()["rejected"] == 1
+    # The upload's new id replaced the refused one
+    assert file_ids.cached(ASIN, IMAGE_URL) == "uploaded-file-id"
+
+
+def test_transient_send_error_keeps_the_file_id(file_ids):
+    file_ids.put(ASIN, IMAGE_URL, "good-id")
+    message = FakeMessage({"good-id": TimedOut()})
+
+    with pytest.raises(TimedOut):
+        send(message)
+
+    assert message.sent == ["good-id"]
+    assert file_ids.stats()["rejected"] == 0
+    assert file_ids.cached(ASIN, IMAGE_URL) == "good-id"
+
+
+def test_unrelated_bad_request_keeps_the_file_id(file_ids):
+    file_ids.put(ASIN, IMAGE_URL, "good-id")
+    message = FakeMessage({"good-id": BadRequest("Message caption is too long")})
+
+    with pytest.raises(BadRequest):
+        send(message)
+
+    assert file_ids.cached(ASIN, IMAGE_URL) == "good-id"
+
+
+def test_a_changed_image_is_uploaded_fresh(file_ids):
+    file_ids.put(ASIN, "https://m.media-amazon.com/images/I/old.jpg", "old-id")
+    assert file_ids.cached(ASIN, IMAGE_URL) is None
+
+    message = FakeMessage()
+    send(message)
+    assert message.sent == [IMAGE_URL]
+
+
+def test_reject_is_flushed_as_a_delete(file_ids):
+    file_ids.put(ASIN, IMAGE_URL, "stale-id")
+    file_ids.memo.flush()
+    file_ids.reject(ASIN)
+    file_ids.memo.flush()
+
+    assert len(file_ids.memo) == 0
+    assert asyncio.run(file_ids.get_async(ASIN, IMAGE_URL)) is None
@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+
+import bot_handlers
+
+LONG_URL = "https://www.amazon.in/boAt-Rockerz-450-Wireless-Headphones/dp/B07PR1CL3S/ref=sr_1_3?keywords=boat&psc=1"
+SHORT_URL = "https://tinyurl.com/abc123"
+
+
+@pytest.fixture
+def offline(monkeypatch):
+    """Scrape and shorten without the network, recording what was asked for"""
+    calls = {"fetched": [], "shortened": []}
+
+    async def fetch(clean_url):
+        calls["fetched"].append(clean_url)
+        return {"title": "boAt Rockerz 450", "price": "₹1,499", "image_url": None, "url": clean_url}
+
+    async def shorten(url):
+        calls["shortened"].append(url)
+        return SHORT_URL
+
+    monkeypatch.setattr(bot_handlers.amazon_scraper, "_fetch_product_info_async", fetch)
+    monkeypatch.setattr(bot_handlers.url_shortener, "_shorten_remote_async", shorten)
+    return calls
+
+
+def test_long_product_link_is_answered_from_the_caches_once_resolved(offline):
+    assert bot_handlers.inline_result(LONG_URL) is None
+
+    product = asyncio.run(bot_handlers.resolve_product(LONG_URL))
+    assert product["short_url"] == SHORT_URL
+
+    result = bot_handlers.inline_result(LONG_URL)
+    assert result is not None
+    assert result.id == "B07PR1CL3S:a"
+    assert SHORT_URL in result.input_message_content.message_text
+    assert offline["shortened"] == [bot_handlers.amazon_scraper.generate_affiliate_link(
+        "https://www.amazon.in/dp/B07PR1CL3S")]
+
+
+def test_other_forms_of_the_same_product_share_the_cached_answer(offline):
+    asyncio.run(bot_handlers.resolve_product("https://www.amazon.in/dp/B0CHX1W1XY?th=1"))
+
+    result = bot_handlers.inline_result("https://www.amazon.in/Some-Slug/dp/B0CHX1W1XY/ref=xyz")
+    assert result is not None
+    assert len(offline["fetched"]) == 1
+    assert len(offline["shortened"]) == 1
+
+
+def test_provisional_answer_until_the_product_is_cached():
+    result = bot_handlers.provisional_inline_result("https://www.amazon.in/dp/B0NOTCACHE")
+
+    assert result.id.startswith("pending:")
+    assert bot_handlers.inline_result("https://www.amazon.in/dp/B0NOTCACHE") is None
@@ -0,0 +1,109 @@
+import queue
+
+import pytest
+
+from intake import BUSY_MESSAGE, HIGH, LOW, LoadShedder, PriorityUpdateQueue, busy_reply, classify_update
+
+LINK = "https://www.amazon.in/dp/B07PR1CL3S"
+
+
+def message(update_id, chat_id, text):
+    return {"update_id": update_id, "message": {"message_id": update_id * 10, "chat": {"id": chat_id}, "text": text}}
+
+
+def drain(intake):
+    order = []
+    while True:
+        item = intake.get_nowait()
+        if item is None:
+            return order
+        order.append(item[1]["update_id"])
+
+
+def roomy_queue():
+    return PriorityUpdateQueue(LoadShedder(max_size=100, high_watermark=100, low_watermark=50))
+
+
+def test_classification():
+    assert classify_update(message(1, 1, f"dekho {LINK}")) == LOW
+    assert classify_update(message(1, 1, "hello")) == HIGH
+    assert classify_update(message(1, 1, f"/start {LINK}")) == HIGH
+    assert classify_update({"update_id": 1, "callback_query": {"id": "x"}}) == HIGH
+
+
+def test_other_chats_overtake_link_messages():
+    intake = roomy_queue()
+    intake.offer(message(1, 1, LINK))
+    intake.offer(message(2, 2, "hello"))
+    intake.offer(message(3, 3, LINK))
+    intake.offer(message(4, 4, "/help"))
+
+    assert drain(intake) == [2, 4, 1, 3]
+
+
+def test_a_chat_keeps_its_own_order_behind_its_link_message():
+    intake = roomy_queue()
+    intake.offer(message(1, 1, LINK))
+    intake.offer(message(2, 1, "aur ye?"))
+    intake.offer(message(3, 2, "hello"))
+    intake.offer(message(4, 1, LINK))
+    intake.offer(message(5, 1, "thanks"))
+
+    assert drain(intake) == [3, 1, 2, 4, 5]
+
+
+def test_a_chat_is_high_priority_again_once_its_links_are_handed_out():
+    intake = roomy_queue()
+    intake.offer(message(1, 1, LINK))
+    intake.offer(message(2, 2, LINK))
+    assert drain(intake) == [1, 2]
+
+    intake.offer(message(3, 2, LINK))
+    intake.offer(message(4, 1, "hello"))
+    assert drain(intake) == [4, 3]
+
+
+def test_get_times_out_when_empty():
+    with pytest.raises(queue.Empty):
+        roomy_queue().get(timeout=0.01)
+
+
+def test_shedder_sheds_low_priority_between_the_watermarks():
+    shedder = LoadShedder(max_size=10, high_watermark=6, low_watermark=3)
+
+    assert shedder.admit(LOW, 5)
+    assert not shedder.admit(LOW, 6)
+    assert shedder.shedding
+    # High priority still gets in until the queue is full
+    assert shedder.admit(HIGH, 8)
+    assert not shedder.admit(HIGH, 10)
+    # Hysteresis: still shedding low on the way down until the low watermark
+    assert not shedder.admit(LOW, 4)
+    assert shedder.admit(LOW, 3)
+    assert not shedder.shedding
+
+    assert shedder.stats()["shed"] == {HIGH: 1, LOW: 2}
+    assert shedder.stats()["shedding_episodes"] == 1
+
+
+def test_offer_refuses_shed_updates():
+    intake = PriorityUpdateQueue(LoadShedder(max_size=3, high_watermark=2, low_watermark=1))
+
+    assert intake.offer(message(1, 1, "hello"))
+    assert intake.offer(message(2, 2, "hello"))
+    assert not intake.offer(message(3, 3, LINK))
+    assert intake.offer(message(4, 4, "hello"))
+    assert not intake.offer(message(5, 5, "hello"))
+    assert intake.qsize() == 3
+    assert intake.stats()["accepted"] == 3
+
+
+def test_busy_reply_answers_in_the_chat():
+    reply = busy_reply(message(7, 42, LINK))
+
+    assert reply == {"method": "sendMessage", "chat_id": 42, "text": BUSY_MESSAGE, "reply_to_message_id": 70}
+
+
+def test_no_busy_reply_without_a_message():
+    assert busy_reply({"update_id": 1, "callback_query": {"id": "x", "message": {"chat": {"id": 1}}}}) is None
+    assert busy_reply({"update_id": 1, "inline_query": {"id": "x", "query": LINK}}) is None
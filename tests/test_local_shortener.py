@@ -0,0 +1,100 @@
+import sqlite3
+
+import pytest
+
+import local_shortener
+from local_shortener import CODE_LENGTH, LocalShortener, encode_base62
+
+URL = "https://www.amazon.in/dp/B000000001?tag=x"
+
+
+@pytest.fixture
+def shortener(tmp_path):
+    return LocalShortener(str(tmp_path / "links.db"), "https://bot.example/r")
+
+
+@pytest.mark.parametrize("number, code", [(0, "0"), (1, "1"), (61, "Z"), (62, "10"), (3843, "ZZ")])
+def test_base62(number, code):
+    assert encode_base62(number) == code
+
+
+def test_codes_are_stable_per_url(shortener):
+    code = shortener.create(URL)
+
+    assert shortener.create(URL) == code
+    assert shortener.resolve(code) == URL
+
+
+def test_codes_are_random_not_rowids(shortener):
+    codes = [shortener.create(f"https://www.amazon.in/dp/B00000000{n}?tag=x") for n in range(5)]
+
+    assert all(len(code) == CODE_LENGTH for code in codes)
+    assert len(set(codes)) == 5
+    # Counting does not find links
+    for guess in ["1", "2", "3", "10"]:
+        assert shortener.resolve(guess) is None
+
+
+def test_a_taken_code_is_drawn_again(shortener, monkeypatch):
+    first = shortener.create(URL)
+    draws = iter([first, "abcdefgh"])
+    monkeypatch.setattr(local_shortener, "random_code", lambda: next(draws))
+
+    assert shortener.create("https://www.amazon.in/dp/B000000002?tag=x") == "abcdefgh"
+    assert shortener.stats()["collisions"] == 1
+    assert shortener.resolve(first) == URL
+
+
+def test_padded_and_foreign_codes_do_not_resolve(shortener):
+    code = shortener.create(URL)
+
+    assert shortener.resolve("0" + code) is None
+    assert shortener.resolve("zz") is None
+    assert shortener.resolve("no-such!") is None
+    assert shortener.resolve("1" * 12) is None
+    assert shortener.resolve("") is None
+
+
+def test_nothing_is_loaded_at_startup_links_come_from_the_database_on_use(tmp_path, shortener):
+    url = "https://www.amazon.in/dp/B000000002?tag=x"
+    code = shortener.create(url)
+
+    # A second process only knows the link from the database
+    other = LocalShortener(str(tmp_path / "links.db"), "https://bot.example/r")
+    assert other.stats()["cached"] == 0
+
+    assert other.resolve(code) == url
+    assert other.create(url) == code
+    assert other.stats()["created"] == 0
+
+
+def test_memory_is_bounded_and_evicted_links_still_work(tmp_path):
+    shortener = LocalShortener(str(tmp_path / "links.db"), "https://bot.example/r", max_cached=2)
+    links = {f"https://www.amazon.in/dp/B00000000{n}?tag=x": None for n in range(4)}
+    for url in links:
+        links[url] = shortener.create(url)
+
+    assert shortener.stats()["cached"] == 2
+    assert len(shortener._url_to_code) == 2
+    for url, code in links.items():
+        assert shortener.resolve(code) == url
+        assert shortener.create(url) == code
+    assert shortener.stats()["created"] == 4
+
+
+def test_links_from_before_random_codes_keep_their_rowid_code(tmp_path):
+    db_path = str(tmp_path / "links.db")
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE short_links (id INTEGER PRIMARY KEY AUTOINCREMENT, url TEXT NOT NULL UNIQUE)")
+    conn.executemany("INSERT INTO short_links (url) VALUES (?)", [(URL,), ("https://www.amazon.in/dp/B000000002",)])
+    conn.commit()
+    conn.close()
+
+    shortener = LocalShortener(db_path, "https://bot.example/r")
+
+    assert shortener.resolve("1") == URL
+    assert shortener.resolve("2") == "https://www.amazon.in/dp/B000000002"
+    assert shortener.create(URL) == "1"
+    assert len(shortener.create("https://www.amazon.in/dp/B000000003")) == CODE_LENGTH
+    # Opening it again finds nothing left to migrate
+    assert LocalShortener(db_path, "https://bot.example/r").resolve("1") == URL
@@ -0,0 +1,88 @@
+import time
+import asyncio
+import sqlite3
+
+from persistent_memo import PersistentMemo
+
+
+def disk_rows(path, table="memo"):
+    with sqlite3.connect(path) as conn:
+        return dict(conn.execute(f"SELECT key, value FROM {table}").fetchall())
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not met in time"
+        time.sleep(0.01)
+
+
+def test_writes_survive_a_restart(tmp_path):
+    path = str(tmp_path / "memo.db")
+    memo = PersistentMemo(path, flush_interval=60)
+    memo.put("a", "1")
+    memo.close()
+
+    reopened = PersistentMemo(path, flush_interval=60, warm_load=False)
+    assert reopened.get("a") == "1"
+    assert reopened.stats()["disk_hits"] == 1
+    reopened.close()
+
+
+def test_a_full_batch_is_flushed_by_the_background_thread(tmp_path):
+    path = str(tmp_path / "memo.db")
+    memo = PersistentMemo(path, batch_size=3, flush_interval=60)
+    for key in "abc":
+        memo.put(key, key.upper())
+
+    wait_for(lambda: memo.stats()["flushes"] == 1)
+    assert disk_rows(path) == {"a": "A", "b": "B", "c": "C"}
+    memo.close()
+
+
+def test_delete_hides_the_key_at_once_and_removes_it_on_flush(tmp_path):
+    path = str(tmp_path / "memo.db")
+    memo = PersistentMemo(path, flush_interval=60)
+    memo.put("a", "1")
+    memo.flush()
+
+    memo.delete("a")
+    assert memo.get("a") is None
+    assert memo.peek("a") is None
+    assert disk_rows(path) == {"a": "1"}
+
+    memo.flush()
+    assert disk_rows(path) == {}
+    memo.close()
+
+
+def test_get_async_reads_the_disk_off_the_loop(tmp_path):
+    path = str(tmp_path / "memo.db")
+    memo = PersistentMemo(path, flush_interval=60)
+    memo.put("a", "1")
+    memo.close()
+
+    reopened = PersistentMemo(path, flush_interval=60, warm_load=False)
+    assert reopened.peek("a") is None
+
+    async def lookup():
+        return await reopened.get_async("a"), await reopened.get_async("missing")
+
+    assert asyncio.run(lookup()) == ("1", None)
+    # The disk hit is in the front cache now
+    assert reopened.peek("a") == "1"
+    assert reopened.stats()["misses"] == 1
+    reopened.close()
+
+
+def test_max_rows_keeps_the_newest_rows(tmp_path):
+    path = str(tmp_path / "memo.db")
+    memo = PersistentMemo(path, flush_interval=60, max_rows=2)
+    for key in "abc":
+        memo.put(key, key)
+        memo.flush()
+        time.sleep(0.01)
+
+    assert disk_rows(path) == {"b": "b", "c": "c"}
+    assert memo.stats()["evictions"] == 1
+    memo.close()
@@ -0,0 +1,98 @@
+import asyncio
+
+from poller import BotApiError, UpdatePoller
+
+
+class FakeBotApi:
+    """Serves getUpdates from a list of pending updates like Telegram does"""
+
+    def __init__(self, pending, reply_delay=0.0):
+        self.pending = pending
+        self.reply_delay = reply_delay
+        self.calls = []
+
+    async def __call__(self, method, params, read_timeout=None):
+        self.calls.append((method, params))
+        if method == 'getUpdates':
+            offset = params.get('offset') or 0
+            batch = [u for u in self.pending if u['update_id'] >= offset][:params['limit']]
+            if not batch:
+                await asyncio.sleep(0.01)
+            return batch
+        if method == 'sendMessage':
+            await asyncio.sleep(self.reply_delay)
+        return True
+
+
+def updates(first, count):
+    return [{"update_id": update_id, "message": {"message_id": update_id, "chat": {"id": 1}, "text": "hi"}}
+            for update_id in range(first, first + count)]
+
+
+def run_poller(poller, seconds):
+    async def run():
+        poller.start()
+        await asyncio.sleep(seconds)
+        await poller.stop()
+    asyncio.run(run())
+
+
+def test_batches_are_ingested_and_the_offset_survives_a_restart(tmp_path):
+    offset_path = str(tmp_path / "poll_offset")
+    ingested = []
+
+    def ingest(batch):
+        ingested.extend(u['update_id'] for u in batch)
+        return len(batch), []
+
+    api = FakeBotApi(updates(100, 250))
+    poller = UpdatePoller('token', ingest, offset_path, timeout=1)
+    poller._call = api
+    run_poller(poller, 0.2)
+
+    assert ingested == list(range(100, 350))
+    assert [method for method, _ in api.calls[:4]] == ['deleteWebhook', 'getUpdates', 'getUpdates', 'getUpdates']
+    assert poller.stats()["updates"] == 250
+    assert open(offset_path).read() == "350"
+
+    restarted = UpdatePoller('token', ingest, offset_path, timeout=1)
+    restarted._call = FakeBotApi(updates(100, 250))
+    run_poller(restarted, 0.1)
+    assert restarted._call.calls[1][1]["offset"] == 350
+    assert len(ingested) == 250
+
+
+def test_offset_stays_put_when_ingest_fails(tmp_path):
+    offset_path = str(tmp_path / "poll_offset")
+
+    def ingest(batch):
+        raise RuntimeError("queue unavailable")
+
+    poller = UpdatePoller('token', ingest, offset_path, timeout=1, retry_cap=0.01)
+    poller._call = FakeBotApi(updates(1, 3))
+    run_poller(poller, 0.1)
+
+    assert poller.offset is None
+    assert poller.stats()["errors"] >= 1
+    assert not (tmp_path / "poll_offset").exists()
+
+
+def test_busy_replies_do_not_hold_up_polling(tmp_path):
+    def ingest(batch):
+        return 0, [{"method": "sendMessage", "chat_id": 1, "text": "busy"} for _ in batch]
+
+    api = FakeBotApi(updates(1, 5), reply_delay=5)
+    poller = UpdatePoller('token', ingest, str(tmp_path / "poll_offset"), timeout=1)
+    poller._call = api
+    run_poller(poller, 0.2)
+
+    methods = [method for method, _ in api.calls]
+    assert methods.count('sendMessage') == 5
+    # Polling went on while the replies were still in flight
+    assert methods.count('getUpdates') > 2
+    assert poller.stats()["shed"] == 5
+
+
+def test_retry_after_is_kept_from_the_api_error():
+    error = BotApiError('getUpdates', 'Too Many Requests', retry_after=3)
+    assert error.retry_after == 3
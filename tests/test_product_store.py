@@ -0,0 +1,144 @@
+import time
+import asyncio
+import threading
+
+import pytest
+
+from product_cache import ProductCache
+from product_store import ProductRecord, ProductStore
+
+KEY = ("amazon.in", "B07PR1CL3S")
+INFO = {
+    "title": "boAt Rockerz 450",
+    "price": "₹1,499",
+    "image_url": "https://m.media-amazon.com/images/I/51abc._SL1500_.jpg",
+    "url": "https://www.amazon.in/dp/B07PR1CL3S",
+}
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "products.db")
+
+
+def test_record_round_trip():
+    record = ProductRecord.from_info(KEY, INFO, fetched_at=1700000000.5)
+
+    decoded = ProductRecord.decode(KEY, record.encode())
+    assert decoded == record
+    assert decoded.to_info() == INFO
+
+
+def test_store_is_opened_on_first_use(db_path, tmp_path):
+    store = ProductStore(db_path)
+    assert not (tmp_path / "products.db").exists()
+
+    assert store.get(KEY) is None
+    assert (tmp_path / "products.db").exists()
+
+
+def test_miss_falls_back_to_the_shared_store(db_path):
+    writer = ProductCache(store=ProductStore(db_path))
+    writer.put(KEY, INFO)
+    writer.flush()
+
+    # Another worker process, its own cache is empty
+    reader = ProductCache(store=ProductStore(db_path))
+    assert reader.get(KEY) == INFO
+    assert reader.stats()["store_hits"] == 1
+    assert len(reader) == 1
+
+
+class ThreadRecordingStore(ProductStore):
+    """Remembers which threads read it"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.read_threads = []
+
+    def get(self, key):
+        self.read_threads.append(threading.current_thread().name)
+        return super().get(key)
+
+
+def test_async_lookups_read_the_store_off_the_loop(db_path):
+    writer = ProductCache(store=ProductStore(db_path))
+    writer.put(KEY, INFO)
+    writer.flush()
+
+    store = ThreadRecordingStore(db_path)
+    reader = ProductCache(store=store)
+
+    async def lookups():
+        return await reader.price_expires_in_async(KEY), await reader.get_async(KEY)
+
+    remaining, info = asyncio.run(lookups())
+    assert info == INFO
+    assert 0 < remaining <= reader.price_ttl
+    assert store.read_threads
+    assert all(name.startswith("product-store-read") for name in store.read_threads)
+
+
+def test_get_local_never_reads_the_store(db_path):
+    writer = ProductCache(store=ProductStore(db_path))
+    writer.put(KEY, INFO)
+    writer.flush()
+
+    store = ThreadRecordingStore(db_path)
+    reader = ProductCache(store=store)
+    assert reader.get_local(KEY) is None
+    assert store.read_threads == []
+
+    asyncio.run(reader.get_stale_async(KEY))
+    assert reader.get_local(KEY) == INFO
+
+
+def test_expired_price_is_not_served_from_the_store(db_path):
+    store = ProductStore(db_path)
+    store.put(ProductRecord.from_info(KEY, INFO, fetched_at=time.time() - 1000))
+
+    cache = ProductCache(price_ttl=900, store=store)
+    assert cache.get(KEY) is None
+    assert cache.get_stale(KEY)["price"] is None
+
+
+def test_records_older_than_the_ttl_are_ignored(db_path):
+    store = ProductStore(db_path)
+    store.put(ProductRecord.from_info(KEY, INFO, fetched_at=time.time() - 7 * 3600))
+
+    assert ProductCache(ttl=6 * 3600, store=store).get_stale(KEY) is None
+
+
+def test_price_expires_in_does_not_load_or_count(db_path):
+    writer = ProductCache(store=ProductStore(db_path))
+    writer.put(KEY, INFO)
+    writer.flush()
+
+    reader = ProductCache(max_size=1, store=ProductStore(db_path))
+    reader.put(("amazon.in", "B000000001"), INFO)
+
+    remaining = reader.price_expires_in(KEY)
+    assert 0 < remaining <= reader.price_ttl
+    assert reader.stats()["store_hits"] == 0
+    # The live entry was not evicted to make room for the peeked one
+    assert reader.get(("amazon.in", "B000000001")) is not None
+
+
+def test_invalidate_removes_the_shared_record(db_path):
+    cache = ProductCache(store=ProductStore(db_path))
+    cache.put(KEY, INFO)
+    cache.invalidate(KEY)
+    cache.flush()
+
+    assert ProductCache(store=ProductStore(db_path)).get(KEY) is None
+
+
+def test_store_keeps_the_most_recently_fetched_records(db_path):
+    store = ProductStore(db_path, max_records=50, evict_every=10)
+    now = time.time()
+    for index in range(120):
+        store.put(ProductRecord("amazon.in", f"B{index:09d}", "t", None, None, now - 120 + index))
+
+    assert len(store) == 50
+    assert store.get(("amazon.in", "B000000119")) is not None
+    assert store.get(("amazon.in", "B000000000")) is None
@@ -0,0 +1,169 @@
+import random
+
+import pytest
+import requests
+
+import amazon_scraper
+from amazon_scraper import AmazonScraper, AmazonThrottled
+from config import Config
+from dispatcher import update_deadline
+from product_cache import ProductCache
+from rate_limiter import AdaptiveRateLimiter, backoff_delay
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def limiter(clock, **kwargs):
+    options = {"rate": 2.0, "burst": 2.0, "min_rate": 0.25, "max_rate": 4.0, "increase": 0.5, "decrease": 0.5}
+    options.update(kwargs)
+    return AdaptiveRateLimiter("amazon.in", clock=clock, **options)
+
+
+def test_burst_then_paced_slots():
+    clock = Clock()
+    bucket = limiter(clock)
+
+    assert bucket.reserve(10) == 0.0
+    assert bucket.reserve(10) == 0.0
+    # Out of tokens, the next slots are 1/rate apart
+    assert bucket.reserve(10) == pytest.approx(0.5)
+    assert bucket.reserve(10) == pytest.approx(1.0)
+    assert bucket.reserve(0.9) is None
+    assert bucket.stats()["refused"] == 1
+
+    clock.now += 10
+    assert bucket.reserve(0) == 0.0
+
+
+def test_throttle_halves_the_rate_and_drops_saved_tokens():
+    clock = Clock()
+    bucket = limiter(clock)
+
+    bucket.record_throttle()
+    assert bucket.rate == 1.0
+    # The saved-up burst is gone, the next slot is a full interval away
+    assert bucket.reserve(10) == pytest.approx(1.0)
+
+    for _ in range(10):
+        bucket.record_throttle()
+    assert bucket.rate == 0.25
+
+
+def test_successes_recover_the_rate_up_to_the_maximum():
+    bucket = limiter(Clock(), rate=1.0)
+
+    bucket.record_success()
+    assert bucket.rate == pytest.approx(1.5)
+    bucket.record_success()
+    assert bucket.rate == pytest.approx(1.5 + 0.5 / 1.5)
+
+    for _ in range(100):
+        bucket.record_success()
+    assert bucket.rate == 4.0
+    assert bucket.stats()["successes"] == 102
+
+
+def test_acquire_refuses_slots_past_the_deadline():
+    clock = Clock()
+    bucket = limiter(clock, rate=0.5, burst=1.0)
+
+    assert bucket.acquire(clock.now + 1)
+    assert not bucket.acquire(clock.now + 1)
+
+
+@pytest.mark.parametrize("attempt, ceiling", [(0, 0.5), (1, 1.0), (2, 2.0), (3, 4.0), (6, 8.0), (20, 8.0)])
+def test_backoff_jitter_stays_within_the_capped_exponential(attempt, ceiling):
+    rng = random.Random(attempt)
+    delays = [backoff_delay(attempt, 0.5, 8.0, rng) for _ in range(500)]
+
+    assert all(0.0 <= delay <= ceiling for delay in delays)
+    # Full jitter spreads over the whole range
+    assert min(delays) < ceiling * 0.1 and max(delays) > ceiling * 0.9
+
+
+def test_backoff_is_reproducible_with_a_seeded_source():
+    assert backoff_delay(3, 0.5, 8.0, random.Random(7)) == backoff_delay(3, 0.5, 8.0, random.Random(7))
+
+
+@pytest.fixture
+def scraper(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(amazon_scraper.time, "monotonic", clock)
+    monkeypatch.setattr(Config, "AMAZON_FETCH_DEADLINE", 25.0)
+    monkeypatch.setattr(Config, "AMAZON_REPLY_RESERVE", 5.0)
+    monkeypatch.setattr(Config, "AMAZON_MAX_ATTEMPTS", 4)
+    scraper = AmazonScraper(cache=ProductCache(store=None))
+    scraper.clock = clock
+    return scraper
+
+
+def test_fetch_deadline_outside_an_update(scraper):
+    assert scraper._fetch_deadline() == scraper.clock.now + 25.0
+
+
+def test_fetch_deadline_leaves_time_to_reply_before_the_update_is_due(scraper):
+    token = update_deadline.set(scraper.clock.now + 12.0)
+    try:
+        assert scraper._fetch_deadline() == scraper.clock.now + 7.0
+    finally:
+        update_deadline.reset(token)
+
+
+def test_fetch_deadline_keeps_the_fetch_limit_when_the_update_has_longer(scraper):
+    token = update_deadline.set(scraper.clock.now + 100.0)
+    try:
+        assert scraper._fetch_deadline() == scraper.clock.now + 25.0
+    finally:
+        update_deadline.reset(token)
+
+
+@pytest.mark.parametrize("status, retry_after, expected", [
+    (503, {"Retry-After": "7"}, 7.0),
+    (429, {}, None),
+    (503, {"Retry-After": "Wed, 21 Oct 2026 07:28:00 GMT"}, None),
+])
+def test_throttle_statuses_raise_with_retry_after(scraper, status, retry_after, expected):
+    with pytest.raises(AmazonThrottled) as raised:
+        scraper._check_throttled(status, retry_after)
+    assert raised.value.retry_after == expected
+
+
+def test_other_statuses_are_not_throttles(scraper):
+    scraper._check_throttled(200, {})
+    scraper._check_throttled(404, {})
+
+
+def test_throttled_retry_waits_at_least_retry_after_and_slows_the_domain(scraper, monkeypatch):
+    monkeypatch.setattr(amazon_scraper, "backoff_delay", lambda attempt, base, cap: 0.1)
+    bucket = limiter(scraper.clock)
+
+    delay = scraper._retry_delay(bucket, AmazonThrottled("HTTP 503", retry_after=3), 0, scraper.clock.now + 20)
+
+    assert delay == 3
+    assert bucket.rate == 1.0
+    assert bucket.stats()["throttles"] == 1
+
+
+def test_no_retry_that_would_end_past_the_deadline(scraper, monkeypatch):
+    monkeypatch.setattr(amazon_scraper, "backoff_delay", lambda attempt, base, cap: 2.0)
+    bucket = limiter(scraper.clock)
+    error = requests.ConnectionError("reset")
+
+    assert scraper._retry_delay(bucket, error, 0, scraper.clock.now + 3) == 2.0
+    assert scraper._retry_delay(bucket, error, 0, scraper.clock.now + 2) is None
+    # Nor past the attempt limit
+    assert scraper._retry_delay(bucket, error, 3, scraper.clock.now + 100) is None
+
+
+def test_client_errors_are_final(scraper):
+    response = requests.Response()
+    response.status_code = 404
+    error = requests.HTTPError("not found", response=response)
+
+    assert scraper._retry_delay(limiter(scraper.clock), error, 0, scraper.clock.now + 100) is None
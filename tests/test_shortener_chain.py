@@ -0,0 +1,226 @@
+import time
+import asyncio
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from http_client import close_async_client
+from local_shortener import LocalShortener
+from persistent_memo import PersistentMemo
+from shortener_providers import CLOSED, HALF_OPEN, OPEN, HTTPShortenerProvider, ProviderHealth
+from url_shortener import URLShortener
+
+LONG_URL = "https://www.amazon.in/dp/B07PR1CL3S?tag=budgetlooks08-21"
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Shortener APIs on one local server, the path picks the behaviour"""
+
+    def do_GET(self):
+        path = urllib.parse.urlparse(self.path).path.strip('/')
+        behaviour = self.server.behaviours.get(path, 'good')
+        self.server.requests.append(path)
+
+        if behaviour == 'slow':
+            time.sleep(self.server.slow_seconds)
+        if behaviour == 'fail':
+            self._answer(500, "upstream error")
+        elif behaviour == 'elsewhere':
+            # A well-formed short link, but not on the provider's own host
+            self._answer(200, "https://evil.example/abc")
+        else:
+            host, port = self.server.server_address
+            self._answer(200, f"http://{host}:{port}/s/{path}")
+
+    def _answer(self, status, body):
+        data = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        try:
+            self.wfile.write(data)
+        except OSError:
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stand_in():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    server.daemon_threads = True
+    server.block_on_close = False
+    server.behaviours = {}
+    server.requests = []
+    server.slow_seconds = 1.0
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def provider(server, name, behaviour, timeout=5.0, **health):
+    server.behaviours[name] = behaviour
+    host, port = server.server_address
+    return HTTPShortenerProvider(name, f"http://{host}:{port}/{name}", timeout,
+                                 health=ProviderHealth(**{"min_samples": 5, **health}))
+
+
+def warm(provider, latency, count=10):
+    """Give a provider a latency history, which sets its hedge delay"""
+    for _ in range(count):
+        provider.health.record(latency, True)
+
+
+@pytest.fixture
+def memo(tmp_path):
+    memo = PersistentMemo(str(tmp_path / "short_urls.db"), table="short_urls", flush_interval=60)
+    yield memo
+    memo.close()
+
+
+def shorten(shortener, url=LONG_URL):
+    async def run():
+        try:
+            start = time.perf_counter()
+            result = await shortener.shorten_url_async(url)
+            return result, time.perf_counter() - start
+        finally:
+            await close_async_client()
+    return asyncio.run(run())
+
+
+def test_first_healthy_provider_wins_without_hedging(stand_in, memo):
+    first = provider(stand_in, "first", "good")
+    second = provider(stand_in, "second", "good")
+    shortener = URLShortener(memo=memo, providers=[first, second])
+
+    result, _ = shorten(shortener)
+
+    assert result.endswith("/s/first")
+    assert first.wins == 1 and first.hedges == 0
+    assert stand_in.requests == ["first"]
+    # Remembered, the next call asks nobody
+    assert shorten(shortener)[0] == result
+    assert stand_in.requests == ["first"]
+
+
+def test_slow_provider_is_hedged_after_its_p95(stand_in, memo):
+    slow = provider(stand_in, "slow", "slow")
+    warm(slow, 0.1)
+    fast = provider(stand_in, "fast", "good")
+    shortener = URLShortener(memo=memo, providers=[slow, fast])
+
+    result, elapsed = shorten(shortener)
+
+    assert result.endswith("/s/fast")
+    assert slow.hedge_delay() == pytest.approx(0.1)
+    assert 0.1 <= elapsed < 1.0
+    assert slow.hedges == 1 and fast.wins == 1
+    # The lost race was cancelled, it says nothing about the slow provider's health
+    assert slow.health.calls == 10
+    assert slow.health.state == CLOSED
+
+
+def test_failing_provider_hands_over_without_waiting_for_the_hedge(stand_in, memo):
+    failing = provider(stand_in, "failing", "fail")
+    warm(failing, 2.0)
+    good = provider(stand_in, "good", "good")
+    shortener = URLShortener(memo=memo, providers=[failing, good])
+
+    result, elapsed = shorten(shortener)
+
+    assert result.endswith("/s/good")
+    assert elapsed < 1.0
+    assert failing.hedges == 0
+    assert failing.health.failures == 1
+
+
+def test_answers_on_another_host_are_rejected(stand_in, memo):
+    elsewhere = provider(stand_in, "elsewhere", "elsewhere")
+    good = provider(stand_in, "good", "good")
+    shortener = URLShortener(memo=memo, providers=[elsewhere, good])
+
+    result, _ = shorten(shortener)
+
+    assert result.endswith("/s/good")
+    assert elsewhere.health.failures == 1
+
+
+def test_every_provider_failing_returns_the_long_url_unremembered(stand_in, memo):
+    shortener = URLShortener(memo=memo, providers=[provider(stand_in, "a", "fail"), provider(stand_in, "b", "fail")])
+
+    result, _ = shorten(shortener)
+
+    assert result == LONG_URL
+    assert memo.peek(LONG_URL) is None
+    assert stand_in.requests == ["a", "b"]
+
+
+def test_breaker_opens_skips_the_provider_and_closes_after_a_good_trial(stand_in, memo):
+    flaky = provider(stand_in, "flaky", "fail", failure_threshold=2, cooldown=0.2)
+    backup = provider(stand_in, "backup", "good")
+    shortener = URLShortener(memo=memo, providers=[flaky, backup])
+
+    for index in range(2):
+        shorten(shortener, f"{LONG_URL}&n={index}")
+    assert flaky.health.state == OPEN
+    assert flaky.health.circuit_opens == 1
+
+    # Open: the provider is not asked at all
+    stand_in.requests.clear()
+    assert shorten(shortener, f"{LONG_URL}&n=open")[0].endswith("/s/backup")
+    assert stand_in.requests == ["backup"]
+    assert flaky.health.rejected == 1
+
+    # After the cooldown one trial goes through and closes the breaker again
+    time.sleep(0.25)
+    stand_in.behaviours["flaky"] = "good"
+    assert shorten(shortener, f"{LONG_URL}&n=trial")[0].endswith("/s/flaky")
+    assert flaky.health.state == CLOSED
+
+
+def test_failed_half_open_trial_opens_the_breaker_again():
+    health = ProviderHealth(failure_threshold=1, cooldown=0.05)
+    health.record(0.1, False)
+    assert not health.allow_request()
+
+    time.sleep(0.06)
+    assert health.allow_request()
+    assert health.state == HALF_OPEN
+    # Only one trial at a time
+    assert not health.allow_request()
+
+    health.record(0.1, False)
+    assert health.state == OPEN
+    assert health.circuit_opens == 2
+
+
+def test_sync_chain_skips_failures_and_foreign_hosts(stand_in, memo):
+    shortener = URLShortener(memo=memo, providers=[
+        provider(stand_in, "failing", "fail"),
+        provider(stand_in, "elsewhere", "elsewhere"),
+        provider(stand_in, "good", "good"),
+    ])
+
+    assert shortener.shorten_url(LONG_URL).endswith("/s/good")
+    assert stand_in.requests == ["failing", "elsewhere", "good"]
+
+
+def test_local_memory_hits_are_not_latency_samples(tmp_path):
+    local = LocalShortener(str(tmp_path / "links.db"), "https://bot.example/r")
+    local.shorten(LONG_URL)
+
+    async def hits():
+        for _ in range(20):
+            await local.shorten_async(LONG_URL)
+    asyncio.run(hits())
+
+    assert local.health.calls == 21
+    # One real database write is below min_samples, memory hits add no samples
+    assert local.health.latency_quantile(0.95) is None
@@ -1,56 +1,141 @@
-import requests
+import time
+import asyncio
 import logging
-from typing import Optional
+from typing import Any, Dict, List, Optional
+from config import Config
+from log_setup import log_event
+from metrics import STAGE_SECONDS, record_result
+from persistent_memo import PersistentMemo
+from shortener_providers import build_providers
+from singleflight import AsyncSingleFlight, SingleFlight
 
 logger = logging.getLogger(__name__)
 
 class URLShortener:
-    def __init__(self):
-        self.tinyurl_api = "http://tinyurl.com/api-create.php"
+    def __init__(self, memo: Optional[PersistentMemo] = None, providers: Optional[List[Any]] = None):
+        self.providers = providers if providers is not None else build_providers(Config.SHORTENER_PROVIDERS)
+        self.memo = memo if memo is not None else PersistentMemo(
+            Config.SHORT_URL_DB_PATH,
+            table="short_urls",
+            front_cache_size=Config.SHORT_URL_CACHE_SIZE
+        )
+        self._inflight = SingleFlight()
+        self._inflight_async = AsyncSingleFlight()
     
     def shorten_url(self, url: str) -> str:
-        """Shorten URL using TinyURL service"""
-        try:
-            params = {'url': url}
-            
-            response = requests.get(self.tinyurl_api, params=params, timeout=10)
-            response.raise_for_status()
-            
-            shortened_url = response.text.strip()
-            
-            if shortened_url.startswith('http') and 'tinyurl.com' in shortened_url:
-                logger.info(f"URL shortened: {url} -> {shortened_url}")
+        """Shorten URL, reusing earlier results for the same long URL"""
+        shortened_url = self._get_memoized(url)
+        if shortened_url:
+            return shortened_url
+        
+        # Concurrent requests for the same affiliate URL share one shortener call
+        return self._inflight.do(url, self._shorten_and_remember, url)
+    
+    async def shorten_url_async(self, url: str) -> str:
+        """Async variant of shorten_url for use directly from handlers"""
+        # A memo miss reads SQLite, on the memo's thread rather than the loop
+        shortened_url = self._log_memo_hit(url, await self.memo.get_async(url))
+        if shortened_url:
+            return shortened_url
+        
+        # Concurrent requests for the same affiliate URL share one shortener call
+        return await self._inflight_async.do(url, self._shorten_and_remember_async, url)
+    
+    def memoized(self, url: str) -> Optional[str]:
+        """An earlier short link for the URL if it is in memory, never calls a shortener or reads the disk"""
+        return self.memo.peek(url)
+    
+    def inflight_stats(self) -> Dict[str, Dict[str, int]]:
+        """Counters for requests that shared an in-flight shortener call"""
+        return {"sync": self._inflight.stats(), "async": self._inflight_async.stats()}
+    
+    def _shorten_and_remember(self, url: str) -> str:
+        start = time.perf_counter()
+        shortened_url = self._shorten_remote(url)
+        self._record_shorten(start, url, shortened_url)
+        return self._remember(url, shortened_url)
+    
+    async def _shorten_and_remember_async(self, url: str) -> str:
+        start = time.perf_counter()
+        shortened_url = await self._shorten_remote_async(url)
+        self._record_shorten(start, url, shortened_url)
+        return self._remember(url, shortened_url)
+    
+    def _record_shorten(self, start: float, url: str, shortened_url: str) -> None:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage='shorten')
+        record_result('shorten', 'success' if shortened_url != url else 'failure')
+    
+    def _get_memoized(self, url: str) -> Optional[str]:
+        return self._log_memo_hit(url, self.memo.get(url))
+    
+    def _log_memo_hit(self, url: str, shortened_url: Optional[str]) -> Optional[str]:
+        if shortened_url:
+            logger.info("URL shortened (memo): %s -> %s", url, shortened_url, extra=log_event('short_url_memo_hit'))
+        return shortened_url
+    
+    def _remember(self, url: str, shortened_url: str) -> str:
+        # Only remember real short links, the original URL means every shortener failed
+        if shortened_url != url:
+            self.memo.put(url, shortened_url)
+        return shortened_url
+    
+    def _shorten_remote(self, url: str) -> str:
+        """Try each provider in order, skipping those with an open circuit"""
+        for provider in self.providers:
+            if not provider.health.allow_request():
+                continue
+            shortened_url = provider.shorten(url)
+            if shortened_url:
+                provider.wins += 1
                 return shortened_url
-            else:
-                logger.warning(f"TinyURL failed: {shortened_url}")
-                return self._fallback_shortener(url)
-                
-        except requests.RequestException as e:
-            logger.error(f"TinyURL request error: {e}")
-            return self._fallback_shortener(url)
-        except Exception as e:
-            logger.error(f"Error shortening URL: {e}")
-            return url
-    
-    def _fallback_shortener(self, url: str) -> str:
-        """Fallback shortener using is.gd"""
+        
+        logger.warning("All shorteners failed, using original URL: %s", url, extra=log_event('shortener_fallback'))
+        return url
+    
+    async def _shorten_remote_async(self, url: str) -> str:
+        """Ask providers in order, hedging to the next one once the current one is slow.
+        
+        A provider that has not answered within its recent p95 latency gets
+        company from the next healthy provider, and the first real short link
+        wins. A provider that fails hands over straight away.
+        """
+        remaining = iter(self.providers)
+        pending = {}
+        
+        def launch_next():
+            for provider in remaining:
+                if provider.health.allow_request():
+                    pending[asyncio.ensure_future(provider.shorten_async(url))] = provider
+                    return provider
+            return None
+        
+        current = launch_next()
         try:
-            api_url = "https://is.gd/create.php"
-            params = {
-                'format': 'simple',
-                'url': url
-            }
-            
-            response = requests.get(api_url, params=params, timeout=5)
-            response.raise_for_status()
-            
-            shortened_url = response.text.strip()
-            
-            if shortened_url.startswith('http') and 'is.gd' in shortened_url:
-                return shortened_url
-            else:
-                return url
+            while pending:
+                hedge_delay = current.hedge_delay() if current else None
+                done, _ = await asyncio.wait(list(pending), timeout=hedge_delay, return_when=asyncio.FIRST_COMPLETED)
                 
-        except Exception as e:
-            logger.error(f"Fallback shortener error: {e}")
-            return url
+                for task in done:
+                    provider = pending.pop(task)
+                    shortened_url = task.result()
+                    if shortened_url:
+                        provider.wins += 1
+                        return shortened_url
+                
+                # After a failure hand over, after a timeout race the next provider against the slow one.
+                # With nothing left to launch, wait for whoever is still running
+                launched = launch_next()
+                if launched and current and not done:
+                    current.hedges += 1
+                    logger.info("%s is slow, hedging to %s", current.name, launched.name, extra=log_event('shortener_hedge'))
+                current = launched
+        finally:
+            for task in pending:
+                task.cancel()
+        
+        logger.warning("All shorteners failed, using original URL: %s", url, extra=log_event('shortener_fallback'))
+        return url
+    
+    def provider_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Latency, error and circuit state per shortener provider"""
+        return {provider.name: provider.stats() for provider in self.providers}